@@ -0,0 +1,180 @@
+"""
+管理用APIエンドポイント（Cloud Schedulerからの定期実行用）
+"""
+import time
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Query
+
+from app.services.cache import cache_service, MAINTENANCE_PREFIXES
+from app.services.cache_warmup_service import get_cache_warmup_service
+from app.services.firestore_service import get_firestore_service
+from app.config import get_settings
+
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.post(
+    "/cache/warm",
+    summary="キャッシュをウォームアップ",
+    description="アクセスの多いジオセルと大都市駅の駅検索・店舗候補を事前計算します（17時の提案生成前に実行）"
+)
+async def warm_cache(
+    max_cells: Optional[int] = Query(None, ge=1, le=200, description="ウォームアップする人気ジオセル数"),
+    include_major_stations: bool = Query(True, description="大都市駅を含めるか")
+):
+    """キャッシュウォームアップエンドポイント"""
+
+    try:
+        print(f"🔥 Starting cache warm-up...")
+
+        warmup_service = get_cache_warmup_service()
+        summary = await warmup_service.warm_up(max_cells, include_major_stations)
+
+        return {
+            "success": True,
+            "message": f"{summary['cells_warmed']}セルのキャッシュをウォームアップしました",
+            **summary,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    except Exception as e:
+        print(f"❌ Error in cache warm-up: {str(e)}")
+        return {
+            "success": False,
+            "message": f"キャッシュウォームアップ中にエラーが発生しました: {str(e)}",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }
+
+
+@router.post(
+    "/cache/clear",
+    summary="キャッシュを段階的にクリア",
+    description="プレフィックスごとにSCANで少しずつキーを走査し、UNLINKで非同期削除します（定期実行用）"
+)
+async def clear_cache(
+    prefix: Optional[List[str]] = Query(None, description="削除対象のプレフィックス（未指定の場合は既定のキャッシュ全体）"),
+    batch_size: Optional[int] = Query(None, ge=10, le=5000, description="SCAN 1回あたりの件数目安"),
+    max_batches: Optional[int] = Query(None, ge=1, description="プレフィックスごとの最大バッチ数（超えた場合は next_cursor から再開）"),
+    cursor: int = Query(0, ge=0, description="再開用カーソル（プレフィックスを1つ指定した場合のみ有効）"),
+    dry_run: bool = Query(False, description="削除せず対象件数のみ確認")
+):
+    """キャッシュメンテナンスエンドポイント"""
+
+    try:
+        start_time = time.time()
+        settings = get_settings()
+        prefixes = prefix or MAINTENANCE_PREFIXES
+        batch_size = batch_size or settings.CACHE_MAINTENANCE_BATCH_SIZE
+
+        print(f"🧹 Starting cache maintenance (dry_run={dry_run}): {prefixes}")
+
+        results = []
+        for target_prefix in prefixes:
+            result = await cache_service.clear_by_prefix(
+                target_prefix,
+                batch_size=batch_size,
+                max_batches=max_batches,
+                cursor=cursor if len(prefixes) == 1 else 0,
+                dry_run=dry_run
+            )
+            results.append(result)
+            print(f"   {target_prefix}: scanned={result['scanned']}, deleted={result['deleted']}, "
+                  f"completed={result['completed']}")
+
+        total_scanned = sum(r["scanned"] for r in results)
+        total_deleted = sum(r["deleted"] for r in results)
+
+        return {
+            "success": all("error" not in r for r in results),
+            "message": (
+                f"{total_scanned}件のキーが対象です（dry run）" if dry_run
+                else f"{total_deleted}件のキャッシュを削除しました"
+            ),
+            "dry_run": dry_run,
+            "total_scanned": total_scanned,
+            "total_deleted": total_deleted,
+            "completed": all(r["completed"] for r in results),
+            "prefixes": results,
+            "processing_time_ms": int((time.time() - start_time) * 1000),
+            "timestamp": datetime.now().isoformat()
+        }
+
+    except Exception as e:
+        print(f"❌ Error in cache maintenance: {str(e)}")
+        return {
+            "success": False,
+            "message": f"キャッシュメンテナンス中にエラーが発生しました: {str(e)}",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }
+
+
+@router.post(
+    "/locations/backfill-geohash",
+    summary="位置情報のgeohashを補完",
+    description="geohashが未設定のlocationsドキュメントにgeohashを付与します（位置フィルター用）"
+)
+async def backfill_location_geohashes(
+    page_size: int = Query(300, ge=10, le=500, description="1ページあたりの件数"),
+    dry_run: bool = Query(False, description="更新せず対象件数のみ確認")
+):
+    """geohash補完エンドポイント"""
+
+    try:
+        start_time = time.time()
+        firestore_service = get_firestore_service()
+        stats = await firestore_service.backfill_location_geohashes(page_size, dry_run)
+
+        return {
+            "success": True,
+            "message": f"{stats['updated']}件の位置情報にgeohashを付与しました" + ("（dry run）" if dry_run else ""),
+            "dry_run": dry_run,
+            **stats,
+            "processing_time_ms": int((time.time() - start_time) * 1000),
+            "timestamp": datetime.now().isoformat()
+        }
+
+    except Exception as e:
+        print(f"❌ Error in geohash backfill: {str(e)}")
+        return {
+            "success": False,
+            "message": f"geohash補完中にエラーが発生しました: {str(e)}",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }
+
+
+@router.post(
+    "/firestore-cache/invalidate",
+    summary="ユーザーのFirestoreキャッシュを無効化",
+    description="ユーザー情報・友人リスト・位置情報のリードスルーキャッシュを削除します（外部更新の即時反映用）"
+)
+async def invalidate_firestore_cache(
+    user_id: List[str] = Query(..., description="対象ユーザーID（複数指定可）"),
+    collection: Optional[List[str]] = Query(None, description="対象（users / friends / locations、未指定の場合は全て）")
+):
+    """Firestoreキャッシュ無効化エンドポイント"""
+
+    try:
+        firestore_service = get_firestore_service()
+        for uid in user_id:
+            await firestore_service.invalidate_user_cache(uid, collection)
+
+        return {
+            "success": True,
+            "message": f"{len(user_id)}ユーザーのキャッシュを無効化しました",
+            "user_ids": user_id,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    except Exception as e:
+        print(f"❌ Error invalidating firestore cache: {str(e)}")
+        return {
+            "success": False,
+            "message": f"キャッシュ無効化中にエラーが発生しました: {str(e)}",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }
@@ -5,7 +5,7 @@ import asyncio
 import time
 import uuid
 from typing import List, Dict, Any, Optional, Tuple
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query, Response, Header
 from datetime import datetime
 
 from app.models import (
@@ -16,6 +16,8 @@ from app.models import (
     LocationData,
     ProposalGenerationRequest,
     ProposalGenerationResponse,
+    ProposalJobResponse,
+    ProposalShardGroupResponse,
     UserResponseStatus
 )
 from app.services.activity_recommendation_service import ActivityRecommendationService
@@ -23,7 +25,10 @@ from app.services.restaurant_recommendation_service import RestaurantRecommendat
 from app.services.gemini_research import GeminiResearchAgent
 from app.services.google_places import GooglePlacesService
 from app.services.proposal_generation_service import get_proposal_generation_service
-from app.services.firestore_service import get_firestore_service
+from app.services.proposal_job_service import get_proposal_job_service
+from app.services.firestore_service import get_firestore_service, USER_PROPOSAL_SUMMARY_FIELDS
+from app.services.cache import cache_service
+from app.services.request_hashing import build_recommendation_request_hash, get_geocell
 from app.config import get_settings
 
 
@@ -60,6 +65,16 @@ async def get_station_search_status():
         }
 
 
+@router.get("/debug/cache-stats")
+async def get_cache_stats():
+    """キャッシュ（コーデック・Firestoreドキュメントキャッシュ含む）の統計情報をデバッグ用に確認"""
+    return {
+        "cache": cache_service.get_stats(),
+        "firestore_documents": get_firestore_service().get_document_cache_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
 @router.get("/debug/restaurant-search-status")
 async def get_restaurant_search_status():
     """店舗検索サービスの状態をデバッグ用に確認"""
@@ -212,6 +227,17 @@ async def test_japanese_keyword_search():
         }
 
 
+def _set_cache_headers(http_response: Response, cache_status: str, request_hash: str):
+    """推奨結果キャッシュの状態をレスポンスヘッダーに設定"""
+    http_response.headers["X-Cache"] = cache_status
+    http_response.headers["X-Cache-Key"] = request_hash
+
+
+def _track_request_location(location: LocationData):
+    """キャッシュウォームアップ対象の選定用にジオセルへのアクセスを記録（キャッシュキーと同じ精度）"""
+    cache_service.track_geocell_access(get_geocell(location.latitude, location.longitude))
+
+
 @router.post(
     "/activity-recommendations",
     response_model=ActivityRecommendationResponse,
@@ -219,11 +245,29 @@ async def test_japanese_keyword_search():
     description="位置情報とグループ情報を基に最適なアクティビティを推奨します"
 )
 async def get_activity_recommendations(
-    request: ActivityRecommendationRequest
+    request: ActivityRecommendationRequest,
+    http_response: Response
 ) -> ActivityRecommendationResponse:
     """アクティビティ推奨エンドポイント"""
     
-    return await activity_service.generate_recommendations(request)
+    start_time = time.time()
+    request_hash = build_recommendation_request_hash(request)
+    _track_request_location(request.user_location)
+    
+    async def _generate() -> dict:
+        result = await activity_service.generate_recommendations(request)
+        return result.model_dump(mode="json")
+    
+    # 同じジオセル・条件・時間帯の結果はキャッシュから返す（Places・Geminiを呼ばない）
+    result, cache_status = await cache_service.get_or_compute_recommendation_result(request_hash, _generate)
+    _set_cache_headers(http_response, cache_status, request_hash)
+    
+    response = ActivityRecommendationResponse.model_validate(result)
+    if cache_status in ("HIT", "STALE"):
+        response.user_location = request.user_location
+        response.processing_time_ms = int((time.time() - start_time) * 1000)
+    
+    return response
 
 
 @router.post(
@@ -233,11 +277,16 @@ async def get_activity_recommendations(
     description="位置情報とユーザーの希望を基に気軽に行ける店舗を2つ推奨します"
 )
 async def get_restaurant_recommendations(
-    request: RestaurantRecommendationRequest
+    request: RestaurantRecommendationRequest,
+    http_response: Response
 ) -> RestaurantRecommendationResponse:
     """カジュアル志向の友人向け店舗推奨エンドポイント"""
     
     try:
+        start_time = time.time()
+        request_hash = build_recommendation_request_hash(request)
+        _track_request_location(request.user_location)
+        
         print(f"🍻 Casual restaurant recommendation request received")
         print(f"   Location: ({request.user_location.latitude}, {request.user_location.longitude})")
         print(f"   Activities: {[a.value for a in request.activity_type]}")
@@ -248,27 +297,37 @@ async def get_restaurant_recommendations(
         print(f"   Prefer chain stores: {request.prefer_chain_stores}")
         print(f"   Scene type: {request.scene_type}")
         
-        # カジュアル志向の新メソッドを使用
-        response = await restaurant_service.recommend_restaurants_async(
-            user_location=request.user_location,
-            activity_type=request.activity_type,
-            mood=request.mood,
-            group_size=request.group_size,
-            time_of_day=request.time_of_day,
-            scene_type=request.scene_type,
-            casual_level=request.casual_level.value if request.casual_level else "casual",
-            max_price_per_person=request.max_price_per_person,
-            prefer_chain_stores=request.prefer_chain_stores,
-            exclude_high_end=request.exclude_high_end,
-            # その他のパラメータ
-            station_search_radius_km=request.station_search_radius_km,
-            restaurant_search_radius_km=request.restaurant_search_radius_km,
-            max_stations=request.max_stations,
-            max_restaurants_per_station=request.max_restaurants_per_station,
-            min_rating=request.min_rating
-        )
+        async def _generate() -> dict:
+            # カジュアル志向の新メソッドを使用
+            result = await restaurant_service.recommend_restaurants_async(
+                user_location=request.user_location,
+                activity_type=request.activity_type,
+                mood=request.mood,
+                group_size=request.group_size,
+                time_of_day=request.time_of_day,
+                scene_type=request.scene_type,
+                casual_level=request.casual_level.value if request.casual_level else "casual",
+                max_price_per_person=request.max_price_per_person,
+                prefer_chain_stores=request.prefer_chain_stores,
+                exclude_high_end=request.exclude_high_end,
+                # その他のパラメータ
+                station_search_radius_km=request.station_search_radius_km,
+                restaurant_search_radius_km=request.restaurant_search_radius_km,
+                max_stations=request.max_stations,
+                max_restaurants_per_station=request.max_restaurants_per_station,
+                min_rating=request.min_rating
+            )
+            return result.model_dump(mode="json")
+        
+        # 同じジオセル・条件・時間帯の結果はキャッシュから返す（Places・Geminiを呼ばない）
+        result, cache_status = await cache_service.get_or_compute_recommendation_result(request_hash, _generate)
+        _set_cache_headers(http_response, cache_status, request_hash)
         
-        print(f"🎯 Casual restaurant recommendation response: success={response.success}")
+        response = RestaurantRecommendationResponse.model_validate(result)
+        if cache_status in ("HIT", "STALE"):
+            response.search_info.processing_time_ms = int((time.time() - start_time) * 1000)
+        
+        print(f"🎯 Casual restaurant recommendation response: success={response.success} (cache: {cache_status})")
         if response.success:
             print(f"   Recommended {len(response.recommendations)} casual restaurants")
             print(f"   Processing time: {response.search_info.processing_time_ms}ms")
@@ -320,7 +379,8 @@ async def health_check():
     description="アクティブユーザーまたは指定ユーザーに対してAI提案を生成し、Firestoreに保存します"
 )
 async def generate_ai_proposals(
-    request: ProposalGenerationRequest
+    request: ProposalGenerationRequest,
+    schedule_time: Optional[str] = Header(None, alias="X-CloudScheduler-ScheduleTime")
 ) -> ProposalGenerationResponse:
     """AI提案生成エンドポイント"""
     
@@ -330,6 +390,14 @@ async def generate_ai_proposals(
         print(f"   Max proposals per user: {request.max_proposals_per_user}")
         print(f"   Force generation: {request.force_generation}")
         
+        # 実行ID未指定の場合はジョブと同じく実行枠（スケジューラーの予定時刻、なければ日付）＋リクエスト内容から決め、
+        # 同じ枠の再送は続きから処理する
+        if not request.run_id:
+            request = request.model_copy(update={
+                "run_id": get_proposal_job_service().build_job_id(request, schedule_time)
+            })
+        print(f"   Run ID: {request.run_id}")
+        
         proposal_service = get_proposal_generation_service()
         response = await proposal_service.generate_ai_proposals(request)
         
@@ -355,6 +423,79 @@ async def generate_ai_proposals(
         )
 
 
+@router.post(
+    "/generate-ai-proposals/jobs",
+    response_model=ProposalJobResponse,
+    status_code=202,
+    summary="AI提案生成ジョブを投入",
+    description="AI提案生成をバックグラウンドで開始し、ジョブIDをすぐに返します。"
+                "同じ冪等キー（未指定の場合は同じスケジュール実行枠、またはスケジューラー以外からは同日の同一内容のリクエスト）"
+                "の再送では既存のジョブを返します"
+)
+async def submit_ai_proposal_job(
+    request: ProposalGenerationRequest,
+    schedule_time: Optional[str] = Header(None, alias="X-CloudScheduler-ScheduleTime")
+) -> ProposalJobResponse:
+    """AI提案生成ジョブ投入エンドポイント"""
+
+    try:
+        print(f"🤖 AI proposal generation job request received")
+        print(f"   Target users: {request.target_user_ids if request.target_user_ids else 'All active users'}")
+        print(f"   Idempotency key: {request.idempotency_key}")
+        if schedule_time:
+            print(f"   Schedule time: {schedule_time}")
+        if request.shard_count:
+            print(f"   Shard: {request.shard_index}/{request.shard_count}")
+
+        job_service = get_proposal_job_service()
+        return await job_service.submit(request, schedule_time)
+
+    except Exception as e:
+        print(f"❌ Error submitting AI proposal generation job: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"提案生成ジョブの投入中にエラーが発生しました: {str(e)}")
+
+
+@router.get(
+    "/jobs/{job_id}",
+    response_model=ProposalJobResponse,
+    summary="AI提案生成ジョブの状態を取得",
+    description="ジョブの状態（queued / running / completed / failed）と進捗、完了時は生成結果を返します"
+)
+async def get_ai_proposal_job(job_id: str) -> ProposalJobResponse:
+    """AI提案生成ジョブ状態取得エンドポイント"""
+
+    try:
+        job = await get_proposal_job_service().get_job(job_id)
+    except Exception as e:
+        print(f"❌ Error getting AI proposal generation job: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"ジョブの取得中にエラーが発生しました: {str(e)}")
+
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"ジョブが見つかりません: {job_id}")
+    return job
+
+
+@router.get(
+    "/generate-ai-proposals/shard-groups/{shard_group}",
+    response_model=ProposalShardGroupResponse,
+    summary="シャード分割したAI提案生成の完了状況を取得",
+    description="同じシャードグループ（同日・同一条件でshard_indexだけが異なるジョブ）の"
+                "シャードごとの状態と、対象ユーザー数・生成件数等の合計を返します"
+)
+async def get_ai_proposal_shard_group(shard_group: str) -> ProposalShardGroupResponse:
+    """シャードグループ集計エンドポイント"""
+
+    try:
+        group = await get_proposal_job_service().get_shard_group(shard_group)
+    except Exception as e:
+        print(f"❌ Error getting AI proposal shard group: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"シャードグループの取得中にエラーが発生しました: {str(e)}")
+
+    if group is None:
+        raise HTTPException(status_code=404, detail=f"シャードグループが見つかりません: {shard_group}")
+    return group
+
+
 @router.post(
     "/respond-to-proposal/{proposal_id}/{user_id}",
     summary="提案に応答",
@@ -407,21 +548,40 @@ async def respond_to_proposal(
 )
 async def get_user_proposals(
     user_id: str,
-    limit: int = Query(10, ge=1, le=50, description="取得件数")
+    limit: int = Query(10, ge=1, le=50, description="取得件数"),
+    cursor: Optional[str] = Query(None, description="前回レスポンスのnext_cursor（続きを取得）"),
+    view: str = Query("full", pattern="^(full|summary)$", description="full: 全フィールド / summary: 一覧表示用フィールドのみ"),
+    fields: Optional[str] = Query(None, description="取得するフィールド（カンマ区切り、viewより優先）"),
+    updated_since: Optional[datetime] = Query(None, description="この日時以降に更新された提案のみ取得（前回のserver_timeを指定）")
 ):
     """ユーザー提案取得エンドポイント"""
     
     try:
-        print(f"📋 Getting proposals for user: {user_id} (limit: {limit})")
+        print(f"📋 Getting proposals for user: {user_id} (limit: {limit}, cursor: {cursor}, view: {view})")
+        
+        if fields:
+            selected_fields = [field.strip() for field in fields.split(",") if field.strip()]
+        elif view == "summary":
+            selected_fields = USER_PROPOSAL_SUMMARY_FIELDS
+        else:
+            selected_fields = None
         
+        server_time = datetime.now()
         firestore_service = get_firestore_service()
-        proposals = await firestore_service.get_user_proposals(user_id, limit)
+        proposals, next_cursor = await firestore_service.get_user_proposals(
+            user_id, limit,
+            start_after=cursor,
+            fields=selected_fields,
+            updated_since=updated_since
+        )
         
         return {
             "success": True,
             "user_id": user_id,
             "proposals": proposals,
             "count": len(proposals),
+            "next_cursor": next_cursor,
+            "server_time": server_time.isoformat(),
             "timestamp": datetime.now().isoformat()
         }
         
@@ -432,6 +592,7 @@ async def get_user_proposals(
             "user_id": user_id,
             "proposals": [],
             "count": 0,
+            "next_cursor": None,
             "error": str(e),
             "timestamp": datetime.now().isoformat()
         }
@@ -478,19 +639,23 @@ async def get_proposal_details(proposal_id: str):
     summary="期限切れ提案をクリーンアップ",
     description="期限切れの提案をクリーンアップします（定期実行用）"
 )
-async def cleanup_expired_proposals():
+async def cleanup_expired_proposals(
+    page_size: Optional[int] = Query(None, ge=1, le=500, description="1ページあたりの提案数"),
+    max_pages: Optional[int] = Query(None, ge=1, description="今回処理する最大ページ数（残りは次回チェックポイントから再開）"),
+    resume: bool = Query(True, description="前回中断したチェックポイントから再開するか")
+):
     """期限切れ提案クリーンアップエンドポイント"""
     
     try:
         print(f"🧹 Starting expired proposals cleanup...")
         
         firestore_service = get_firestore_service()
-        cleanup_count = await firestore_service.cleanup_expired_proposals()
+        result = await firestore_service.cleanup_expired_proposals(page_size, max_pages, resume)
         
         return {
-            "success": True,
-            "message": f"{cleanup_count}件の期限切れ提案をクリーンアップしました",
-            "cleanup_count": cleanup_count,
+            "success": "error" not in result,
+            "message": f"{result['cleanup_count']}件の期限切れ提案をクリーンアップしました",
+            **result,
             "timestamp": datetime.now().isoformat()
         }
         
@@ -32,12 +32,83 @@ class Settings:
     
     # Redis設定
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"
     CACHE_TTL_SECONDS: int = int(os.getenv("CACHE_TTL_SECONDS", "3600"))
+    # soft TTL経過後もstaleな値を返しつつ再計算する猶予期間
+    CACHE_STALE_TTL_SECONDS: int = int(os.getenv("CACHE_STALE_TTL_SECONDS", "600"))
+    # 確率的早期再計算の強さ（0で無効）
+    CACHE_EARLY_REFRESH_BETA: float = float(os.getenv("CACHE_EARLY_REFRESH_BETA", "1.0"))
+    # Places検索結果のキャッシュ（駅は位置がほぼ変わらないため長め）
+    STATION_CACHE_TTL_SECONDS: int = int(os.getenv("STATION_CACHE_TTL_SECONDS", "86400"))
+    RESTAURANT_CACHE_TTL_SECONDS: int = int(os.getenv("RESTAURANT_CACHE_TTL_SECONDS", "10800"))
+    # 空の検索結果のネガティブキャッシュ（通常のキャッシュと同じキー単位、API障害時は記録しない）
+    NEGATIVE_CACHE_TTL_SECONDS: int = int(os.getenv("NEGATIVE_CACHE_TTL_SECONDS", "600"))
+    # 推奨結果全体のキャッシュ（位置はジオセル、時刻はバケットに丸めてキー化）
+    RECOMMENDATION_CACHE_TTL_SECONDS: int = int(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "1800"))
+    RECOMMENDATION_CACHE_GEOHASH_PRECISION: int = int(os.getenv("RECOMMENDATION_CACHE_GEOHASH_PRECISION", "7"))
+    RECOMMENDATION_CACHE_TIME_BUCKET_MINUTES: int = int(os.getenv("RECOMMENDATION_CACHE_TIME_BUCKET_MINUTES", "30"))
+    # アクセス数に基づくキャッシュウォームアップ（ジオセルはキャッシュキーと同じRECOMMENDATION_CACHE_GEOHASH_PRECISION）
+    POPULARITY_RETENTION_DAYS: int = int(os.getenv("POPULARITY_RETENTION_DAYS", "8"))
+    WARMUP_LOOKBACK_DAYS: int = int(os.getenv("WARMUP_LOOKBACK_DAYS", "7"))
+    WARMUP_MAX_CELLS: int = int(os.getenv("WARMUP_MAX_CELLS", "20"))
+    WARMUP_ACTIVITY_TYPES: List[str] = os.getenv("WARMUP_ACTIVITY_TYPES", "drink,cafe,food").split(",")
+    # "none" は時間帯未指定（提案生成と同じ条件）を表す
+    WARMUP_TIMES_OF_DAY: List[str] = os.getenv("WARMUP_TIMES_OF_DAY", "none,dinner").split(",")
+    # SCANによるキャッシュメンテナンス
+    CACHE_MAINTENANCE_BATCH_SIZE: int = int(os.getenv("CACHE_MAINTENANCE_BATCH_SIZE", "500"))
+    CACHE_MAINTENANCE_PAUSE_MS: int = int(os.getenv("CACHE_MAINTENANCE_PAUSE_MS", "10"))
+    # キャッシュ値のコーデック（auto / orjson / msgpack / json、auto / zstd / lz4 / zlib / none）
+    CACHE_CODEC_SERIALIZER: str = os.getenv("CACHE_CODEC_SERIALIZER", "auto")
+    CACHE_CODEC_COMPRESSION: str = os.getenv("CACHE_CODEC_COMPRESSION", "auto")
+    CACHE_COMPRESS_THRESHOLD_BYTES: int = int(os.getenv("CACHE_COMPRESS_THRESHOLD_BYTES", "1024"))
+    # 再計算ロック（キャッシュスタンピード対策）
+    CACHE_LOCK_TTL_MS: int = int(os.getenv("CACHE_LOCK_TTL_MS", "30000"))
+    CACHE_LOCK_WAIT_MS: int = int(os.getenv("CACHE_LOCK_WAIT_MS", "3000"))
+    CACHE_LOCK_POLL_INTERVAL_MS: int = int(os.getenv("CACHE_LOCK_POLL_INTERVAL_MS", "100"))
     
     # 並列処理
     MAX_CONCURRENT_RESEARCH: int = int(os.getenv("MAX_CONCURRENT_RESEARCH", "4"))
     RESEARCH_TIMEOUT_SECONDS: int = int(os.getenv("RESEARCH_TIMEOUT_SECONDS", "30"))
     
+    # AI提案生成時の検索条件
+    PROPOSAL_STATION_SEARCH_RADIUS_KM: float = float(os.getenv("PROPOSAL_STATION_SEARCH_RADIUS_KM", "5.0"))
+    PROPOSAL_MAX_STATIONS: int = int(os.getenv("PROPOSAL_MAX_STATIONS", "3"))
+    PROPOSAL_MAX_RESTAURANTS_PER_STATION: int = int(os.getenv("PROPOSAL_MAX_RESTAURANTS_PER_STATION", "5"))
+    # 提案生成前のユーザー・位置・友人データ一括取得（友人サブコレクションの同時取得数）
+    PROPOSAL_HYDRATION_CONCURRENCY: int = int(os.getenv("PROPOSAL_HYDRATION_CONCURRENCY", "10"))
+    # 店舗候補を共有するユーザークラスターのジオセル精度（6で約1.2km×0.6km）
+    PROPOSAL_CLUSTER_GEOHASH_PRECISION: int = int(os.getenv("PROPOSAL_CLUSTER_GEOHASH_PRECISION", "6"))
+    # ユーザー単位・ユーザー内の提案単位の同時実行数と、ユーザーごとのタイムアウト
+    PROPOSAL_USER_CONCURRENCY: int = int(os.getenv("PROPOSAL_USER_CONCURRENCY", "5"))
+    PROPOSAL_PER_USER_CONCURRENCY: int = int(os.getenv("PROPOSAL_PER_USER_CONCURRENCY", "2"))
+    PROPOSAL_USER_TIMEOUT_SECONDS: int = int(os.getenv("PROPOSAL_USER_TIMEOUT_SECONDS", "90"))
+    # 近くにいる空き状態の友人同士をグループにまとめ、グループごとに1回だけ提案を生成する
+    PROPOSAL_FRIEND_GROUPING_ENABLED: bool = os.getenv("PROPOSAL_FRIEND_GROUPING_ENABLED", "true").lower() == "true"
+    PROPOSAL_GROUP_MAX_SIZE: int = int(os.getenv("PROPOSAL_GROUP_MAX_SIZE", "5"))
+    PROPOSAL_GROUP_MAX_DISTANCE_KM: float = float(os.getenv("PROPOSAL_GROUP_MAX_DISTANCE_KM", "5.0"))
+    # 非同期ジョブモード（進捗の書き込み間隔と、停止したジョブを再実行可能とみなすまでの秒数）
+    PROPOSAL_JOB_PROGRESS_INTERVAL_SECONDS: int = int(os.getenv("PROPOSAL_JOB_PROGRESS_INTERVAL_SECONDS", "5"))
+    PROPOSAL_JOB_STALE_SECONDS: int = int(os.getenv("PROPOSAL_JOB_STALE_SECONDS", "600"))
+    
+    # locationsドキュメントのgeohash精度（アプリの保存精度と合わせる）
+    LOCATION_GEOHASH_PRECISION: int = int(os.getenv("LOCATION_GEOHASH_PRECISION", "6"))
+    
+    # Firestoreのユーザー情報・友人リスト・位置情報のリードスルーキャッシュ
+    FIRESTORE_CACHE_ENABLED: bool = os.getenv("FIRESTORE_CACHE_ENABLED", "true").lower() == "true"
+    FIRESTORE_CACHE_USE_REDIS: bool = os.getenv("FIRESTORE_CACHE_USE_REDIS", "false").lower() == "true"
+    FIRESTORE_CACHE_USER_TTL_SECONDS: int = int(os.getenv("FIRESTORE_CACHE_USER_TTL_SECONDS", "60"))
+    FIRESTORE_CACHE_FRIENDS_TTL_SECONDS: int = int(os.getenv("FIRESTORE_CACHE_FRIENDS_TTL_SECONDS", "300"))
+    FIRESTORE_CACHE_LOCATION_TTL_SECONDS: int = int(os.getenv("FIRESTORE_CACHE_LOCATION_TTL_SECONDS", "60"))
+    FIRESTORE_CACHE_MAX_ENTRIES: int = int(os.getenv("FIRESTORE_CACHE_MAX_ENTRIES", "10000"))
+    
+    # 空きユーザーのインメモリインデックス（スナップショットリスナー、インスタンスごとに常駐）
+    FREE_USER_INDEX_ENABLED: bool = os.getenv("FREE_USER_INDEX_ENABLED", "false").lower() == "true"
+    FREE_USER_INDEX_RESYNC_INTERVAL_SECONDS: int = int(os.getenv("FREE_USER_INDEX_RESYNC_INTERVAL_SECONDS", "30"))
+    
+    # 期限切れ提案のクリーンアップ（ページ単位で処理し、進捗をチェックポイントに保存）
+    PROPOSAL_CLEANUP_PAGE_SIZE: int = int(os.getenv("PROPOSAL_CLEANUP_PAGE_SIZE", "200"))
+    PROPOSAL_CLEANUP_MAX_CONCURRENT_BATCHES: int = int(os.getenv("PROPOSAL_CLEANUP_MAX_CONCURRENT_BATCHES", "4"))
+    
     # 大都市リスト
     MAJOR_CITIES: Dict[str, List[str]] = {
         "関東": ["新宿", "渋谷", "池袋", "品川", "東京", "上野", "浅草", "横浜", "川崎", "大宮"],
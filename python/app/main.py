@@ -5,8 +5,10 @@ from contextlib import asynccontextmanager
 import uvicorn
 
 from app.config import get_settings
-from app.api.endpoints import recommendations
+from app.api.endpoints import recommendations, admin
 from app.services.cache import cache_service
+from app.services.free_user_index import free_user_index
+from app.services.firestore_service import get_firestore_service
 
 
 settings = get_settings()
@@ -17,15 +19,26 @@ async def lifespan(app: FastAPI):
     """アプリケーションのライフサイクル管理"""
     # 起動時
     print("Starting up...")
-    # Redis接続を一時的に無効化してテスト
-    # await cache_service.connect()
-    print("Redis connection temporarily disabled for debugging")
+    # 推奨結果キャッシュ用のRedis接続（失敗してもキャッシュ無しで起動を継続）
+    if settings.CACHE_ENABLED:
+        await cache_service.connect()
+    else:
+        print("Redis cache disabled by CACHE_ENABLED=false")
+    # 空きユーザーのインメモリインデックス（失敗してもFirestoreへの直接クエリで動作を継続）
+    if settings.FREE_USER_INDEX_ENABLED:
+        try:
+            get_firestore_service()
+            free_user_index.start()
+        except Exception as e:
+            print(f"❌ Failed to start free user index: {str(e)}")
     
     yield
     
     # 終了時
     print("Shutting down...")
-    # await cache_service.disconnect()
+    if settings.FREE_USER_INDEX_ENABLED:
+        await free_user_index.stop()
+    await cache_service.disconnect()
 
 
 # FastAPIアプリケーションの作成
@@ -48,6 +61,7 @@ app.add_middleware(
 
 # ルーターの登録
 app.include_router(recommendations.router)
+app.include_router(admin.router)
 
 
 # ルートエンドポイント
@@ -69,13 +83,15 @@ async def root():
 @app.get("/health")
 async def health_check():
     """ヘルスチェック"""
-    # Redis依存を一時的に無効化してテスト
-    # redis_health = await cache_service.health_check()
+    # Redisが使えなくてもキャッシュ無しで動作するため、状態のみ報告
+    redis_health = await cache_service.health_check() if settings.CACHE_ENABLED else {"status": "disabled"}
+    free_user_index_stats = free_user_index.get_stats() if settings.FREE_USER_INDEX_ENABLED else {"status": "disabled"}
     
     return {
         "status": "healthy",
         "version": "1.0.0",
-        "redis": {"status": "disabled_for_debug"},
+        "redis": redis_health,
+        "free_user_index": free_user_index_stats,
         "message": "Application is running"
     }
 
@@ -415,6 +415,14 @@ class UserResponseStatus(str, Enum):
     MAYBE = "maybe"
 
 
+class ProposalJobStatus(str, Enum):
+    """AI提案生成ジョブの状態"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 class Priority(str, Enum):
     """優先度"""
     LOW = "low"
@@ -532,6 +540,7 @@ class UserProposal(BaseModel):
     proposal_id: str = Field(..., description="提案ID")
     proposal_ref: str = Field(..., description="proposals コレクションへの参照パス")
     status: UserResponseStatus = Field(UserResponseStatus.PENDING, description="応答状況")
+    proposal_status: ProposalStatus = Field(ProposalStatus.ACTIVE, description="提案自体の状態（期限切れ等）")
     is_read: bool = Field(False, description="既読フラグ")
     responded_at: Optional[datetime] = Field(None, description="応答日時")
     notification_sent: bool = Field(False, description="通知送信済みフラグ")
@@ -561,9 +570,38 @@ class UserProposal(BaseModel):
 class ProposalGenerationRequest(BaseModel):
     """AI提案生成リクエスト"""
     target_user_ids: Optional[List[str]] = Field(None, description="対象ユーザーID（未指定の場合は全アクティブユーザー）")
-    location_filter: Optional[Dict[str, Any]] = Field(None, description="位置フィルター")
-    force_generation: bool = Field(False, description="強制生成フラグ")
+    location_filter: Optional[Dict[str, Any]] = Field(
+        None,
+        description="位置フィルター（例: {\"center\": {\"latitude\": 35.68, \"longitude\": 139.76}, \"radius_km\": 5}）"
+    )
+    force_generation: bool = Field(False, description="強制生成フラグ（状況に変化がないユーザーも再生成する）")
     max_proposals_per_user: int = Field(3, ge=1, le=10, description="ユーザーあたり最大提案数")
+    idempotency_key: Optional[str] = Field(
+        None,
+        description="ジョブモードの冪等キー（未指定の場合はスケジューラーの予定時刻（なければ日付）とリクエスト内容から生成し、同じ実行枠の再試行は同じジョブになる）"
+    )
+    run_id: Optional[str] = Field(
+        None, pattern=r'^[A-Za-z0-9_-]{1,128}$',
+        description="実行ID（処理済みユーザーを記録し、同じIDでの再試行は未処理のユーザーから再開する。未指定の場合はジョブIDと同じくスケジューラーの予定時刻（なければ日付）とリクエスト内容から生成）"
+    )
+    shard_count: Optional[int] = Field(
+        None, ge=1, le=256,
+        description="シャード数（複数インスタンスで分担する場合。uidのハッシュで対象ユーザーを分割する）"
+    )
+    shard_index: Optional[int] = Field(
+        None, ge=0, validate_default=True,
+        description="担当するシャード番号（0〜shard_count-1、shard_countと合わせて指定）"
+    )
+    
+    @field_validator('shard_index')
+    @classmethod
+    def validate_shard_index(cls, v, info):
+        shard_count = info.data.get('shard_count') if info.data else None
+        if (v is None) != (shard_count is None):
+            raise ValueError("shard_index と shard_count は両方指定してください")
+        if v is not None and v >= shard_count:
+            raise ValueError("shard_index は shard_count 未満で指定してください")
+        return v
 
 
 class ProposalGenerationResponse(BaseModel):
@@ -572,6 +610,46 @@ class ProposalGenerationResponse(BaseModel):
     generated_proposals: List[str] = Field(..., description="生成された提案ID配列")
     target_users_count: int = Field(..., description="対象ユーザー数")
     processing_time_ms: int = Field(..., description="処理時間（ミリ秒）")
+    regenerated_users_count: int = Field(0, description="提案を生成したユーザー数")
+    skipped_users_count: int = Field(0, description="状況に変化がなく有効な提案が残っているためスキップしたユーザー数")
+    succeeded_users_count: int = Field(0, description="提案を1件以上生成できたユーザー数")
+    failed_users: List[str] = Field(default_factory=list, description="エラーで処理できなかったユーザーUID")
+    timed_out_users: List[str] = Field(default_factory=list, description="タイムアウトしたユーザーUID")
+    users_per_second: Optional[float] = Field(None, description="ユーザー処理スループット（人/秒）")
+    proposals_per_minute: Optional[float] = Field(None, description="提案生成スループット（件/分）")
+    friend_groups_count: int = Field(0, description="まとめて提案を生成した友人グループ数")
+    run_id: Optional[str] = Field(None, description="実行ID")
+    resumed_users_count: int = Field(0, description="同じ実行IDの前回の試行で処理済みのため再処理しなかったユーザー数")
+    shard_index: Optional[int] = Field(None, description="処理したシャード番号")
+    shard_count: Optional[int] = Field(None, description="シャード数")
     error_message: Optional[str] = Field(None, description="エラーメッセージ")
 
 
+class ProposalJobResponse(BaseModel):
+    """AI提案生成ジョブの状態レスポンス"""
+    job_id: str = Field(..., description="ジョブID")
+    status: ProposalJobStatus = Field(..., description="ジョブの状態")
+    created: bool = Field(False, description="今回のリクエストで新しくジョブを開始したか（再試行時はFalse）")
+    progress: Dict[str, Any] = Field(default_factory=dict, description="進捗（処理済みユーザー数・生成件数・スループット等）")
+    result: Optional[ProposalGenerationResponse] = Field(None, description="完了時の生成結果")
+    error_message: Optional[str] = Field(None, description="エラーメッセージ")
+    created_at: Optional[datetime] = Field(None, description="ジョブ作成日時")
+    started_at: Optional[datetime] = Field(None, description="処理開始日時")
+    finished_at: Optional[datetime] = Field(None, description="処理終了日時")
+    updated_at: Optional[datetime] = Field(None, description="最終更新日時")
+    shard_group: Optional[str] = Field(None, description="シャードグループID（シャード指定時、同日・同一条件のシャードで共通）")
+    shard_index: Optional[int] = Field(None, description="シャード番号")
+    shard_count: Optional[int] = Field(None, description="シャード数")
+
+
+class ProposalShardGroupResponse(BaseModel):
+    """シャード分割したAI提案生成ジョブの集計レスポンス"""
+    shard_group: str = Field(..., description="シャードグループID")
+    shard_count: int = Field(..., description="シャード数")
+    completed: bool = Field(..., description="全シャードが完了したか")
+    completed_shards: List[int] = Field(default_factory=list, description="完了したシャード番号")
+    running_shards: List[int] = Field(default_factory=list, description="実行中・待機中のシャード番号")
+    failed_shards: List[int] = Field(default_factory=list, description="失敗したシャード番号")
+    missing_shards: List[int] = Field(default_factory=list, description="まだジョブが投入されていないシャード番号")
+    totals: Dict[str, Any] = Field(default_factory=dict, description="全シャードの進捗の合計（対象ユーザー数・生成件数等）")
+    shards: List[ProposalJobResponse] = Field(default_factory=list, description="シャードごとのジョブ状態")
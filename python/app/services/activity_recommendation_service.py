@@ -11,6 +11,8 @@ from app.models import (
 )
 from app.services.gemini_research import GeminiResearchAgent, GeminiAPIError
 from app.services.google_places import GooglePlacesService, GooglePlacesAPIError
+from app.services.cache import cache_service
+from app.services.request_hashing import get_geocell
 from app.config import get_settings
 
 
@@ -128,16 +130,32 @@ class ActivityRecommendationService:
         
         print(f"🏷️ Searching for types: {included_types}")
         
+        # 同じジオセル（推奨結果のキャッシュと同じ精度）で直近に結果が空だった検索は再実行しない
+        negative_key = cache_service.build_negative_key(
+            "spots",
+            {
+                "geocell": get_geocell(user_location.latitude, user_location.longitude),
+                "radius_m": radius_m,
+                "types": sorted(included_types),
+                "max_results": max_results
+            }
+        )
+        if await cache_service.get(negative_key):
+            print("⚡ Negative cache hit: no places around this geocell")
+            return []
+        
         try:
             # 直接Google Places APIを呼び出し
             places = self.places_service.search_nearby_spots(
-                user_location, radius_m, included_types, max_results
+                user_location, radius_m, included_types, max_results,
+                raise_on_error=True
             )
             
             print(f"📍 Found {len(places)} places from API")
             
             if not places:
                 print("⚠️ No places returned from Google Places API")
+                await cache_service.set_negative_results([negative_key])
                 return []
             
             # StationSearchResultをSpotInfoに変換
@@ -168,6 +186,10 @@ class ActivityRecommendationService:
             
             return final_spots
             
+        except GooglePlacesAPIError as e:
+            # API障害による空の結果はネガティブキャッシュしない
+            print(f"❌ Places API error during search: {e}")
+            return []
         except Exception as e:
             print(f"❌ Error during search: {e}")
             import traceback
@@ -1,11 +1,39 @@
 import json
+import math
+import time
+import uuid
+import random
 import hashlib
 import asyncio
-from typing import Optional, Any
+from typing import Optional, Any, Callable, Awaitable, Dict, List, Tuple
 import redis.asyncio as redis
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from app.config import get_settings
+from app.services.cache_codec import CacheCodec
+
+
+# soft TTL付きエントリを識別するためのマーカー
+ENTRY_MARKER = "__cache_entry__"
+
+# 定期メンテナンスで削除するキャッシュのプレフィックス（Places検索結果を含む）
+MAINTENANCE_PREFIXES = [
+    "station_research:",
+    "recommendation:",
+    "stations:",
+    "restaurants:",
+    "negative:",
+    "firestore:"
+]
+
+# 自分が取得したロックのみ解放する（トークン一致時のみDEL）
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+else
+    return 0
+end
+"""
 
 
 class CacheService:
@@ -16,6 +44,18 @@ class CacheService:
         self.redis = None
         self.connection_retries = 0
         self.max_retries = 3
+        # 値のシリアライズ・圧縮
+        self.codec = CacheCodec(
+            serializer=self.settings.CACHE_CODEC_SERIALIZER,
+            compression=self.settings.CACHE_CODEC_COMPRESSION,
+            compress_threshold_bytes=self.settings.CACHE_COMPRESS_THRESHOLD_BYTES
+        )
+        # 計算中のタスク（キー単位で1つまで、同時呼び出しで共有）
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # バックグラウンド再計算中のタスク（ロック待ちをしないため、値を待つ呼び出し元とは共有しない）
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        # リクエスト経路から切り離して実行する記録タスク
+        self._background_tasks = set()
     
     async def connect(self):
         """Redis接続を初期化（失敗してもアプリケーション起動を停止しない）"""
@@ -29,10 +69,11 @@ class CacheService:
                 print(f"Attempting Redis connection (attempt {attempt + 1}/{max_retries})...")
                 
                 # 非常に短いタイムアウトでRedis接続を試行
+                # 値はCacheCodecでバイナリ化するためデコードしない
                 self.redis = redis.from_url(
                     self.settings.REDIS_URL,
                     encoding="utf-8",
-                    decode_responses=True,
+                    decode_responses=False,
                     socket_connect_timeout=connect_timeout,  # 接続タイムアウト2秒
                     socket_timeout=operation_timeout,        # 操作タイムアウト1秒
                     retry_on_timeout=False,  # タイムアウト時のリトライを無効化
@@ -65,6 +106,12 @@ class CacheService:
     
     async def disconnect(self):
         """Redis接続を閉じる"""
+        # 実行中の計算・バックグラウンド再計算をキャンセル
+        for task in list(self._inflight.values()) + list(self._refreshing.values()):
+            task.cancel()
+        self._inflight.clear()
+        self._refreshing.clear()
+        
         if self.redis:
             try:
                 await self.redis.aclose()
@@ -83,6 +130,19 @@ class CacheService:
         except Exception as e:
             return {"status": "error", "error": str(e)}
     
+    def get_stats(self) -> dict:
+        """キャッシュの統計情報を取得"""
+        return {
+            "connected": self.redis is not None,
+            "inflight_computations": len(self._inflight),
+            "background_refreshes": len(self._refreshing),
+            "codec": self.codec.get_stats()
+        }
+    
+    def build_key(self, prefix: str, params: dict) -> str:
+        """パラメータからキャッシュキーを生成（各サービス用）"""
+        return self._generate_cache_key(prefix, params)
+    
     def _generate_cache_key(self, prefix: str, params: dict) -> str:
         """キャッシュキーを生成"""
         # パラメータを正規化してJSON文字列に変換
@@ -93,15 +153,47 @@ class CacheService:
         
         return f"{prefix}:{hash_value}"
     
-    async def get(self, key: str) -> Optional[Any]:
-        """キャッシュから値を取得"""
+    def _wrap_entry(self, value: Any, ttl_seconds: int, compute_seconds: float) -> dict:
+        """soft TTL（fresh_until）と再計算コストを値と一緒に保存する形式に変換"""
+        return {
+            ENTRY_MARKER: 1,
+            "value": value,
+            "fresh_until": time.time() + ttl_seconds,
+            "delta": round(compute_seconds, 3)
+        }
+    
+    def _unwrap_entry(self, raw: Any) -> Tuple[Any, Optional[float], float]:
+        """保存形式から (値, fresh_until, 再計算コスト) を取り出す（旧形式の値はそのまま返す）"""
+        if isinstance(raw, dict) and raw.get(ENTRY_MARKER) == 1:
+            return raw.get("value"), raw.get("fresh_until"), float(raw.get("delta") or 0.0)
+        return raw, None, 0.0
+    
+    def _should_refresh(self, fresh_until: float, delta: float) -> bool:
+        """確率的早期期限切れ（XFetch）で再計算すべきか判定
+        
+        soft TTLに近づくほど、また再計算コストが大きいほど高い確率でTrueを返し、
+        人気キーの再計算タイミングを分散させる。
+        """
+        now = time.time()
+        if now >= fresh_until:
+            return True
+        
+        beta = self.settings.CACHE_EARLY_REFRESH_BETA
+        if beta <= 0 or delta <= 0:
+            return False
+        
+        # 1 - random() は (0, 1] なので log が発散しない
+        return now - delta * beta * math.log(1.0 - random.random()) >= fresh_until
+    
+    async def _get_raw(self, key: str) -> Optional[Any]:
+        """キャッシュから保存形式のまま値を取得"""
         if not self.redis:
             return None
         
         try:
             value = await asyncio.wait_for(self.redis.get(key), timeout=2)
             if value:
-                return json.loads(value)
+                return self.codec.decode(value)
             return None
         except asyncio.TimeoutError:
             print(f"Cache get timeout for key: {key}")
@@ -110,27 +202,44 @@ class CacheService:
             print(f"Cache get error for key {key}: {str(e)}")
             return None
     
+    async def get(self, key: str) -> Optional[Any]:
+        """キャッシュから値を取得（soft TTLを過ぎたstaleな値もhard TTLまでは返す）"""
+        raw = await self._get_raw(key)
+        if raw is None:
+            return None
+        
+        value, _, _ = self._unwrap_entry(raw)
+        return value
+    
     async def set(
         self, 
         key: str, 
         value: Any, 
-        ttl_seconds: Optional[int] = None
+        ttl_seconds: Optional[int] = None,
+        stale_ttl_seconds: Optional[int] = None,
+        compute_seconds: float = 0.0
     ) -> bool:
-        """キャッシュに値を設定"""
+        """キャッシュに値を設定
+        
+        stale_ttl_seconds を指定すると ttl_seconds を soft TTL として扱い、
+        Redis上は ttl_seconds + stale_ttl_seconds（hard TTL）まで保持する。
+        """
         if not self.redis:
             return False
         
         try:
-            value_str = json.dumps(value, ensure_ascii=False)
+            value_bytes, expire_seconds = self._encode_for_set(
+                value, ttl_seconds, stale_ttl_seconds, compute_seconds
+            )
             
-            if ttl_seconds:
+            if expire_seconds:
                 await asyncio.wait_for(
-                    self.redis.setex(key, ttl_seconds, value_str), 
+                    self.redis.setex(key, expire_seconds, value_bytes), 
                     timeout=2
                 )
             else:
                 await asyncio.wait_for(
-                    self.redis.set(key, value_str), 
+                    self.redis.set(key, value_bytes), 
                     timeout=2
                 )
             
@@ -142,6 +251,100 @@ class CacheService:
             print(f"Cache set error for key {key}: {str(e)}")
             return False
     
+    def _encode_for_set(
+        self,
+        value: Any,
+        ttl_seconds: Optional[int],
+        stale_ttl_seconds: Optional[int],
+        compute_seconds: float = 0.0
+    ) -> Tuple[bytes, Optional[int]]:
+        """保存用のバイト列とRedis上の有効期限（hard TTL）を決定"""
+        if ttl_seconds and stale_ttl_seconds is not None:
+            return (
+                self.codec.encode(self._wrap_entry(value, ttl_seconds, compute_seconds)),
+                ttl_seconds + stale_ttl_seconds
+            )
+        return self.codec.encode(value), ttl_seconds
+    
+    async def get_many(
+        self,
+        keys: List[str],
+        refreshers: Optional[Dict[str, Callable[[], Awaitable[Any]]]] = None,
+        ttl_seconds: Optional[int] = None,
+        stale_ttl_seconds: Optional[int] = None,
+        should_cache: Optional[Callable[[Any], bool]] = None
+    ) -> Dict[str, Any]:
+        """複数キーをMGETで一括取得（ヒットしたキーのみ返す）
+        
+        refreshers（キー -> producer）を渡すと、soft TTLを過ぎた値や確率的早期再計算の対象になった値は
+        そのまま返しつつ、get_or_compute と同様にバックグラウンドで再計算する。
+        """
+        if not self.redis or not keys:
+            return {}
+        
+        try:
+            values = await asyncio.wait_for(self.redis.mget(keys), timeout=2)
+        except asyncio.TimeoutError:
+            print(f"Cache mget timeout for {len(keys)} keys")
+            return {}
+        except Exception as e:
+            print(f"Cache mget error for {len(keys)} keys: {str(e)}")
+            return {}
+        
+        results = {}
+        for key, value in zip(keys, values):
+            if not value:
+                continue
+            try:
+                results[key], fresh_until, delta = self._unwrap_entry(self.codec.decode(value))
+            except Exception as e:
+                print(f"Cache decode error for key {key}: {str(e)}")
+                continue
+            
+            if refreshers and key in refreshers and fresh_until is not None and self._should_refresh(fresh_until, delta):
+                self._schedule_refresh(
+                    key, refreshers[key],
+                    ttl_seconds or self.settings.CACHE_TTL_SECONDS,
+                    self.settings.CACHE_STALE_TTL_SECONDS if stale_ttl_seconds is None else stale_ttl_seconds,
+                    should_cache
+                )
+        
+        return results
+    
+    async def set_many(
+        self,
+        items: Dict[str, Any],
+        ttl_seconds: Optional[int] = None,
+        stale_ttl_seconds: Optional[int] = None,
+        compute_seconds: float = 0.0
+    ) -> bool:
+        """複数キーをパイプライン（SETEX）で一括保存
+        
+        compute_seconds はバッチ内の値1件あたりの計算時間（確率的早期再計算の重みとして全件に記録）。
+        """
+        if not self.redis or not items:
+            return False
+        
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, value in items.items():
+                value_bytes, expire_seconds = self._encode_for_set(
+                    value, ttl_seconds, stale_ttl_seconds, compute_seconds
+                )
+                if expire_seconds:
+                    pipe.setex(key, expire_seconds, value_bytes)
+                else:
+                    pipe.set(key, value_bytes)
+            
+            await asyncio.wait_for(pipe.execute(), timeout=2)
+            return True
+        except asyncio.TimeoutError:
+            print(f"Cache pipeline set timeout for {len(items)} keys")
+            return False
+        except Exception as e:
+            print(f"Cache pipeline set error for {len(items)} keys: {str(e)}")
+            return False
+    
     async def delete(self, key: str) -> bool:
         """キャッシュから値を削除"""
         if not self.redis:
@@ -157,6 +360,207 @@ class CacheService:
             print(f"Cache delete error for key {key}: {str(e)}")
             return False
     
+    async def get_or_compute(
+        self,
+        key: str,
+        producer: Callable[[], Awaitable[Any]],
+        ttl_seconds: Optional[int] = None,
+        stale_ttl_seconds: Optional[int] = None,
+        should_cache: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """キャッシュから取得し、無ければ producer で計算して保存（stale-while-revalidate）
+        
+        - soft TTL内: キャッシュ値をそのまま返す（確率的に早期再計算をスケジュール）
+        - soft TTL〜hard TTL: staleな値を即座に返し、バックグラウンドで再計算
+        - キャッシュ無し: 同期的に計算して保存
+        
+        同一プロセス内の同時呼び出しは1つの計算タスクを共有し、インスタンス間では
+        Redisロック（SET NX PX）で再計算を1つに絞る。ロックを取れなかった側は
+        staleな値を返すか、他インスタンスの計算結果を短時間待つ。
+        """
+        value, _ = await self.get_or_compute_with_status(
+            key, producer, ttl_seconds, stale_ttl_seconds, should_cache
+        )
+        return value
+    
+    async def get_or_compute_with_status(
+        self,
+        key: str,
+        producer: Callable[[], Awaitable[Any]],
+        ttl_seconds: Optional[int] = None,
+        stale_ttl_seconds: Optional[int] = None,
+        should_cache: Optional[Callable[[Any], bool]] = None
+    ) -> Tuple[Any, str]:
+        """get_or_compute と同じ処理で、キャッシュ状態（HIT / STALE / MISS / BYPASS）も返す"""
+        ttl = ttl_seconds or self.settings.CACHE_TTL_SECONDS
+        stale_ttl = self.settings.CACHE_STALE_TTL_SECONDS if stale_ttl_seconds is None else stale_ttl_seconds
+        
+        raw = await self._get_raw(key)
+        if raw is not None:
+            value, fresh_until, delta = self._unwrap_entry(raw)
+            
+            # 旧形式のエントリはsoft TTLを持たないため常にfresh扱い
+            if fresh_until is not None and self._should_refresh(fresh_until, delta):
+                self._schedule_refresh(key, producer, ttl, stale_ttl, should_cache)
+                return value, "STALE" if time.time() >= fresh_until else "HIT"
+            
+            return value, "HIT"
+        
+        value = await self._compute_shared(key, producer, ttl, stale_ttl, should_cache)
+        return value, "MISS" if self.redis else "BYPASS"
+    
+    async def _compute_shared(
+        self,
+        key: str,
+        producer: Callable[[], Awaitable[Any]],
+        ttl_seconds: int,
+        stale_ttl_seconds: int,
+        should_cache: Optional[Callable[[Any], bool]]
+    ) -> Any:
+        """同一キーの計算をプロセス内で1つのタスクに集約して結果を共有
+        
+        共有するタスクは必ずロック待ちをする（値を返す）ため、バックグラウンド再計算のタスクは含めない。
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(
+                self._compute_with_lock(key, producer, ttl_seconds, stale_ttl_seconds, should_cache, wait_on_lock=True)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(
+                lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None
+            )
+        
+        # 呼び出し元のキャンセルで共有タスクが止まらないようにする
+        return await asyncio.shield(task)
+    
+    async def _compute_with_lock(
+        self,
+        key: str,
+        producer: Callable[[], Awaitable[Any]],
+        ttl_seconds: int,
+        stale_ttl_seconds: int,
+        should_cache: Optional[Callable[[Any], bool]],
+        wait_on_lock: bool
+    ) -> Any:
+        """分散ロックを取得して計算（取得できなければ他インスタンスの結果を待つ）"""
+        token = await self._acquire_lock(key)
+        
+        if token is None:
+            if not wait_on_lock:
+                # 他インスタンスが再計算中なので、呼び出し元はstaleな値のまま
+                return None
+            
+            raw = await self._wait_for_value(key)
+            if raw is not None:
+                value, _, _ = self._unwrap_entry(raw)
+                return value
+            
+            print(f"⏰ Cache lock wait expired for key {key}, computing locally")
+        
+        try:
+            return await self._compute_and_store(key, producer, ttl_seconds, stale_ttl_seconds, should_cache)
+        finally:
+            if token:
+                await self._release_lock(key, token)
+    
+    async def _acquire_lock(self, key: str) -> Optional[str]:
+        """再計算用の短命ロックを取得（他者が保持中ならNone、Redis無しや障害時は空文字で続行）"""
+        if not self.redis:
+            return ""
+        
+        token = uuid.uuid4().hex
+        try:
+            acquired = await asyncio.wait_for(
+                self.redis.set(f"lock:{key}", token, nx=True, px=self.settings.CACHE_LOCK_TTL_MS),
+                timeout=1
+            )
+            return token if acquired else None
+        except Exception as e:
+            print(f"Cache lock acquire error for key {key}: {str(e)}")
+            return ""
+    
+    async def _release_lock(self, key: str, token: str):
+        """自分が取得したロックのみ解放"""
+        if not self.redis:
+            return
+        
+        try:
+            await asyncio.wait_for(
+                self.redis.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{key}", token),
+                timeout=1
+            )
+        except Exception as e:
+            print(f"Cache lock release error for key {key}: {str(e)}")
+    
+    async def _wait_for_value(self, key: str) -> Optional[Any]:
+        """ロック保持者の計算結果がキャッシュに入るのを短時間待つ"""
+        deadline = time.monotonic() + self.settings.CACHE_LOCK_WAIT_MS / 1000
+        interval = self.settings.CACHE_LOCK_POLL_INTERVAL_MS / 1000
+        
+        while time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+            
+            raw = await self._get_raw(key)
+            if raw is not None:
+                return raw
+            
+            # ロックが消えていれば保持者は終了済み（結果がキャッシュされなかった）
+            try:
+                if not await asyncio.wait_for(self.redis.exists(f"lock:{key}"), timeout=1):
+                    return None
+            except Exception:
+                return None
+        
+        return None
+    
+    async def _compute_and_store(
+        self,
+        key: str,
+        producer: Callable[[], Awaitable[Any]],
+        ttl_seconds: int,
+        stale_ttl_seconds: int,
+        should_cache: Optional[Callable[[Any], bool]]
+    ) -> Any:
+        """producer を実行して結果をキャッシュに保存"""
+        started = time.monotonic()
+        value = await producer()
+        compute_seconds = time.monotonic() - started
+        
+        if should_cache is None or should_cache(value):
+            await self.set(key, value, ttl_seconds, stale_ttl_seconds, compute_seconds)
+        
+        return value
+    
+    def _schedule_refresh(
+        self,
+        key: str,
+        producer: Callable[[], Awaitable[Any]],
+        ttl_seconds: int,
+        stale_ttl_seconds: int,
+        should_cache: Optional[Callable[[Any], bool]]
+    ):
+        """バックグラウンド再計算をスケジュール（同一キーの計算中は重複実行しない）"""
+        if key in self._inflight or key in self._refreshing:
+            return
+        
+        async def _refresh():
+            try:
+                # 他インスタンスが再計算中（ロック取得失敗）の場合は何もしない
+                await self._compute_with_lock(
+                    key, producer, ttl_seconds, stale_ttl_seconds, should_cache, wait_on_lock=False
+                )
+                print(f"🔄 Cache refreshed in background: {key}")
+            except Exception as e:
+                print(f"Cache background refresh error for key {key}: {str(e)}")
+            finally:
+                self._refreshing.pop(key, None)
+        
+        task = asyncio.create_task(_refresh())
+        self._refreshing[key] = task
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
     async def get_station_research(
         self,
         station_name: str,
@@ -192,16 +596,145 @@ class CacheService:
             }
         )
         
-        # 駅の研究結果は1時間キャッシュ
-        return await self.set(key, research_data, self.settings.CACHE_TTL_SECONDS)
+        # 駅の研究結果は1時間キャッシュ（その後stale期間中はバックグラウンド再計算）
+        return await self.set(
+            key, research_data, self.settings.CACHE_TTL_SECONDS,
+            stale_ttl_seconds=self.settings.CACHE_STALE_TTL_SECONDS
+        )
+    
+    def build_negative_key(self, prefix: str, params: dict) -> str:
+        """空の検索結果（ネガティブキャッシュ）用のキーを生成"""
+        return self._generate_cache_key(f"negative:{prefix}", params)
+    
+    async def set_negative_results(self, keys: List[str]) -> bool:
+        """空の検索結果を短いTTLで記録（API障害による空の結果では呼ばないこと）"""
+        if not keys:
+            return False
+        
+        marker = {"empty": True, "cached_at": time.time()}
+        return await self.set_many(
+            {key: marker for key in keys},
+            ttl_seconds=self.settings.NEGATIVE_CACHE_TTL_SECONDS
+        )
+    
+    def _popularity_key(self, day: datetime) -> str:
+        return f"popularity:geocells:{day.strftime('%Y%m%d')}"
+    
+    def track_geocell_access(self, geocell: str):
+        """ジオセルへのアクセスを日別カウンターに記録（リクエスト経路をブロックしない）"""
+        if not self.redis:
+            return
+        
+        task = asyncio.create_task(self._record_geocell_access(geocell))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _record_geocell_access(self, geocell: str):
+        key = self._popularity_key(datetime.now())
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zincrby(key, 1, geocell)
+            pipe.expire(key, self.settings.POPULARITY_RETENTION_DAYS * 86400)
+            await asyncio.wait_for(pipe.execute(), timeout=1)
+        except Exception as e:
+            print(f"Cache popularity record error for geocell {geocell}: {str(e)}")
+    
+    async def get_popular_geocells(self, days: int, limit: int) -> List[Tuple[str, float]]:
+        """直近 days 日間でアクセスの多いジオセルを取得"""
+        if not self.redis:
+            return []
+        
+        today = datetime.now()
+        totals: Dict[str, float] = {}
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for offset in range(days):
+                # 日ごとの上位だけを合算（全件は読まない）
+                pipe.zrevrange(self._popularity_key(today - timedelta(days=offset)), 0, limit * 5 - 1, withscores=True)
+            daily_rankings = await asyncio.wait_for(pipe.execute(), timeout=2)
+        except Exception as e:
+            print(f"Cache popularity read error: {str(e)}")
+            return []
+        
+        for ranking in daily_rankings:
+            for member, score in ranking or []:
+                geocell = member.decode() if isinstance(member, bytes) else member
+                totals[geocell] = totals.get(geocell, 0.0) + float(score)
+        
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+    
+    async def clear_by_prefix(
+        self,
+        prefix: str,
+        batch_size: int = 500,
+        max_batches: Optional[int] = None,
+        cursor: int = 0,
+        dry_run: bool = False
+    ) -> dict:
+        """プレフィックスに一致するキーをSCANで少しずつ走査し、UNLINKで非同期削除
+        
+        KEYS/FLUSHDBと違いRedisを長時間ブロックしない。max_batches で打ち切った場合は
+        next_cursor を返すので、次回その値から再開できる。
+        """
+        result = {
+            "prefix": prefix,
+            "scanned": 0,
+            "deleted": 0,
+            "batches": 0,
+            "completed": False,
+            "next_cursor": cursor,
+            "sample_keys": []
+        }
+        
+        if not self.redis:
+            result["error"] = "No Redis connection"
+            return result
+        
+        pause_seconds = self.settings.CACHE_MAINTENANCE_PAUSE_MS / 1000
+        
+        while True:
+            cursor, keys = await asyncio.wait_for(
+                self.redis.scan(cursor=cursor, match=f"{prefix}*", count=batch_size),
+                timeout=2
+            )
+            result["batches"] += 1
+            result["scanned"] += len(keys)
+            
+            if keys:
+                if len(result["sample_keys"]) < 10:
+                    result["sample_keys"].extend(
+                        key.decode() if isinstance(key, bytes) else key
+                        for key in keys[:10 - len(result["sample_keys"])]
+                    )
+                if not dry_run:
+                    result["deleted"] += await asyncio.wait_for(self.redis.unlink(*keys), timeout=2)
+            
+            result["next_cursor"] = cursor
+            if cursor == 0:
+                result["completed"] = True
+                break
+            
+            if result["batches"] % 20 == 0:
+                print(f"🧹 Cache maintenance {prefix}: {result['batches']} batches, "
+                      f"{result['scanned']} scanned, {result['deleted']} deleted")
+            
+            if max_batches and result["batches"] >= max_batches:
+                break
+            
+            # 他のリクエストのレイテンシに影響しないようバッチ間で待機
+            await asyncio.sleep(pause_seconds)
+        
+        return result
+    
+    def _recommendation_key(self, request_hash: str) -> str:
+        return f"recommendation:{request_hash}"
     
     async def get_recommendation_result(
         self,
         request_hash: str
     ) -> Optional[dict]:
         """推奨結果全体をキャッシュから取得"""
-        key = f"recommendation:{request_hash}"
-        return await self.get(key)
+        return await self.get(self._recommendation_key(request_hash))
     
     async def set_recommendation_result(
         self,
@@ -209,10 +742,25 @@ class CacheService:
         result: dict
     ) -> bool:
         """推奨結果全体をキャッシュに保存"""
-        key = f"recommendation:{request_hash}"
-        
-        # 推奨結果は30分キャッシュ
-        return await self.set(key, result, 1800)
+        # 推奨結果は30分キャッシュ（その後stale期間中はバックグラウンド再計算）
+        return await self.set(
+            self._recommendation_key(request_hash), result,
+            self.settings.RECOMMENDATION_CACHE_TTL_SECONDS,
+            stale_ttl_seconds=self.settings.CACHE_STALE_TTL_SECONDS
+        )
+    
+    async def get_or_compute_recommendation_result(
+        self,
+        request_hash: str,
+        producer: Callable[[], Awaitable[dict]]
+    ) -> Tuple[dict, str]:
+        """推奨結果全体をキャッシュから取得し、無ければ計算（成功した結果のみ保存）"""
+        return await self.get_or_compute_with_status(
+            self._recommendation_key(request_hash),
+            producer,
+            ttl_seconds=self.settings.RECOMMENDATION_CACHE_TTL_SECONDS,
+            should_cache=lambda result: bool(result and result.get("success"))
+        )
 
 
 # シングルトンインスタンス
@@ -0,0 +1,252 @@
+"""
+キャッシュ値のシリアライズ・圧縮コーデック
+
+保存形式: [バージョン 1byte][シリアライザID 1byte][圧縮ID 1byte][ペイロード]
+バージョンバイト（0x01）はJSONテキストの先頭になり得ないため、
+旧形式（json.dumpsした文字列）の値もそのまま読み出せる。
+"""
+import json
+import time
+import zlib
+from typing import Any, Dict
+
+try:
+    import orjson
+except ImportError:  # 任意依存
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # 任意依存
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # 任意依存
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # 任意依存
+    lz4_frame = None
+
+
+FORMAT_VERSION = 1
+
+SERIALIZER_JSON = 0
+SERIALIZER_ORJSON = 1
+SERIALIZER_MSGPACK = 2
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+COMPRESSION_LZ4 = 3
+
+SERIALIZER_NAMES = {
+    SERIALIZER_JSON: "json",
+    SERIALIZER_ORJSON: "orjson",
+    SERIALIZER_MSGPACK: "msgpack"
+}
+
+COMPRESSION_NAMES = {
+    COMPRESSION_NONE: "none",
+    COMPRESSION_ZLIB: "zlib",
+    COMPRESSION_ZSTD: "zstd",
+    COMPRESSION_LZ4: "lz4"
+}
+
+
+class CacheCodecError(Exception):
+    """キャッシュ値のエンコード・デコードに関する例外"""
+    pass
+
+
+class CacheCodec:
+    """キャッシュ値のバイナリシリアライズと閾値超過時の圧縮"""
+
+    def __init__(
+        self,
+        serializer: str = "auto",
+        compression: str = "auto",
+        compress_threshold_bytes: int = 1024
+    ):
+        self.serializer_id = self._resolve_serializer(serializer)
+        self.compression_id = self._resolve_compression(compression)
+        self.compress_threshold_bytes = compress_threshold_bytes
+
+        if zstandard is not None:
+            self._zstd_compressor = zstandard.ZstdCompressor(level=3)
+            self._zstd_decompressor = zstandard.ZstdDecompressor()
+
+        self.stats = {
+            "encode_count": 0,
+            "decode_count": 0,
+            "legacy_decode_count": 0,
+            "compressed_count": 0,
+            "serialized_bytes": 0,
+            "stored_bytes": 0,
+            "encode_ms": 0.0,
+            "decode_ms": 0.0,
+            "errors": 0
+        }
+
+    def _resolve_serializer(self, name: str) -> int:
+        """設定名からシリアライザIDを決定（autoは利用可能な中で最速のもの）"""
+        if name == "auto":
+            if orjson is not None:
+                return SERIALIZER_ORJSON
+            if msgpack is not None:
+                return SERIALIZER_MSGPACK
+            return SERIALIZER_JSON
+
+        if name == "orjson" and orjson is not None:
+            return SERIALIZER_ORJSON
+        if name == "msgpack" and msgpack is not None:
+            return SERIALIZER_MSGPACK
+        if name != "json":
+            print(f"⚠️ Cache serializer '{name}' is not available. Falling back to json.")
+        return SERIALIZER_JSON
+
+    def _resolve_compression(self, name: str) -> int:
+        """設定名から圧縮方式IDを決定（autoは zstd > lz4 > zlib の順）"""
+        if name == "auto":
+            if zstandard is not None:
+                return COMPRESSION_ZSTD
+            if lz4_frame is not None:
+                return COMPRESSION_LZ4
+            return COMPRESSION_ZLIB
+
+        if name == "zstd" and zstandard is not None:
+            return COMPRESSION_ZSTD
+        if name == "lz4" and lz4_frame is not None:
+            return COMPRESSION_LZ4
+        if name == "none":
+            return COMPRESSION_NONE
+        if name != "zlib":
+            print(f"⚠️ Cache compression '{name}' is not available. Falling back to zlib.")
+        return COMPRESSION_ZLIB
+
+    def _serialize(self, value: Any) -> bytes:
+        if self.serializer_id == SERIALIZER_ORJSON:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        if self.serializer_id == SERIALIZER_MSGPACK:
+            return msgpack.packb(value, use_bin_type=True)
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+    def _deserialize(self, serializer_id: int, payload: bytes) -> Any:
+        if serializer_id == SERIALIZER_ORJSON:
+            # orjsonの出力は標準JSONなので、orjsonが無い環境でもjsonで読める
+            return orjson.loads(payload) if orjson is not None else json.loads(payload)
+        if serializer_id == SERIALIZER_MSGPACK:
+            if msgpack is None:
+                raise CacheCodecError("msgpack is not installed")
+            return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        if serializer_id == SERIALIZER_JSON:
+            return json.loads(payload)
+        raise CacheCodecError(f"Unknown serializer id: {serializer_id}")
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression_id == COMPRESSION_ZSTD:
+            return self._zstd_compressor.compress(data)
+        if self.compression_id == COMPRESSION_LZ4:
+            return lz4_frame.compress(data)
+        return zlib.compress(data, 3)
+
+    def _decompress(self, compression_id: int, data: bytes) -> bytes:
+        if compression_id == COMPRESSION_NONE:
+            return data
+        if compression_id == COMPRESSION_ZLIB:
+            return zlib.decompress(data)
+        if compression_id == COMPRESSION_ZSTD:
+            if zstandard is None:
+                raise CacheCodecError("zstandard is not installed")
+            return self._zstd_decompressor.decompress(data)
+        if compression_id == COMPRESSION_LZ4:
+            if lz4_frame is None:
+                raise CacheCodecError("lz4 is not installed")
+            return lz4_frame.decompress(data)
+        raise CacheCodecError(f"Unknown compression id: {compression_id}")
+
+    def encode(self, value: Any) -> bytes:
+        """値をヘッダー付きバイト列に変換（閾値を超える場合は圧縮）"""
+        started = time.perf_counter()
+        try:
+            payload = self._serialize(value)
+            serialized_size = len(payload)
+
+            compression_id = COMPRESSION_NONE
+            if self.compression_id != COMPRESSION_NONE and serialized_size >= self.compress_threshold_bytes:
+                compressed = self._compress(payload)
+                # 圧縮で小さくならない場合は非圧縮のまま保存
+                if len(compressed) < serialized_size:
+                    payload = compressed
+                    compression_id = self.compression_id
+                    self.stats["compressed_count"] += 1
+
+            data = bytes([FORMAT_VERSION, self.serializer_id, compression_id]) + payload
+
+            self.stats["encode_count"] += 1
+            self.stats["serialized_bytes"] += serialized_size
+            self.stats["stored_bytes"] += len(data)
+            return data
+
+        except Exception as e:
+            self.stats["errors"] += 1
+            raise CacheCodecError(f"Failed to encode cache value: {str(e)}")
+
+        finally:
+            self.stats["encode_ms"] += (time.perf_counter() - started) * 1000
+
+    def decode(self, data: Any) -> Any:
+        """ヘッダー付きバイト列（または旧形式のJSON文字列）を値に戻す"""
+        started = time.perf_counter()
+        try:
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+
+            if not data or data[0] != FORMAT_VERSION:
+                # 旧形式: json.dumps(..., ensure_ascii=False) の文字列
+                self.stats["legacy_decode_count"] += 1
+                self.stats["decode_count"] += 1
+                return json.loads(data)
+
+            if len(data) < 3:
+                raise CacheCodecError("Truncated cache value header")
+
+            payload = self._decompress(data[2], data[3:])
+            value = self._deserialize(data[1], payload)
+
+            self.stats["decode_count"] += 1
+            return value
+
+        except CacheCodecError:
+            self.stats["errors"] += 1
+            raise
+        except Exception as e:
+            self.stats["errors"] += 1
+            raise CacheCodecError(f"Failed to decode cache value: {str(e)}")
+
+        finally:
+            self.stats["decode_ms"] += (time.perf_counter() - started) * 1000
+
+    def get_stats(self) -> Dict[str, Any]:
+        """コーデックの統計情報を取得"""
+        stats = dict(self.stats)
+        stats["serializer"] = SERIALIZER_NAMES[self.serializer_id]
+        stats["compression"] = COMPRESSION_NAMES[self.compression_id]
+        stats["compress_threshold_bytes"] = self.compress_threshold_bytes
+        stats["compression_ratio"] = (
+            round(stats["stored_bytes"] / stats["serialized_bytes"], 3)
+            if stats["serialized_bytes"] else None
+        )
+        stats["avg_encode_ms"] = (
+            round(stats["encode_ms"] / stats["encode_count"], 3)
+            if stats["encode_count"] else None
+        )
+        stats["avg_decode_ms"] = (
+            round(stats["decode_ms"] / stats["decode_count"], 3)
+            if stats["decode_count"] else None
+        )
+        stats["encode_ms"] = round(stats["encode_ms"], 3)
+        stats["decode_ms"] = round(stats["decode_ms"], 3)
+        return stats
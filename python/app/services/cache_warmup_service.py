@@ -0,0 +1,156 @@
+"""
+キャッシュウォームアップサービス
+アクセスの多いジオセルと大都市駅について、駅検索と駅周辺のカジュアル店舗候補を事前計算する
+"""
+import time
+from typing import List, Dict, Any, Optional
+
+from app.models import (
+    LocationData, ActivityType, TimeOfDay, RestaurantRecommendationRequest
+)
+from app.services import geohash
+from app.services.cache import cache_service
+from app.services.request_hashing import get_geocell
+from app.services.restaurant_recommendation_service import RestaurantRecommendationService
+from app.services.station_search import StationSearchEngine
+from app.config import get_settings
+
+
+class CacheWarmupService:
+    """人気ジオセルのキャッシュウォームアップ"""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.restaurant_service = RestaurantRecommendationService()
+        self.station_search = StationSearchEngine()
+
+    def _major_station_cells(self) -> List[str]:
+        """大都市駅（config.MAJOR_CITIES）のジオセルを取得（キャッシュキーと同じ精度）"""
+        cells = []
+        for city in self.settings.all_major_cities:
+            station_info = self.station_search.station_database.get(city)
+            if not station_info:
+                continue
+            cells.append(get_geocell(station_info["lat"], station_info["lng"]))
+        return cells
+
+    def _build_profiles(self) -> List[Dict[str, Any]]:
+        """よく使われる検索条件の組み合わせを構築
+
+        API（RestaurantRecommendationRequestの既定値）と提案生成の両方の条件を含める。
+        """
+        fields = RestaurantRecommendationRequest.model_fields
+        api_defaults = {
+            "station_search_radius_km": fields["station_search_radius_km"].default,
+            "restaurant_search_radius_km": fields["restaurant_search_radius_km"].default,
+            "max_stations": fields["max_stations"].default,
+            "max_restaurants_per_station": fields["max_restaurants_per_station"].default,
+            "min_rating": fields["min_rating"].default,
+            "max_price_per_person": fields["max_price_per_person"].default
+        }
+        proposal_defaults = {
+            "station_search_radius_km": self.settings.PROPOSAL_STATION_SEARCH_RADIUS_KM,
+            "max_stations": self.settings.PROPOSAL_MAX_STATIONS,
+            "max_restaurants_per_station": self.settings.PROPOSAL_MAX_RESTAURANTS_PER_STATION,
+            "max_price_per_person": 3000
+        }
+
+        profiles = []
+        for activity in self.settings.WARMUP_ACTIVITY_TYPES:
+            try:
+                activity_type = ActivityType(activity.strip())
+            except ValueError:
+                print(f"⚠️ Unknown warm-up activity type: {activity}")
+                continue
+
+            for time_of_day in self.settings.WARMUP_TIMES_OF_DAY:
+                time_of_day = time_of_day.strip()
+                try:
+                    resolved_time = None if time_of_day in ("", "none") else TimeOfDay(time_of_day)
+                except ValueError:
+                    print(f"⚠️ Unknown warm-up time of day: {time_of_day}")
+                    continue
+
+                profiles.append({
+                    "activity_type": [activity_type],
+                    "time_of_day": resolved_time,
+                    **api_defaults
+                })
+
+            # 提案生成は時間帯を指定しない
+            profiles.append({
+                "activity_type": [activity_type],
+                "time_of_day": None,
+                **proposal_defaults
+            })
+
+        return profiles
+
+    async def warm_up(
+        self,
+        max_cells: Optional[int] = None,
+        include_major_stations: bool = True
+    ) -> Dict[str, Any]:
+        """人気ジオセルと大都市駅の検索結果を事前計算してキャッシュに載せる"""
+        start_time = time.time()
+        max_cells = max_cells or self.settings.WARMUP_MAX_CELLS
+
+        popular_cells = await cache_service.get_popular_geocells(
+            self.settings.WARMUP_LOOKBACK_DAYS, max_cells
+        )
+        cells = [cell for cell, _ in popular_cells]
+
+        if include_major_stations:
+            for cell in self._major_station_cells():
+                if cell not in cells:
+                    cells.append(cell)
+
+        profiles = self._build_profiles()
+        print(f"🔥 Cache warm-up: {len(cells)} cells x {len(profiles)} profiles "
+              f"({len(popular_cells)} from access counters)")
+
+        stations_found = 0
+        restaurants_found = 0
+        failed_tasks = 0
+
+        # 人気度はキャッシュキーと同じ精度のジオセルで記録しているため、セルの中心で計算すれば同じキーに載る
+        for cell in cells:
+            latitude, longitude = geohash.decode(cell)
+            location = LocationData(latitude=latitude, longitude=longitude)
+
+            for profile in profiles:
+                try:
+                    stations, restaurants = await self.restaurant_service.search_casual_candidates(
+                        user_location=location,
+                        **profile
+                    )
+                    stations_found += len(stations)
+                    restaurants_found += len(restaurants)
+                except Exception as e:
+                    failed_tasks += 1
+                    print(f"❌ Warm-up failed for cell {cell}: {str(e)}")
+
+        processing_time = int((time.time() - start_time) * 1000)
+        print(f"✅ Cache warm-up completed in {processing_time}ms")
+
+        return {
+            "cells_warmed": len(cells),
+            "popular_cells": [{"geocell": cell, "accesses": int(score)} for cell, score in popular_cells],
+            "profiles": len(profiles),
+            "tasks": len(cells) * len(profiles),
+            "failed_tasks": failed_tasks,
+            "stations_found": stations_found,
+            "restaurants_found": restaurants_found,
+            "processing_time_ms": processing_time
+        }
+
+
+# シングルトンインスタンス
+_warmup_service = None
+
+def get_cache_warmup_service() -> CacheWarmupService:
+    """キャッシュウォームアップサービスのシングルトンインスタンスを取得"""
+    global _warmup_service
+    if _warmup_service is None:
+        _warmup_service = CacheWarmupService()
+    return _warmup_service
@@ -0,0 +1,148 @@
+"""
+Firestoreドキュメントのリードスルーキャッシュ
+ユーザー情報・友人リスト・位置情報を短いTTLでプロセス内に保持し、
+必要に応じてRedis（CacheService）を共有の2次キャッシュとして使う
+"""
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.services.cache import cache_service
+
+
+# Redis保存時にdatetimeを識別するためのマーカー
+DATETIME_MARKER = "__datetime__"
+
+
+class DocumentCache:
+    """コレクション単位のTTL付きリードスルーキャッシュ
+
+    存在しないドキュメント（None）もキャッシュするため、値は (有効期限, 値) で保持する。
+    Redisには {"value": 値} の形で保存し、ミスと「存在しない」を区別する。
+    datetimeは {"__datetime__": ISO文字列} として保存し、Redisから読んだときにdatetimeへ戻す。
+    """
+
+    def __init__(self, ttl_by_collection: Dict[str, int], use_redis: bool = False, max_entries: int = 10000):
+        self.ttl_by_collection = ttl_by_collection
+        self.use_redis = use_redis
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self.stats = {
+            collection: {"local_hits": 0, "redis_hits": 0, "misses": 0, "invalidations": 0}
+            for collection in ttl_by_collection
+        }
+
+    def _redis_key(self, collection: str, key: str) -> str:
+        return f"firestore:{collection}:{key}"
+
+    def _get_local(self, collection: str, key: str) -> Tuple[bool, Any]:
+        entry = self._entries.get((collection, key))
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[(collection, key)]
+            return False, None
+        return True, value
+
+    def _set_local(self, collection: str, key: str, value: Any):
+        if len(self._entries) >= self.max_entries:
+            self._evict()
+        self._entries[(collection, key)] = (time.time() + self.ttl_by_collection[collection], value)
+
+    def _evict(self):
+        """期限切れのエントリを削除し、それでも上限を超える場合は古いものから削除"""
+        now = time.time()
+        for entry_key in [k for k, (expires_at, _) in self._entries.items() if expires_at < now]:
+            del self._entries[entry_key]
+        while len(self._entries) >= self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    async def get_many(self, collection: str, keys: Iterable[str]) -> Dict[str, Any]:
+        """キャッシュ済みの値を取得（ヒットしたキーのみ返す。値がNoneのものも含む）"""
+        results = {}
+        remote_keys = []
+        for key in dict.fromkeys(keys):
+            found, value = self._get_local(collection, key)
+            if found:
+                results[key] = value
+                self.stats[collection]["local_hits"] += 1
+            else:
+                remote_keys.append(key)
+
+        if remote_keys and self.use_redis:
+            cached = await cache_service.get_many([self._redis_key(collection, key) for key in remote_keys])
+            for key in remote_keys:
+                entry = cached.get(self._redis_key(collection, key))
+                if isinstance(entry, dict) and "value" in entry:
+                    value = self._from_json_safe(entry["value"])
+                    results[key] = value
+                    self._set_local(collection, key, value)
+                    self.stats[collection]["redis_hits"] += 1
+
+        self.stats[collection]["misses"] += sum(1 for key in remote_keys if key not in results)
+        return results
+
+    async def get(self, collection: str, key: str) -> Tuple[bool, Any]:
+        """1件取得し (ヒットしたか, 値) を返す"""
+        results = await self.get_many(collection, [key])
+        if key in results:
+            return True, results[key]
+        return False, None
+
+    async def set_many(self, collection: str, items: Dict[str, Any]):
+        """取得した値をキャッシュに保存"""
+        for key, value in items.items():
+            self._set_local(collection, key, value)
+
+        if items and self.use_redis:
+            await cache_service.set_many(
+                {self._redis_key(collection, key): {"value": self._to_json_safe(value)}
+                 for key, value in items.items()},
+                ttl_seconds=self.ttl_by_collection[collection]
+            )
+
+    async def set(self, collection: str, key: str, value: Any):
+        await self.set_many(collection, {key: value})
+
+    async def invalidate(self, collection: str, key: str):
+        """指定ドキュメントのキャッシュを削除"""
+        self._entries.pop((collection, key), None)
+        self.stats[collection]["invalidations"] += 1
+        if self.use_redis:
+            await cache_service.delete(self._redis_key(collection, key))
+
+    def _to_json_safe(self, value: Any) -> Any:
+        """Redis保存用にdatetime等をJSONで表現できる値に変換"""
+        if isinstance(value, dict):
+            return {str(k): self._to_json_safe(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._to_json_safe(item) for item in value]
+        if isinstance(value, datetime):
+            return {DATETIME_MARKER: value.isoformat()}
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        return str(value)
+
+    def _from_json_safe(self, value: Any) -> Any:
+        """Redisから読み出した値のdatetimeを復元"""
+        if isinstance(value, dict):
+            if len(value) == 1 and DATETIME_MARKER in value:
+                return datetime.fromisoformat(value[DATETIME_MARKER])
+            return {k: self._from_json_safe(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._from_json_safe(item) for item in value]
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        """コレクションごとのヒット率を取得"""
+        stats = {"entries": len(self._entries), "redis_backed": self.use_redis, "collections": {}}
+        for collection, counts in self.stats.items():
+            hits = counts["local_hits"] + counts["redis_hits"]
+            total = hits + counts["misses"]
+            stats["collections"][collection] = {
+                **counts,
+                "ttl_seconds": self.ttl_by_collection[collection],
+                "hit_rate": round(hits / total, 3) if total else None
+            }
+        return stats
@@ -3,28 +3,157 @@ Firestoreとの連携を行うサービスクラス
 """
 import os
 import json
+import time
 import uuid
+import asyncio
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from firebase_admin import firestore, credentials, initialize_app
+from firebase_admin import firestore, firestore_async, credentials, initialize_app
 import firebase_admin
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+from google.cloud.firestore_v1 import Increment
+from google.cloud.firestore_v1.async_transaction import async_transactional
 from google.cloud.firestore_v1.base_query import FieldFilter
+from geopy.distance import geodesic
 
+from app.config import get_settings
+from app.services import geohash
+from app.services.free_user_index import free_user_index
+from app.services.document_cache import DocumentCache
 from app.models import (
     Proposal, UserProposal, ProposalLocation, InvitedUser,
     ProposalBudget, ProposalCapacity, AIAnalysis, UserResponse,
     ResponseCount, ProposalSource, ProposalType, ProposalStatus,
-    UserResponseStatus, Priority, LocationData
+    UserResponseStatus, Priority, LocationData, ProposalJobStatus
 )
 
 
+# Firestoreの1バッチあたりの書き込み上限
+FIRESTORE_BATCH_LIMIT = 500
+
+RESPONSE_COUNT_STATUSES = ('accepted', 'declined', 'pending', 'maybe')
+
+# 提案生成で使用するlocationsドキュメントのフィールド
+LOCATION_FIELDS = ['coordinates', 'geohash', 'lastUpdate']
+
+# リードスルーキャッシュの対象（users: ユーザー情報, friends: 友人リスト, locations: 位置情報）
+DOCUMENT_CACHE_COLLECTIONS = ('users', 'friends', 'locations')
+
+# 提案生成の差分判定用の状態を保存するコレクション
+GENERATION_STATE_COLLECTION = 'proposalGenerationState'
+
+# AI提案生成ジョブの状態を保存するコレクション
+PROPOSAL_JOB_COLLECTION = 'proposalJobs'
+
+# 提案生成の実行（run）ごとの状態と、処理を完了したユーザー（サブコレクション）を保存するコレクション
+GENERATION_RUN_COLLECTION = 'proposalGenerationRuns'
+GENERATION_RUN_COMPLETED_USERS = 'completedUsers'
+GENERATION_RUN_GROUPS = 'groups'
+
+# 提案一覧表示用に取得するuserProposalのフィールド
+USER_PROPOSAL_SUMMARY_FIELDS = [
+    'proposal_id', 'title', 'type', 'category', 'status', 'proposal_status',
+    'is_read', 'priority', 'scheduled_at', 'location.name', 'response_count',
+    'expires_at', 'received_at', 'updated_at'
+]
+
+
+@async_transactional
+async def _apply_proposal_response(
+    transaction,
+    db,
+    proposal_ref,
+    user_uid: str,
+    response_field: str,
+    status: str,
+    responded_at: datetime
+) -> Optional[Tuple[List[str], Dict[str, int]]]:
+    """トランザクション内で1ユーザーの応答を反映し、対象ユーザーのuserProposalにも集計を書き込む
+    
+    responses全体を書き戻さず、フィールドパス更新とIncrementで該当箇所のみ変更する。
+    userProposalへの集計のコピーもトランザクション内で読んだ値で書き込むため、
+    同時応答で古い集計が後からコミットされて上書きすることはない（競合時はFirestoreが再試行する）。
+    """
+    snapshot = await proposal_ref.get(
+        field_paths=[response_field, 'response_count', 'target_users'],
+        transaction=transaction
+    )
+    if not snapshot.exists:
+        return None
+    
+    proposal_data = snapshot.to_dict() or {}
+    previous_status = (proposal_data.get('responses', {}).get(user_uid) or {}).get('status')
+    response_count = {key: 0 for key in RESPONSE_COUNT_STATUSES}
+    response_count.update(proposal_data.get('response_count') or {})
+    
+    # 書き込みの前に、存在するuserProposalを同じトランザクションで確認
+    target_users = proposal_data.get('target_users', [])
+    user_uids = list(dict.fromkeys(target_users + [user_uid]))
+    user_proposal_refs = {
+        uid: db.collection('users').document(uid).collection('userProposal').document(proposal_ref.id)
+        for uid in user_uids
+    }
+    existing_paths = set()
+    async for user_proposal in db.get_all(
+        list(user_proposal_refs.values()), field_paths=['proposal_id'], transaction=transaction
+    ):
+        if user_proposal.exists:
+            existing_paths.add(user_proposal.reference.path)
+    
+    updates = {
+        response_field: {
+            'status': status,
+            'responded_at': responded_at
+        },
+        'updated_at': responded_at
+    }
+    
+    if previous_status != status:
+        if status in RESPONSE_COUNT_STATUSES:
+            updates[f'response_count.{status}'] = Increment(1)
+            response_count[status] += 1
+        if previous_status in RESPONSE_COUNT_STATUSES:
+            updates[f'response_count.{previous_status}'] = Increment(-1)
+            response_count[previous_status] -= 1
+    
+    transaction.update(proposal_ref, updates)
+    
+    # 応答者のuserProposal（statusと既読）と全対象ユーザーのresponse_countを同期
+    for uid, user_proposal_ref in user_proposal_refs.items():
+        if user_proposal_ref.path not in existing_paths:
+            continue
+        user_proposal_update = {
+            'response_count': response_count,
+            'updated_at': responded_at
+        }
+        if uid == user_uid:
+            user_proposal_update.update({
+                'status': status,
+                'responded_at': responded_at,
+                'is_read': True  # 応答時に既読にする
+            })
+        transaction.update(user_proposal_ref, user_proposal_update)
+    
+    return target_users, response_count
+
+
 class FirestoreService:
     """Firestore連携サービス"""
     
     def __init__(self):
-        """Firestoreクライアントを初期化"""
+        """Firestoreクライアントを初期化（イベントループをブロックしない非同期クライアント）"""
+        self.settings = get_settings()
         self._init_firebase()
-        self.db = firestore.client()
+        self.db = firestore_async.client()
+        self.document_cache = DocumentCache(
+            {
+                'users': self.settings.FIRESTORE_CACHE_USER_TTL_SECONDS,
+                'friends': self.settings.FIRESTORE_CACHE_FRIENDS_TTL_SECONDS,
+                'locations': self.settings.FIRESTORE_CACHE_LOCATION_TTL_SECONDS
+            },
+            use_redis=self.settings.FIRESTORE_CACHE_USE_REDIS,
+            max_entries=self.settings.FIRESTORE_CACHE_MAX_ENTRIES
+        ) if self.settings.FIRESTORE_CACHE_ENABLED else None
     
     def _init_firebase(self):
         """Firebase Admin SDKを初期化"""
@@ -54,8 +183,27 @@ class FirestoreService:
             initialize_app(cred)
     
     async def get_active_users(self, location_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-        """アクティブなユーザーを取得"""
+        """アクティブなユーザーを取得
+        
+        location_filter: {"center": {"latitude": float, "longitude": float}, "radius_km": float}
+        （{"center_lat": float, "center_lng": float, "radius_km": float} も可）
+        指定時はlocationsのgeohashで範囲内のユーザーのみを読み込む。
+        空きユーザーインデックスが有効で同期済みの場合はそちらから取得する。
+        """
         try:
+            center, radius_km = None, None
+            if location_filter:
+                center, radius_km = self._parse_location_filter(location_filter)
+                if not center:
+                    print(f"⚠️ Invalid location filter ignored: {location_filter}")
+            
+            # スナップショットリスナーのインデックスが使える場合はクエリを発行しない
+            if free_user_index.is_ready:
+                return free_user_index.get_free_users(center, radius_km)
+            
+            if center:
+                return await self._get_active_users_near(center, radius_km)
+            
             users_ref = self.db.collection('users')
             
             # オンライン且つ'free'ステータスのユーザーを取得
@@ -63,15 +211,9 @@ class FirestoreService:
                              .where(filter=FieldFilter('isOnline', '==', True)) \
                              .where(filter=FieldFilter('currentStatus', '==', 'free'))
             
-            # 位置情報フィルターがある場合は適用
-            if location_filter:
-                # TODO: Geohashを使った位置フィルタリング実装
-                pass
-            
-            docs = query.stream()
             users = []
             
-            for doc in docs:
+            async for doc in query.stream():
                 user_data = doc.to_dict()
                 user_data['uid'] = doc.id
                 users.append(user_data)
@@ -82,123 +224,411 @@ class FirestoreService:
             print(f"❌ Error getting active users: {str(e)}")
             return []
     
+    def _parse_location_filter(self, location_filter: Dict[str, Any]) -> Tuple[Optional[Tuple[float, float]], float]:
+        """位置フィルターから中心座標と半径を取り出す"""
+        center = location_filter.get('center') or {}
+        latitude = center.get('latitude', center.get('lat', location_filter.get('center_lat')))
+        longitude = center.get('longitude', center.get('lng', location_filter.get('center_lng')))
+        radius_km = float(location_filter.get('radius_km') or self.settings.DEFAULT_SEARCH_RADIUS_KM)
+        
+        if not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+            return None, radius_km
+        return (float(latitude), float(longitude)), radius_km
+    
+    async def _get_active_users_near(self, center: Tuple[float, float], radius_km: float) -> List[Dict[str, Any]]:
+        """geohash範囲クエリで中心から半径内のアクティブユーザーを取得
+        
+        円を覆うgeohashプレフィックスごとの範囲クエリを並列に実行し、
+        正確な距離で絞り込んだ後にusersドキュメントをまとめて取得する。
+        """
+        prefixes = geohash.covering_prefixes(
+            center[0], center[1], radius_km, self.settings.LOCATION_GEOHASH_PRECISION
+        )
+        
+        async def query_prefix(prefix: str) -> List[Any]:
+            query = (self.db.collection('locations')
+                     .where(filter=FieldFilter('geohash', '>=', prefix))
+                     .where(filter=FieldFilter('geohash', '<', prefix + '\uf8ff'))
+                     .select(['coordinates']))
+            return [doc async for doc in query.stream()]
+        
+        location_pages = await asyncio.gather(*(query_prefix(prefix) for prefix in prefixes))
+        
+        distances = {}
+        for location_docs in location_pages:
+            for doc in location_docs:
+                coordinates = (doc.to_dict() or {}).get('coordinates') or {}
+                if 'lat' not in coordinates or 'lng' not in coordinates:
+                    continue
+                distance_km = geodesic(center, (coordinates['lat'], coordinates['lng'])).kilometers
+                if distance_km <= radius_km:
+                    distances[doc.id] = distance_km
+        
+        users = []
+        user_refs = [self.db.collection('users').document(uid) for uid in distances]
+        for start in range(0, len(user_refs), FIRESTORE_BATCH_LIMIT):
+            async for doc in self.db.get_all(user_refs[start:start + FIRESTORE_BATCH_LIMIT]):
+                if not doc.exists:
+                    continue
+                user_data = doc.to_dict()
+                if not (user_data.get('isActive') and user_data.get('isOnline')
+                        and user_data.get('currentStatus') == 'free'):
+                    continue
+                user_data['uid'] = doc.id
+                user_data['distance_km'] = round(distances[doc.id], 3)
+                users.append(user_data)
+        
+        print(f"📍 Location filter: {len(prefixes)} geohash ranges, "
+              f"{len(distances)} users within {radius_km}km, {len(users)} active")
+        return users
+    
+    async def backfill_location_geohashes(self, page_size: int = 300, dry_run: bool = False) -> Dict[str, Any]:
+        """geohashが未設定または精度が異なるlocationsドキュメントにgeohashを付与"""
+        precision = self.settings.LOCATION_GEOHASH_PRECISION
+        stats = {"scanned": 0, "updated": 0, "skipped": 0}
+        
+        base_query = self.db.collection('locations').order_by('__name__').select(['coordinates', 'geohash']).limit(page_size)
+        cursor_snapshot = None
+        
+        while True:
+            query = base_query.start_after(cursor_snapshot) if cursor_snapshot else base_query
+            page = [doc async for doc in query.stream()]
+            if not page:
+                break
+            
+            writes = []
+            for doc in page:
+                location_data = doc.to_dict() or {}
+                coordinates = location_data.get('coordinates') or {}
+                if 'lat' not in coordinates or 'lng' not in coordinates:
+                    stats["skipped"] += 1
+                    continue
+                
+                expected = geohash.encode(coordinates['lat'], coordinates['lng'], precision)
+                if location_data.get('geohash') != expected:
+                    writes.append((doc.reference, {'geohash': expected}))
+            
+            if writes and not dry_run:
+                await self._commit_in_batches(writes, operation='update')
+                for doc_ref, _ in writes:
+                    await self.invalidate_user_cache(doc_ref.id, ['locations'])
+            
+            stats["scanned"] += len(page)
+            stats["updated"] += len(writes)
+            cursor_snapshot = page[-1]
+            
+            if len(page) < page_size:
+                break
+        
+        print(f"✅ Location geohash backfill: {stats}")
+        return stats
+    
+    async def get_users_bulk(self, user_uids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """複数ユーザーのデータをget_allでまとめて取得（存在するユーザーのみ）"""
+        users = await self._get_documents_bulk('users', user_uids)
+        for uid, user_data in users.items():
+            user_data['uid'] = uid
+        return users
+    
+    async def get_user_locations_bulk(self, user_uids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """複数ユーザーの位置情報をget_allでまとめて取得（存在するもののみ）"""
+        return await self._get_documents_bulk('locations', user_uids, field_paths=LOCATION_FIELDS)
+    
+    async def get_user_friends_bulk(self, user_uids: List[str], max_concurrency: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        """複数ユーザーの友人リストを同時実行数を制限して並列に取得"""
+        semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+        
+        async def fetch(uid: str) -> Tuple[str, List[Dict[str, Any]]]:
+            async with semaphore:
+                return uid, await self.get_user_friends(uid)
+        
+        results = await asyncio.gather(*(fetch(uid) for uid in dict.fromkeys(user_uids)))
+        return dict(results)
+    
+    async def _get_documents_bulk(
+        self,
+        collection: str,
+        document_ids: List[str],
+        field_paths: Optional[List[str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """コレクション内の複数ドキュメントを上限件数ごとのget_allで取得
+        
+        キャッシュが有効な場合はキャッシュ済みのものを除いて取得し、
+        存在しなかったドキュメントも含めて結果をキャッシュする。
+        """
+        document_ids = list(dict.fromkeys(document_ids))
+        documents = {}
+        document_cache = self.document_cache if collection in DOCUMENT_CACHE_COLLECTIONS else None
+        
+        if document_cache:
+            cached = await document_cache.get_many(collection, document_ids)
+            documents = {doc_id: dict(data) for doc_id, data in cached.items() if data is not None}
+            document_ids = [doc_id for doc_id in document_ids if doc_id not in cached]
+        
+        if not document_ids:
+            return documents
+        
+        try:
+            fetched = {}
+            doc_refs = [self.db.collection(collection).document(doc_id) for doc_id in document_ids]
+            for start in range(0, len(doc_refs), FIRESTORE_BATCH_LIMIT):
+                async for doc in self.db.get_all(doc_refs[start:start + FIRESTORE_BATCH_LIMIT], field_paths=field_paths):
+                    fetched[doc.id] = doc.to_dict() if doc.exists else None
+            
+            if document_cache:
+                await document_cache.set_many(collection, fetched)
+            
+            documents.update({doc_id: dict(data) for doc_id, data in fetched.items() if data is not None})
+        
+        except Exception as e:
+            print(f"❌ Error getting {collection} documents in bulk: {str(e)}")
+        
+        return documents
+    
+    async def get_generation_states(self, user_uids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """前回の提案生成時の状態（フィンガープリント・生成した提案ID）をまとめて取得"""
+        return await self._get_documents_bulk(GENERATION_STATE_COLLECTION, user_uids)
+    
+    async def save_generation_states(self, states: Dict[str, Dict[str, Any]]) -> int:
+        """提案生成時の状態をバッチで保存"""
+        try:
+            writes = [(self.db.collection(GENERATION_STATE_COLLECTION).document(uid), state)
+                      for uid, state in states.items()]
+            return await self._commit_in_batches(writes)
+        
+        except Exception as e:
+            print(f"❌ Error saving generation states: {str(e)}")
+            return 0
+    
+    async def start_generation_run(self, run_id: str, run_data: Dict[str, Any]) -> bool:
+        """提案生成の実行を開始（同じrun_idでの再試行の場合は試行回数を加算）"""
+        try:
+            await self.db.collection(GENERATION_RUN_COLLECTION).document(run_id).set(
+                {**run_data, 'attempts': Increment(1)}, merge=True
+            )
+            return True
+        
+        except Exception as e:
+            print(f"❌ Error starting generation run {run_id}: {str(e)}")
+            return False
+    
+    async def update_generation_run(self, run_id: str, updates: Dict[str, Any]) -> bool:
+        """提案生成の実行の状態を更新"""
+        try:
+            await self.db.collection(GENERATION_RUN_COLLECTION).document(run_id).set(updates, merge=True)
+            return True
+        
+        except Exception as e:
+            print(f"❌ Error updating generation run {run_id}: {str(e)}")
+            return False
+    
+    async def get_generation_run_completed_users(
+        self, run_id: str, user_uids: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """指定した実行で処理を完了済みのユーザー（UID -> 生成した提案ID等）を取得"""
+        return await self._get_documents_bulk(
+            f"{GENERATION_RUN_COLLECTION}/{run_id}/{GENERATION_RUN_COMPLETED_USERS}", user_uids
+        )
+    
+    async def get_generation_run_groups(
+        self, run_id: str, user_uids: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """指定した実行で記録済みのグループ構成（UID -> メンバー一覧、先頭が代表ユーザー）を取得"""
+        return await self._get_documents_bulk(
+            f"{GENERATION_RUN_COLLECTION}/{run_id}/{GENERATION_RUN_GROUPS}", user_uids
+        )
+    
+    async def save_generation_run_groups(self, run_id: str, groups: List[List[str]]) -> bool:
+        """実行内のグループ構成をメンバーごとに記録（再試行時に同じグループ・提案IDで生成するため）"""
+        try:
+            run_groups = self.db.collection(GENERATION_RUN_COLLECTION).document(run_id).collection(
+                GENERATION_RUN_GROUPS
+            )
+            writes = [
+                (run_groups.document(uid), {'members': members})
+                for members in groups
+                for uid in members
+            ]
+            await self._commit_in_batches(writes)
+            return True
+        
+        except Exception as e:
+            print(f"❌ Error recording groups for generation run {run_id}: {str(e)}")
+            return False
+    
+    async def mark_generation_run_users_completed(
+        self, run_id: str, user_uids: List[str], proposal_ids: List[str]
+    ) -> bool:
+        """ユーザー（友人グループの場合はメンバー全員）の処理完了を記録"""
+        try:
+            completed_at = datetime.now()
+            completed_users = self.db.collection(GENERATION_RUN_COLLECTION).document(run_id).collection(
+                GENERATION_RUN_COMPLETED_USERS
+            )
+            writes = [
+                (completed_users.document(uid), {'proposal_ids': proposal_ids, 'completed_at': completed_at})
+                for uid in user_uids
+            ]
+            await self._commit_in_batches(writes)
+            return True
+        
+        except Exception as e:
+            print(f"❌ Error recording completed users for generation run {run_id}: {str(e)}")
+            return False
+    
+    async def get_existing_proposal_ids(self, proposal_ids: List[str]) -> set:
+        """指定した提案のうち、保存済みのものの提案IDを取得"""
+        proposals = await self._get_documents_bulk('proposals', proposal_ids, field_paths=['status'])
+        return set(proposals)
+    
+    async def get_active_proposal_ids(self, proposal_ids: List[str]) -> set:
+        """指定した提案のうち、activeかつ期限切れでないものの提案IDを取得"""
+        proposals = await self._get_documents_bulk('proposals', proposal_ids, field_paths=['status', 'expires_at'])
+        now = datetime.now()
+        
+        active_ids = set()
+        for proposal_id, proposal_data in proposals.items():
+            expires_at = proposal_data.get('expires_at')
+            if proposal_data.get('status') != ProposalStatus.ACTIVE.value or not expires_at:
+                continue
+            # 保存時のdatetime.now()はUTCとして扱われるため、タイムゾーンを外して比較する
+            if expires_at.replace(tzinfo=None) > now:
+                active_ids.add(proposal_id)
+        return active_ids
+    
     async def get_user_friends(self, user_uid: str) -> List[Dict[str, Any]]:
         """ユーザーの友人リストを取得"""
+        if self.document_cache:
+            found, cached_friends = await self.document_cache.get('friends', user_uid)
+            if found:
+                return [dict(friend) for friend in cached_friends]
+        
         try:
             friends_ref = self.db.collection('users').document(user_uid).collection('friendsList')
-            docs = friends_ref.stream()
-            
             friends = []
-            for doc in docs:
+            async for doc in friends_ref.stream():
                 friend_data = doc.to_dict()
                 friend_data['friendUid'] = doc.id
                 friends.append(friend_data)
             
+            if self.document_cache:
+                await self.document_cache.set('friends', user_uid, [dict(friend) for friend in friends])
+            
             return friends
         
         except Exception as e:
             print(f"❌ Error getting user friends: {str(e)}")
             return []
     
-    async def get_user_location(self, user_uid: str) -> Optional[Dict[str, Any]]:
-        """ユーザーの位置情報を取得"""
-        try:
-            location_doc = self.db.collection('locations').document(user_uid).get()
-            if location_doc.exists:
-                return location_doc.to_dict()
-            return None
+    async def invalidate_user_cache(self, user_uid: str, collections: Optional[List[str]] = None):
+        """ユーザー情報・友人リスト・位置情報のキャッシュを無効化
         
-        except Exception as e:
-            print(f"❌ Error getting user location: {str(e)}")
-            return None
+        外部（アプリやCloud Functions）での更新を即座に反映させたい場合に呼び出す。
+        """
+        if not self.document_cache:
+            return
+        for collection in collections or DOCUMENT_CACHE_COLLECTIONS:
+            if collection in DOCUMENT_CACHE_COLLECTIONS:
+                await self.document_cache.invalidate(collection, user_uid)
     
-    async def create_proposal(self, proposal: Proposal) -> bool:
-        """提案をFirestoreに保存"""
+    def get_document_cache_stats(self) -> Dict[str, Any]:
+        """ドキュメントキャッシュのコレクション別ヒット率を取得"""
+        if not self.document_cache:
+            return {"status": "disabled"}
+        return self.document_cache.get_stats()
+    
+    async def create_proposal_with_user_proposals(
+        self,
+        proposal: Proposal,
+        user_proposals: List[Tuple[str, UserProposal]]
+    ) -> bool:
+        """提案と全ユーザー個別提案をWriteBatchでまとめて保存
+        
+        500件以内であれば1回のコミットで全て書き込まれ、途中まで書かれた状態は残らない。
+        """
         try:
-            # proposalsコレクションに保存
             proposal_data = proposal.dict()
-            
-            # datetimeをFirestoreのTimestampに変換
             self._convert_datetime_to_timestamp(proposal_data)
             
-            # proposalを保存
-            self.db.collection('proposals').document(proposal.proposal_id).set(proposal_data)
+            writes = [(self.db.collection('proposals').document(proposal.proposal_id), proposal_data)]
+            writes.extend(self._user_proposal_write(user_uid, user_proposal)
+                          for user_uid, user_proposal in user_proposals)
             
-            print(f"✅ Proposal {proposal.proposal_id} created successfully")
+            await self._commit_in_batches(writes)
+            
+            print(f"✅ Proposal {proposal.proposal_id} created with {len(user_proposals)} user proposals")
             return True
         
         except Exception as e:
-            print(f"❌ Error creating proposal: {str(e)}")
+            print(f"❌ Error creating proposal with user proposals: {str(e)}")
             return False
     
-    async def create_user_proposals(self, user_proposals: List[Tuple[str, UserProposal]]) -> int:
-        """ユーザー個別提案をFirestoreに保存"""
-        success_count = 0
+    def _user_proposal_write(self, user_uid: str, user_proposal: UserProposal) -> Tuple[Any, Dict[str, Any]]:
+        """userProposalサブコレクションへの書き込み対象を構築"""
+        user_proposal_data = user_proposal.dict()
         
-        try:
-            for user_uid, user_proposal in user_proposals:
-                user_proposal_data = user_proposal.dict()
-                
-                # datetimeをFirestoreのTimestampに変換
-                self._convert_datetime_to_timestamp(user_proposal_data)
-                
-                # userProposalサブコレクションに保存
-                user_ref = self.db.collection('users').document(user_uid)
-                user_ref.collection('userProposal').document(user_proposal.proposal_id).set(user_proposal_data)
-                
-                success_count += 1
-            
-            print(f"✅ {success_count} user proposals created successfully")
-            return success_count
+        # datetimeをFirestoreのTimestampに変換
+        self._convert_datetime_to_timestamp(user_proposal_data)
         
-        except Exception as e:
-            print(f"❌ Error creating user proposals: {str(e)}")
-            return success_count
+        user_proposal_ref = (self.db.collection('users').document(user_uid)
+                             .collection('userProposal').document(user_proposal.proposal_id))
+        return user_proposal_ref, user_proposal_data
+    
+    async def _commit_in_batches(
+        self,
+        writes: List[Tuple[Any, Dict[str, Any]]],
+        operation: str = 'set',
+        max_concurrency: int = 1
+    ) -> int:
+        """(DocumentReference, data) のリストを上限件数ごとのWriteBatchでset/updateする
+        
+        max_concurrencyが2以上の場合は複数バッチを並列にコミットする。
+        """
+        semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+        
+        async def commit_chunk(chunk: List[Tuple[Any, Dict[str, Any]]]) -> int:
+            async with semaphore:
+                batch = self.db.batch()
+                for doc_ref, data in chunk:
+                    if operation == 'update':
+                        batch.update(doc_ref, data)
+                    else:
+                        batch.set(doc_ref, data)
+                await batch.commit()
+                return len(chunk)
+        
+        chunks = [writes[start:start + FIRESTORE_BATCH_LIMIT]
+                  for start in range(0, len(writes), FIRESTORE_BATCH_LIMIT)]
+        if max_concurrency <= 1:
+            committed = 0
+            for chunk in chunks:
+                committed += await commit_chunk(chunk)
+            return committed
+        
+        results = await asyncio.gather(*(commit_chunk(chunk) for chunk in chunks))
+        return sum(results)
     
     async def update_proposal_response(self, user_uid: str, proposal_id: str, response_status: UserResponseStatus) -> bool:
         """ユーザーの提案応答を更新"""
         try:
-            # 元のproposalを取得・更新
             proposal_ref = self.db.collection('proposals').document(proposal_id)
-            proposal_doc = proposal_ref.get()
+            responded_at = datetime.now()
             
-            if not proposal_doc.exists:
+            # proposalの応答・集計と、userProposalへの集計のコピーを1つのトランザクションで更新
+            result = await _apply_proposal_response(
+                self.db.transaction(),
+                self.db,
+                proposal_ref,
+                user_uid,
+                self.db.field_path('responses', user_uid),
+                response_status.value,
+                responded_at
+            )
+            
+            if result is None:
                 print(f"❌ Proposal {proposal_id} not found")
                 return False
             
-            proposal_data = proposal_doc.to_dict()
-            
-            # responses辞書を更新
-            responses = proposal_data.get('responses', {})
-            responses[user_uid] = {
-                'status': response_status.value,
-                'responded_at': datetime.now()
-            }
-            
-            # response_countを更新
-            response_count = self._calculate_response_count(responses)
-            
-            proposal_ref.update({
-                'responses': responses,
-                'response_count': response_count,
-                'updated_at': datetime.now()
-            })
-            
-            # userProposalを更新（statusと新しいresponse_countを含む）
-            user_proposal_ref = (self.db.collection('users').document(user_uid)
-                               .collection('userProposal').document(proposal_id))
-            
-            user_proposal_ref.update({
-                'status': response_status.value,
-                'responded_at': datetime.now(),
-                'updated_at': datetime.now(),
-                'response_count': response_count,  # 最新のresponse_countを同期
-                'is_read': True  # 応答時に既読にする
-            })
-            
-            # 全ての対象ユーザーのuserProposalでresponse_countを同期
-            await self._sync_response_count_to_user_proposals(proposal_id, proposal_data.get('target_users', []), response_count)
-            
             print(f"✅ Proposal response updated: {user_uid} -> {proposal_id} ({response_status.value})")
             return True
         
@@ -206,51 +636,61 @@ class FirestoreService:
             print(f"❌ Error updating proposal response: {str(e)}")
             return False
     
-    async def _sync_response_count_to_user_proposals(self, proposal_id: str, target_users: List[str], response_count: dict):
-        """全ての対象ユーザーのuserProposalにresponse_countを同期"""
-        try:
-            for target_user_uid in target_users:
-                user_proposal_ref = (self.db.collection('users').document(target_user_uid)
-                                   .collection('userProposal').document(proposal_id))
-                
-                # userProposalが存在する場合のみ更新
-                user_proposal_doc = user_proposal_ref.get()
-                if user_proposal_doc.exists:
-                    user_proposal_ref.update({
-                        'response_count': response_count,
-                        'updated_at': datetime.now()
-                    })
-            
-            print(f"✅ Response count synced to user proposals for proposal {proposal_id}")
+    async def get_user_proposals(
+        self,
+        user_uid: str,
+        limit: int = 10,
+        start_after: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        updated_since: Optional[datetime] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """ユーザーの提案を取得
         
-        except Exception as e:
-            print(f"❌ Error syncing response count to user proposals: {str(e)}")
-    
-    async def get_user_proposals(self, user_uid: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """ユーザーの提案を取得"""
+        start_after: 前ページ最後の提案ID（カーソル）
+        fields: 取得するフィールド（一覧表示用の射影）
+        updated_since: 指定日時以降に更新された提案のみ（updated_atの降順）
+        戻り値は (提案リスト, 次ページのカーソル)
+        """
         try:
-            user_proposals_ref = (self.db.collection('users').document(user_uid)
-                                .collection('userProposal')
-                                .order_by('received_at', direction=firestore.Query.DESCENDING)
-                                .limit(limit))
+            user_proposals_ref = self.db.collection('users').document(user_uid).collection('userProposal')
+            
+            if updated_since:
+                query = (user_proposals_ref
+                         .where(filter=FieldFilter('updated_at', '>', updated_since))
+                         .order_by('updated_at', direction=firestore.Query.DESCENDING))
+            else:
+                query = user_proposals_ref.order_by('received_at', direction=firestore.Query.DESCENDING)
+            
+            if fields:
+                # カーソルとして使えるよう提案IDは常に含める
+                query = query.select(list(dict.fromkeys(['proposal_id'] + fields)))
+            
+            if start_after:
+                cursor_snapshot = await user_proposals_ref.document(start_after).get()
+                if cursor_snapshot.exists:
+                    query = query.start_after(cursor_snapshot)
+                else:
+                    print(f"⚠️ Cursor proposal {start_after} not found for user {user_uid}")
             
-            docs = user_proposals_ref.stream()
             proposals = []
+            last_doc_id = None
             
-            for doc in docs:
+            async for doc in query.limit(limit).stream():
                 proposal_data = doc.to_dict()
                 proposals.append(proposal_data)
+                last_doc_id = doc.id
             
-            return proposals
+            next_cursor = last_doc_id if len(proposals) == limit else None
+            return proposals, next_cursor
         
         except Exception as e:
             print(f"❌ Error getting user proposals: {str(e)}")
-            return []
+            return [], None
     
     async def get_proposal_details(self, proposal_id: str) -> Optional[Dict[str, Any]]:
         """提案の詳細を取得"""
         try:
-            proposal_doc = self.db.collection('proposals').document(proposal_id).get()
+            proposal_doc = await self.db.collection('proposals').document(proposal_id).get()
             if proposal_doc.exists:
                 return proposal_doc.to_dict()
             return None
@@ -259,6 +699,75 @@ class FirestoreService:
             print(f"❌ Error getting proposal details: {str(e)}")
             return None
     
+    async def claim_proposal_job(self, job_id: str, job_data: Dict[str, Any], stale_seconds: int) -> bool:
+        """提案生成ジョブを作成（既存の場合は失敗済み・停止中のものだけ引き継ぐ）
+        
+        同じジョブIDでの再試行が並行しても、実行を開始できるのは1つだけになる。
+        """
+        job_ref = self.db.collection(PROPOSAL_JOB_COLLECTION).document(job_id)
+        try:
+            await job_ref.create(job_data)
+            return True
+        except AlreadyExists:
+            pass
+        
+        snapshot = await job_ref.get()
+        if not snapshot.exists:
+            return False
+        
+        job = snapshot.to_dict()
+        status = job.get('status')
+        updated_at = job.get('updated_at')
+        is_stale = (
+            status in (ProposalJobStatus.QUEUED.value, ProposalJobStatus.RUNNING.value)
+            and updated_at is not None
+            and (datetime.now() - updated_at.replace(tzinfo=None)).total_seconds() > stale_seconds
+        )
+        if status != ProposalJobStatus.FAILED.value and not is_stale:
+            return False
+        
+        try:
+            # 読み取り後に他の再試行が引き継いでいないことを条件に更新
+            await job_ref.update(job_data, option=self.db.write_option(last_update_time=snapshot.update_time))
+            print(f"🔁 Restarting proposal job {job_id} (previous status: {status})")
+            return True
+        except FailedPrecondition:
+            return False
+    
+    async def get_proposal_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """提案生成ジョブの状態を取得"""
+        try:
+            job_doc = await self.db.collection(PROPOSAL_JOB_COLLECTION).document(job_id).get()
+            if job_doc.exists:
+                return job_doc.to_dict()
+            return None
+        
+        except Exception as e:
+            print(f"❌ Error getting proposal job {job_id}: {str(e)}")
+            return None
+    
+    async def get_proposal_jobs_by_shard_group(self, shard_group: str) -> Dict[str, Dict[str, Any]]:
+        """同じシャードグループの提案生成ジョブを取得（ジョブID -> ジョブデータ）"""
+        try:
+            query = self.db.collection(PROPOSAL_JOB_COLLECTION).where(
+                filter=FieldFilter('shard_group', '==', shard_group)
+            )
+            return {job_doc.id: job_doc.to_dict() async for job_doc in query.stream()}
+        
+        except Exception as e:
+            print(f"❌ Error getting proposal jobs for shard group {shard_group}: {str(e)}")
+            return {}
+    
+    async def update_proposal_job(self, job_id: str, updates: Dict[str, Any]) -> bool:
+        """提案生成ジョブの状態・進捗を更新"""
+        try:
+            await self.db.collection(PROPOSAL_JOB_COLLECTION).document(job_id).update(updates)
+            return True
+        
+        except Exception as e:
+            print(f"❌ Error updating proposal job {job_id}: {str(e)}")
+            return False
+    
     def _convert_datetime_to_timestamp(self, data: Dict[str, Any]):
         """辞書内のdatetimeオブジェクトをFirestoreのTimestampに変換（再帰的）"""
         for key, value in data.items():
@@ -273,49 +782,147 @@ class FirestoreService:
                     elif isinstance(item, datetime):
                         value[i] = item
     
-    def _calculate_response_count(self, responses: Dict[str, Dict]) -> Dict[str, int]:
-        """応答状況を集計"""
-        count = {
-            'accepted': 0,
-            'declined': 0,
-            'pending': 0,
-            'maybe': 0
-        }
+    async def cleanup_expired_proposals(
+        self,
+        page_size: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        resume: bool = True
+    ) -> Dict[str, Any]:
+        """期限切れの提案をページ単位でクリーンアップ
         
-        for response in responses.values():
-            status = response.get('status', 'pending')
-            if status in count:
-                count[status] += 1
+        expires_at順にページングし、各ページのproposalと対応するuserProposalを
+        バッチ書き込みでexpiredにする。ページごとに maintenanceRuns/cleanup_expired_proposals
+        へ進捗を保存するため、途中で失敗・打ち切りになっても次回は続きから再開する。
+        """
+        start_time = time.time()
+        page_size = page_size or self.settings.PROPOSAL_CLEANUP_PAGE_SIZE
+        max_concurrency = self.settings.PROPOSAL_CLEANUP_MAX_CONCURRENT_BATCHES
+        checkpoint_ref = self.db.collection('maintenanceRuns').document('cleanup_expired_proposals')
+        
+        stats = {
+            "cleanup_count": 0,
+            "user_proposals_expired": 0,
+            "pages": 0,
+            "completed": False,
+            "resumed": False
+        }
         
-        return count
-    
-    async def cleanup_expired_proposals(self) -> int:
-        """期限切れの提案をクリーンアップ"""
         try:
-            now = datetime.now()
-            proposals_ref = self.db.collection('proposals')
+            checkpoint_doc = await checkpoint_ref.get()
+            checkpoint = checkpoint_doc.to_dict() if checkpoint_doc.exists else {}
             
-            # 期限切れの提案を取得
-            expired_query = proposals_ref.where(filter=FieldFilter('expires_at', '<', now)) \
-                                       .where(filter=FieldFilter('status', '==', 'active'))
+            cursor_snapshot = None
+            if resume and checkpoint.get('state') == 'running' and checkpoint.get('cursor_proposal_id'):
+                # 前回の続きから再開（同じ基準時刻で対象を揃える）
+                cutoff = checkpoint['cutoff']
+                cursor_snapshot = await (self.db.collection('proposals')
+                                         .document(checkpoint['cursor_proposal_id']).get())
+                if not cursor_snapshot.exists:
+                    cursor_snapshot = None
+                stats["resumed"] = True
+                print(f"🔁 Resuming expired proposals cleanup after {checkpoint['cursor_proposal_id']}")
+            else:
+                cutoff = datetime.now()
+                await checkpoint_ref.set({
+                    'state': 'running',
+                    'cutoff': cutoff,
+                    'cursor_proposal_id': None,
+                    'run_started_at': cutoff,
+                    'proposals_expired': 0,
+                    'user_proposals_expired': 0,
+                    'updated_at': cutoff
+                })
             
-            expired_docs = expired_query.stream()
-            cleanup_count = 0
+            base_query = (self.db.collection('proposals')
+                          .where(filter=FieldFilter('expires_at', '<', cutoff))
+                          .where(filter=FieldFilter('status', '==', 'active'))
+                          .order_by('expires_at')
+                          .select(['expires_at', 'target_users'])
+                          .limit(page_size))
             
-            for doc in expired_docs:
-                # ステータスを'expired'に更新
-                doc.reference.update({
-                    'status': 'expired',
-                    'updated_at': now
+            while True:
+                query = base_query.start_after(cursor_snapshot) if cursor_snapshot else base_query
+                page = [doc async for doc in query.stream()]
+                if not page:
+                    stats["completed"] = True
+                    break
+                
+                user_proposals_expired = await self._expire_proposal_page(page, max_concurrency)
+                
+                stats["pages"] += 1
+                stats["cleanup_count"] += len(page)
+                stats["user_proposals_expired"] += user_proposals_expired
+                cursor_snapshot = page[-1]
+                
+                await checkpoint_ref.update({
+                    'cursor_proposal_id': cursor_snapshot.id,
+                    'proposals_expired': Increment(len(page)),
+                    'user_proposals_expired': Increment(user_proposals_expired),
+                    'updated_at': datetime.now()
+                })
+                
+                if len(page) < page_size:
+                    stats["completed"] = True
+                    break
+                if max_pages and stats["pages"] >= max_pages:
+                    break
+            
+            if stats["completed"]:
+                await checkpoint_ref.update({
+                    'state': 'completed',
+                    'cursor_proposal_id': None,
+                    'last_completed_at': datetime.now(),
+                    'updated_at': datetime.now()
                 })
-                cleanup_count += 1
             
-            print(f"✅ Cleaned up {cleanup_count} expired proposals")
-            return cleanup_count
-        
         except Exception as e:
+            # チェックポイントは最後に成功したページのまま残るため、次回はそこから再開する
             print(f"❌ Error cleaning up expired proposals: {str(e)}")
-            return 0
+            stats["error"] = str(e)
+        
+        elapsed = time.time() - start_time
+        stats["processing_time_ms"] = int(elapsed * 1000)
+        stats["proposals_per_second"] = round(stats["cleanup_count"] / elapsed, 1) if elapsed > 0 else None
+        
+        print(f"✅ Cleaned up {stats['cleanup_count']} expired proposals "
+              f"({stats['user_proposals_expired']} user proposals, {stats['pages']} pages, "
+              f"{stats['proposals_per_second']}/s)")
+        return stats
+    
+    async def _expire_proposal_page(self, page: List[Any], max_concurrency: int) -> int:
+        """1ページ分のproposalとuserProposalをexpiredに更新し、更新したuserProposal数を返す
+        
+        userProposalを先に更新し、proposalは最後に更新する。途中で失敗した場合でも
+        proposalはactiveのまま残るため、次回の実行で取りこぼさない。
+        """
+        now = datetime.now()
+        
+        user_proposal_refs = []
+        for doc in page:
+            for uid in dict.fromkeys((doc.to_dict() or {}).get('target_users', [])):
+                user_proposal_refs.append(
+                    self.db.collection('users').document(uid).collection('userProposal').document(doc.id)
+                )
+        
+        # 存在確認の読み取りも書き込みと同じ上限件数ごとに分ける
+        user_proposal_writes = []
+        for start in range(0, len(user_proposal_refs), FIRESTORE_BATCH_LIMIT):
+            async for snapshot in self.db.get_all(
+                user_proposal_refs[start:start + FIRESTORE_BATCH_LIMIT], field_paths=['proposal_id']
+            ):
+                if snapshot.exists:
+                    user_proposal_writes.append((snapshot.reference, {
+                        'proposal_status': ProposalStatus.EXPIRED.value,
+                        'updated_at': now
+                    }))
+        
+        await self._commit_in_batches(user_proposal_writes, operation='update', max_concurrency=max_concurrency)
+        
+        proposal_writes = [(doc.reference, {'status': ProposalStatus.EXPIRED.value, 'updated_at': now})
+                           for doc in page]
+        await self._commit_in_batches(proposal_writes, operation='update', max_concurrency=max_concurrency)
+        
+        return len(user_proposal_writes)
 
 
 # シングルトンインスタンス
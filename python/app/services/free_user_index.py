@@ -0,0 +1,292 @@
+"""
+空いているユーザーのインメモリインデックス
+usersクエリ（active・online・free）と、空いているユーザーのlocationsだけにon_snapshotリスナーを張り、
+提案生成時にFirestoreへ問い合わせずに対象ユーザーを取得できるようにする
+"""
+import asyncio
+import functools
+import threading
+import time
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
+from geopy.distance import geodesic
+
+from app.config import get_settings
+from app.services import geohash
+
+
+# locationsリスナー1つあたりのユーザー数（Firestoreの in クエリの上限）
+LOCATION_WATCH_CHUNK_SIZE = 30
+
+
+class FreeUserIndex:
+    """スナップショットリスナーで維持する空きユーザーのインデックス
+
+    locationsは空いているユーザーのUIDを in クエリのチャンクに分けて監視し、
+    空きユーザーが変わったときは該当するチャンクのリスナーだけを張り直す。
+    リスナーのコールバックは別スレッドで呼ばれるため、内部状態はロックで保護する。
+    リスナーが停止した場合は監視タスクが張り直し、初回スナップショットで全件を再構築する。
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._lock = threading.Lock()
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._locations: Dict[str, Tuple[float, float, Optional[str]]] = {}
+        self._users_watch = None
+        self._location_watches: Dict[frozenset, Any] = {}
+        # 初回スナップショットをまだ受け取っていないlocationsリスナーのチャンク
+        self._pending_location_chunks: Set[frozenset] = set()
+        self._users_synced = False
+        self._locations_synced = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._free_users_changed: Optional[asyncio.Event] = None
+        self._monitor_task: Optional[asyncio.Task] = None
+        self._location_sync_task: Optional[asyncio.Task] = None
+        self.stats = {
+            "snapshots": 0,
+            "resyncs": 0,
+            "location_watch_rebuilds": 0,
+            "last_snapshot_at": None
+        }
+
+    @property
+    def is_ready(self) -> bool:
+        """usersの初回スナップショットと、空きユーザーのlocationsの全チャンクの初回スナップショットが揃っているか"""
+        return self._users_synced and self._locations_synced
+
+    def start(self):
+        """リスナーと監視タスクを開始（Firebase Admin SDKは初期化済みであること）"""
+        self._loop = asyncio.get_running_loop()
+        self._free_users_changed = asyncio.Event()
+        self._start_listeners()
+        self._monitor_task = asyncio.create_task(self._monitor())
+        self._location_sync_task = asyncio.create_task(self._sync_location_watches_loop())
+        print("✅ Free user index listeners started")
+
+    async def stop(self):
+        """リスナーと監視タスクを停止"""
+        for task in (self._monitor_task, self._location_sync_task):
+            if task:
+                task.cancel()
+        self._monitor_task = None
+        self._location_sync_task = None
+        self._stop_listeners()
+        print("Free user index listeners stopped")
+
+    def _start_listeners(self):
+        db = firestore.client()
+        with self._lock:
+            self._users_synced = False
+            self._locations_synced = False
+
+        users_query = (db.collection('users')
+                       .where(filter=FieldFilter('isActive', '==', True))
+                       .where(filter=FieldFilter('isOnline', '==', True))
+                       .where(filter=FieldFilter('currentStatus', '==', 'free')))
+        self._users_watch = users_query.on_snapshot(self._on_users_snapshot)
+
+    def _stop_listeners(self):
+        watches = [self._users_watch] + list(self._location_watches.values())
+        for watch in watches:
+            if watch is not None:
+                try:
+                    watch.unsubscribe()
+                except Exception as e:
+                    print(f"⚠️ Error stopping snapshot listener: {str(e)}")
+        self._users_watch = None
+        self._location_watches = {}
+        with self._lock:
+            self._locations = {}
+            self._pending_location_chunks = set()
+
+    async def _monitor(self):
+        """リスナーが停止していないか定期的に確認し、停止していれば張り直す"""
+        while True:
+            await asyncio.sleep(self.settings.FREE_USER_INDEX_RESYNC_INTERVAL_SECONDS)
+            watches = [self._users_watch] + list(self._location_watches.values())
+            if all(watch is not None and watch.is_active for watch in watches):
+                continue
+
+            print("⚠️ Free user index listener is inactive. Resyncing...")
+            self.stats["resyncs"] += 1
+            try:
+                self._stop_listeners()
+                self._start_listeners()
+            except Exception as e:
+                print(f"❌ Failed to restart free user index listeners: {str(e)}")
+
+    async def _sync_location_watches_loop(self):
+        """空きユーザーが変わるたびにlocationsのリスナーを更新（短時間の変更はまとめて反映）"""
+        while True:
+            await self._free_users_changed.wait()
+            await asyncio.sleep(1)
+            self._free_users_changed.clear()
+            try:
+                self._sync_location_watches()
+            except Exception as e:
+                print(f"❌ Failed to update location listeners: {str(e)}")
+
+    def _sync_location_watches(self):
+        """空きユーザーが抜けた・増えたチャンクだけlocationsのリスナーを張り直す"""
+        with self._lock:
+            free_uids = set(self._users)
+            # 空きでなくなったユーザーの位置は保持しない
+            for uid in [uid for uid in self._locations if uid not in free_uids]:
+                del self._locations[uid]
+
+        unassigned: Set[str] = set(free_uids)
+        for chunk in list(self._location_watches):
+            remaining = chunk & free_uids
+            unassigned -= chunk
+            if remaining == chunk:
+                continue
+            self._remove_location_watch(chunk)
+            unassigned |= remaining
+
+        # 入れ替わりで小さなチャンクが増えすぎた場合は全体を詰め直す
+        required_chunks = -(-len(free_uids) // LOCATION_WATCH_CHUNK_SIZE)
+        if len(self._location_watches) > required_chunks * 2:
+            for chunk in list(self._location_watches):
+                self._remove_location_watch(chunk)
+            unassigned = set(free_uids)
+
+        if unassigned:
+            db = firestore.client()
+            pending = sorted(unassigned)
+            for start in range(0, len(pending), LOCATION_WATCH_CHUNK_SIZE):
+                chunk = frozenset(pending[start:start + LOCATION_WATCH_CHUNK_SIZE])
+                query = db.collection('locations').where(filter=FieldFilter(
+                    FieldPath.document_id(), 'in', [db.collection('locations').document(uid) for uid in chunk]
+                ))
+                with self._lock:
+                    self._pending_location_chunks.add(chunk)
+                self._location_watches[chunk] = query.on_snapshot(
+                    functools.partial(self._on_locations_snapshot, chunk)
+                )
+            self.stats["location_watch_rebuilds"] += 1
+
+        with self._lock:
+            self._update_locations_synced()
+
+    def _remove_location_watch(self, chunk: frozenset):
+        self._location_watches.pop(chunk).unsubscribe()
+        with self._lock:
+            self._pending_location_chunks.discard(chunk)
+
+    def _update_locations_synced(self):
+        """初回構築（再接続後を含む）では全チャンクの初回スナップショットが届いた時点で同期済みとする
+
+        同期済みになった後に空きユーザーが増えた場合は、追加したチャンクの到着を待たずに提供を続ける。
+        """
+        if self._users_synced and not self._pending_location_chunks:
+            self._locations_synced = True
+
+    def _on_users_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            if not self._users_synced:
+                # 初回（再接続後を含む）はスナップショット全体で置き換える
+                self._users = {doc.id: doc.to_dict() for doc in docs}
+                self._users_synced = True
+                free_users_changed = True
+            else:
+                free_users_changed = False
+                for change in changes:
+                    if change.type.name == 'REMOVED':
+                        self._users.pop(change.document.id, None)
+                        free_users_changed = True
+                    else:
+                        free_users_changed |= change.document.id not in self._users
+                        self._users[change.document.id] = change.document.to_dict()
+            self._record_snapshot()
+
+        if free_users_changed and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._free_users_changed.set)
+
+    def _on_locations_snapshot(self, chunk, docs, changes, read_time):
+        # 初回スナップショットでもchangesに全件がADDEDとして含まれる
+        with self._lock:
+            first_snapshot = chunk in self._pending_location_chunks
+            self._pending_location_chunks.discard(chunk)
+            for change in changes:
+                uid = change.document.id
+                if change.type.name == 'REMOVED' or uid not in self._users:
+                    self._locations.pop(uid, None)
+                else:
+                    self._store_location(uid, change.document.to_dict())
+            # 張り直し前の古いリスナーからの通知では同期済みにしない
+            if first_snapshot:
+                self._update_locations_synced()
+            self._record_snapshot()
+
+    def _store_location(self, uid: str, location_data: Optional[Dict[str, Any]]):
+        coordinates = (location_data or {}).get('coordinates') or {}
+        if 'lat' not in coordinates or 'lng' not in coordinates:
+            self._locations.pop(uid, None)
+            return
+        self._locations[uid] = (
+            coordinates['lat'],
+            coordinates['lng'],
+            location_data.get('geohash') or geohash.encode(
+                coordinates['lat'], coordinates['lng'], self.settings.LOCATION_GEOHASH_PRECISION
+            )
+        )
+
+    def _record_snapshot(self):
+        self.stats["snapshots"] += 1
+        self.stats["last_snapshot_at"] = time.time()
+
+    def get_free_users(
+        self,
+        center: Optional[Tuple[float, float]] = None,
+        radius_km: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """空いているユーザーを取得（centerを指定した場合は半径内のみ、距離付き）"""
+        with self._lock:
+            users = {uid: dict(user_data) for uid, user_data in self._users.items()}
+            locations = dict(self._locations)
+
+        if center is None:
+            result = []
+            for uid, user_data in users.items():
+                user_data['uid'] = uid
+                if uid in locations:
+                    user_data['geocell'] = locations[uid][2]
+                result.append(user_data)
+            return result
+
+        prefixes = tuple(geohash.covering_prefixes(
+            center[0], center[1], radius_km, self.settings.LOCATION_GEOHASH_PRECISION
+        ))
+        result = []
+        for uid, user_data in users.items():
+            location = locations.get(uid)
+            if not location or not location[2] or not location[2].startswith(prefixes):
+                continue
+            distance_km = geodesic(center, (location[0], location[1])).kilometers
+            if distance_km > radius_km:
+                continue
+            user_data['uid'] = uid
+            user_data['geocell'] = location[2]
+            user_data['distance_km'] = round(distance_km, 3)
+            result.append(user_data)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """インデックスの状態を取得"""
+        with self._lock:
+            return {
+                "ready": self.is_ready,
+                "free_users": len(self._users),
+                "locations": len(self._locations),
+                "location_watches": len(self._location_watches),
+                "pending_location_watches": len(self._pending_location_chunks),
+                **self.stats
+            }
+
+
+# シングルトンインスタンス
+free_user_index = FreeUserIndex()
@@ -0,0 +1,162 @@
+"""
+Geohashによる位置の量子化ユーティリティ
+キャッシュキーのジオセルや位置インデックスに使用
+"""
+import math
+from typing import List, Tuple
+
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+BASE32_INDEX = {char: index for index, char in enumerate(BASE32)}
+
+KM_PER_DEGREE_LAT = 111.32
+
+
+def encode(latitude: float, longitude: float, precision: int = 7) -> str:
+    """緯度経度をGeohash文字列に変換"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even_bit = True
+
+    while len(geohash) < precision:
+        if even_bit:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits = bits << 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+
+        even_bit = not even_bit
+        bit_count += 1
+
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(geohash)
+
+
+def decode_bbox(geohash: str) -> Tuple[float, float, float, float]:
+    """Geohashのセル範囲を (min_lat, min_lng, max_lat, max_lng) で取得"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even_bit = True
+
+    for char in geohash:
+        index = BASE32_INDEX[char]
+        for shift in range(4, -1, -1):
+            bit = (index >> shift) & 1
+            if even_bit:
+                mid = (lng_range[0] + lng_range[1]) / 2
+                if bit:
+                    lng_range[0] = mid
+                else:
+                    lng_range[1] = mid
+            else:
+                mid = (lat_range[0] + lat_range[1]) / 2
+                if bit:
+                    lat_range[0] = mid
+                else:
+                    lat_range[1] = mid
+            even_bit = not even_bit
+
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def decode(geohash: str) -> Tuple[float, float]:
+    """Geohashのセル中心の緯度経度を取得"""
+    min_lat, min_lng, max_lat, max_lng = decode_bbox(geohash)
+    return (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+
+
+def neighbors(geohash: str) -> List[str]:
+    """隣接する8セルのGeohashを取得（極付近ではセル数が減る）"""
+    min_lat, min_lng, max_lat, max_lng = decode_bbox(geohash)
+    lat_step = max_lat - min_lat
+    lng_step = max_lng - min_lng
+    center_lat = (min_lat + max_lat) / 2
+    center_lng = (min_lng + max_lng) / 2
+
+    cells = []
+    for d_lat in (-1, 0, 1):
+        for d_lng in (-1, 0, 1):
+            if d_lat == 0 and d_lng == 0:
+                continue
+            latitude = center_lat + d_lat * lat_step
+            if not -90.0 < latitude < 90.0:
+                continue
+            longitude = (center_lng + d_lng * lng_step + 180.0) % 360.0 - 180.0
+            cell = encode(latitude, longitude, len(geohash))
+            if cell != geohash and cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """指定精度のセルの (緯度方向の高さ, 経度方向の幅) を度で取得"""
+    bits = precision * 5
+    lat_bits = bits // 2
+    lng_bits = bits - lat_bits
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def covering_prefixes(
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    max_precision: int = 6,
+    max_cells: int = 24
+) -> List[str]:
+    """中心から半径radius_kmの円を覆うGeohashプレフィックスを取得
+
+    セル数がmax_cells以下に収まる最も細かい精度（max_precision以下）を選び、
+    円と交差するセルだけを返す。セルは円より広い範囲を含むため、呼び出し側で正確な距離で絞り込むこと。
+    """
+    lat_delta = radius_km / KM_PER_DEGREE_LAT
+    lng_delta = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(latitude)), 0.01))
+    min_lat, max_lat = max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0)
+    min_lng, max_lng = longitude - lng_delta, longitude + lng_delta
+
+    for precision in range(max(max_precision, 1), 0, -1):
+        cell_height, cell_width = cell_size(precision)
+        lat_indexes = range(int((min_lat + 90.0) // cell_height), int((max_lat + 90.0) // cell_height) + 1)
+        lng_indexes = range(int((min_lng + 180.0) // cell_width), int((max_lng + 180.0) // cell_width) + 1)
+        if len(lat_indexes) * len(lng_indexes) > max_cells and precision > 1:
+            continue
+
+        cells = []
+        for lat_index in lat_indexes:
+            cell_min_lat = -90.0 + lat_index * cell_height
+            for lng_index in lng_indexes:
+                cell_min_lng = -180.0 + lng_index * cell_width
+                # セル内で中心に最も近い点が半径外なら、そのセルは円と交差しない
+                nearest_lat = min(max(latitude, cell_min_lat), cell_min_lat + cell_height)
+                nearest_lng = min(max(longitude, cell_min_lng), cell_min_lng + cell_width)
+                distance_km = math.hypot(
+                    (nearest_lat - latitude) * KM_PER_DEGREE_LAT,
+                    (nearest_lng - longitude) * KM_PER_DEGREE_LAT * math.cos(math.radians(latitude))
+                )
+                if distance_km > radius_km:
+                    continue
+                center_lng = (cell_min_lng + cell_width / 2 + 180.0) % 360.0 - 180.0
+                cell = encode(cell_min_lat + cell_height / 2, center_lng, precision)
+                if cell not in cells:
+                    cells.append(cell)
+        return cells
+
+    return []
@@ -31,7 +31,8 @@ class GooglePlacesService:
         user_location: LocationData,
         radius_m: int,
         included_types: List[str],
-        max_results: int = 20
+        max_results: int = 20,
+        raise_on_error: bool = False
     ) -> List[StationSearchResult]:
         """
         Google Places API (New) を使用して近隣スポットを検索
@@ -41,6 +42,7 @@ class GooglePlacesService:
             radius_m: 検索半径（メートル）
             included_types: 検索対象のタイプリスト
             max_results: 最大結果数
+            raise_on_error: Trueの場合、API障害を空の結果ではなく GooglePlacesAPIError として通知
             
         Returns:
             StationSearchResult のリスト（スポット情報として利用）
@@ -54,6 +56,8 @@ class GooglePlacesService:
         # APIキーがない場合は空のリストを返す
         if not self.api_key:
             print("❌ Google Places API key not available. Returning empty results.")
+            if raise_on_error:
+                raise GooglePlacesAPIError("Google Places API key not available")
             return []
         
         # APIリクエストペイロード
@@ -98,6 +102,8 @@ class GooglePlacesService:
             
             if response.status_code != 200:
                 print(f"❌ API Error Response: {response.text}")
+                if raise_on_error:
+                    raise GooglePlacesAPIError(f"Places API returned {response.status_code}")
                 return []
             
             data = response.json()
@@ -112,16 +118,24 @@ class GooglePlacesService:
             
             return self._parse_places_response(data, user_location)
             
+        except GooglePlacesAPIError:
+            raise
         except requests.exceptions.RequestException as e:
             print(f"❌ Google Places API request failed: {str(e)}")
+            if raise_on_error:
+                raise GooglePlacesAPIError(f"Places API request failed: {str(e)}")
             return []  # エラー時も空のリストを返す
         except json.JSONDecodeError as e:
             print(f"❌ Invalid JSON response: {str(e)}")
+            if raise_on_error:
+                raise GooglePlacesAPIError(f"Invalid JSON response: {str(e)}")
             return []
         except Exception as e:
             print(f"❌ Unexpected error: {str(e)}")
             import traceback
             traceback.print_exc()
+            if raise_on_error:
+                raise GooglePlacesAPIError(f"Unexpected error: {str(e)}")
             return []
     
     def _parse_places_response(
@@ -479,7 +493,8 @@ class GooglePlacesService:
         location: LocationData,
         radius_m: int,
         search_types: List[str],
-        max_results: int
+        max_results: int,
+        raise_on_error: bool = False
     ) -> List[RestaurantInfo]:
         """指定されたタイプで検索実行"""
         
@@ -522,10 +537,16 @@ class GooglePlacesService:
                 return self._parse_restaurant_response(data, location)
             else:
                 print(f"❌ API Error: {response.status_code} - {response.text}")
+                if raise_on_error:
+                    raise GooglePlacesAPIError(f"Places API returned {response.status_code}")
                 return []
                 
+        except GooglePlacesAPIError:
+            raise
         except Exception as e:
             print(f"❌ Search error: {str(e)}")
+            if raise_on_error:
+                raise GooglePlacesAPIError(f"Places search failed: {str(e)}")
             return []
     
     def _apply_filters(
@@ -889,10 +910,14 @@ class GooglePlacesService:
         max_price_per_person: Optional[int] = 3000,
         prefer_chain_stores: bool = True,
         exclude_high_end: bool = True,
-        min_rating: Optional[float] = 3.5
+        min_rating: Optional[float] = 3.5,
+        raise_on_error: bool = False
     ) -> List[RestaurantInfo]:
         """
         カジュアル志向の友人向け店舗検索
+        
+        raise_on_error がTrueの場合、検索の一部が失敗し結果が空になったときは
+        「該当店舗なし」と区別できるよう GooglePlacesAPIError を送出する。
         """
         print(f"🍻 Casual restaurant search starting...")
         print(f"   Location: ({location.latitude}, {location.longitude})")
@@ -905,8 +930,13 @@ class GooglePlacesService:
         # APIキーがない場合は空のリストを返す
         if not self.api_key:
             print("❌ Google Places API key not available. Returning empty results.")
+            if raise_on_error:
+                raise GooglePlacesAPIError("Google Places API key not available")
             return []
         
+        # 失敗したサブ検索の数（空の結果がAPI障害によるものか判定するため）
+        failed_searches = 0
+        
         # カジュアル志向の検索タイプを決定
         search_types = self.get_casual_search_types_for_scene(
             activity_types or ["food", "drink"],
@@ -933,9 +963,14 @@ class GooglePlacesService:
         if japanese_keywords:
             for keyword in japanese_keywords[:3]:  # 上位3キーワードのみ
                 print(f"🔍 Japanese keyword search: '{keyword}'")
-                keyword_restaurants = self._search_with_japanese_text_query(
-                    location, radius_m, keyword + " 近く", min(max_results // 2, 8)
-                )
+                try:
+                    keyword_restaurants = self._search_with_japanese_text_query(
+                        location, radius_m, keyword + " 近く", min(max_results // 2, 8),
+                        raise_on_error=True
+                    )
+                except GooglePlacesAPIError:
+                    failed_searches += 1
+                    keyword_restaurants = []
                 
                 # カジュアルフィルタリング即座適用
                 filtered_restaurants = self._apply_casual_filters(
@@ -960,9 +995,14 @@ class GooglePlacesService:
                 
             print(f"🔍 Casual search batch: {batch_types}")
             
-            restaurants = self._search_with_types(
-                location, radius_m, batch_types, min(max_results, 4)
-            )
+            try:
+                restaurants = self._search_with_types(
+                    location, radius_m, batch_types, min(max_results, 4),
+                    raise_on_error=True
+                )
+            except GooglePlacesAPIError:
+                failed_searches += 1
+                restaurants = []
             
             # カジュアルフィルタリング即座適用
             filtered_restaurants = self._apply_casual_filters(
@@ -1010,6 +1050,9 @@ class GooglePlacesService:
         # スコア順でソート
         unique_restaurants.sort(key=lambda x: x.composite_score, reverse=True)
         
+        if raise_on_error and failed_searches and not unique_restaurants:
+            raise GooglePlacesAPIError(f"{failed_searches} casual restaurant searches failed with no results")
+        
         print(f"🎯 Casual search completed: {len(unique_restaurants)} restaurants")
         return unique_restaurants[:max_results]
 
@@ -1066,7 +1109,8 @@ class GooglePlacesService:
         location: LocationData,
         radius_m: int,
         text_query: str,
-        max_results: int
+        max_results: int,
+        raise_on_error: bool = False
     ) -> List[RestaurantInfo]:
         """日本語テキストクエリで検索実行"""
         
@@ -1109,8 +1153,14 @@ class GooglePlacesService:
                 return self._parse_restaurant_response(data, location)
             else:
                 print(f"❌ Text Query API Error: {response.status_code} - {response.text}")
+                if raise_on_error:
+                    raise GooglePlacesAPIError(f"Places text search returned {response.status_code}")
                 return []
                 
+        except GooglePlacesAPIError:
+            raise
         except Exception as e:
             print(f"❌ Text Query Search error: {str(e)}")
+            if raise_on_error:
+                raise GooglePlacesAPIError(f"Places text search failed: {str(e)}")
             return []
\ No newline at end of file
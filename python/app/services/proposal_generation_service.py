@@ -3,10 +3,14 @@ AI提案生成サービス
 既存のレコメンデーションAPIを活用してFirestore用の提案を生成
 """
 import uuid
+import json
 import asyncio
-from typing import List, Dict, Any, Optional, Tuple
+import hashlib
+from collections import Counter, deque
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
 from datetime import datetime, timedelta
 import random
+from geopy.distance import geodesic
 
 from app.models import (
     Proposal, UserProposal, ProposalLocation, InvitedUser,
@@ -14,35 +18,62 @@ from app.models import (
     ProposalSource, ProposalType, ProposalStatus, Priority,
     LocationData, ActivityType, MoodType, BudgetRange,
     RestaurantRecommendationRequest, ProposalGenerationRequest,
-    ProposalGenerationResponse
+    ProposalGenerationResponse, ProposalJobStatus
 )
+from app.services import geohash
 from app.services.firestore_service import get_firestore_service
 from app.services.restaurant_recommendation_service import RestaurantRecommendationService
 from app.services.activity_recommendation_service import ActivityRecommendationService
+from app.config import get_settings
+
+
+# 実行ドキュメントに記録する、失敗した生成単位のエラーの上限件数
+MAX_RECORDED_UNIT_ERRORS = 20
 
 
 class ProposalGenerationService:
     """AI提案生成サービス"""
     
     def __init__(self):
+        self.settings = get_settings()
         self.firestore_service = get_firestore_service()
         self.restaurant_service = RestaurantRecommendationService()
         self.activity_service = ActivityRecommendationService()
     
-    async def generate_ai_proposals(self, request: ProposalGenerationRequest) -> ProposalGenerationResponse:
-        """AI提案を生成してFirestoreに保存"""
+    async def generate_ai_proposals(
+        self,
+        request: ProposalGenerationRequest,
+        progress_callback: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> ProposalGenerationResponse:
+        """AI提案を生成してFirestoreに保存
+        
+        progress_callbackを指定すると、フェーズの切り替わりと各ユーザーの処理完了時に進捗を通知する。
+        """
         start_time = datetime.now()
         generated_proposals = []
+        resumed_proposals = []
+        progress = {
+            "phase": "loading_users",
+            "target_users": 0,
+            "users_to_generate": 0,
+            "skipped_users": 0,
+            "processed_users": 0,
+            "generated_proposals": 0,
+            "failed_users": 0,
+            "timed_out_users": 0,
+            "resumed_users": 0
+        }
         
         try:
             print(f"🤖 Starting AI proposal generation...")
             
             # 対象ユーザーを取得
             if request.target_user_ids:
-                # 指定されたユーザーIDから取得
+                # 指定されたユーザーIDからまとめて取得
+                found_users = await self.firestore_service.get_users_bulk(request.target_user_ids)
                 target_users = []
                 for uid in request.target_user_ids:
-                    user_data = await self._get_user_data(uid)
+                    user_data = found_users.get(uid)
                     if user_data:
                         target_users.append(user_data)
                         print(f"✅ Target user found: {user_data.get('displayName', uid)}")
@@ -61,62 +92,543 @@ class ProposalGenerationService:
                 # アクティブユーザーを取得
                 target_users = await self.firestore_service.get_active_users(request.location_filter)
             
+            # シャード指定時はuidのハッシュで担当分のユーザーだけに絞る
+            if request.shard_count:
+                total_users = len(target_users)
+                target_users = [
+                    user for user in target_users
+                    if self._get_user_shard(user['uid'], request.shard_count) == request.shard_index
+                ]
+                print(f"🧩 Shard {request.shard_index}/{request.shard_count}: "
+                      f"{len(target_users)} of {total_users} users")
+            
+            total_target_users = len(target_users)
+            
+            # 同じ実行IDの前回の試行で処理済みのユーザーは除外し、作成済みの提案IDを結果に引き継ぐ
+            resumed_uids = set()
+            if request.run_id:
+                await self.firestore_service.start_generation_run(request.run_id, {
+                    'status': ProposalJobStatus.RUNNING.value,
+                    'request': request.model_dump(mode="json"),
+                    'last_attempt_at': start_time
+                })
+                completed_users = await self.firestore_service.get_generation_run_completed_users(
+                    request.run_id, [user['uid'] for user in target_users]
+                )
+                resumed_uids = set(completed_users)
+                resumed_proposals = list(dict.fromkeys(
+                    proposal_id
+                    for completed in completed_users.values()
+                    for proposal_id in completed.get('proposal_ids', [])
+                ))
+                target_users = [user for user in target_users if user['uid'] not in resumed_uids]
+                print(f"⏯️ Run {request.run_id}: resuming with {len(target_users)} users "
+                      f"({len(resumed_uids)} already completed)")
+            
             print(f"🎯 Found {len(target_users)} target users for proposal generation")
+            progress.update({
+                "phase": "hydrating",
+                "target_users": total_target_users,
+                "resumed_users": len(resumed_uids)
+            })
+            await self._report_progress(progress_callback, progress, start_time)
+            
+            # 位置情報と友人リストを一括取得
+            locations, friends_by_user = await self._hydrate_users(target_users)
+            
+            # 近くのユーザーをクラスタリングし、店舗検索はクラスター×アクティビティごとに1回だけ行う
+            user_locations = {
+                user['uid']: self._resolve_user_location(user['uid'], locations.get(user['uid']))
+                for user in target_users
+            }
+            user_clusters = self._cluster_users(user_locations)
+            candidate_pool: Dict[Tuple[str, str], asyncio.Task] = {}
             
-            # ユーザーごとに提案を生成
-            for user in target_users:
-                user_proposals = await self._generate_proposals_for_user(
-                    user, request.max_proposals_per_user, request.force_generation
+            # 近くにいる空き状態の友人同士はグループにまとめ、グループごとに1回だけ提案を生成する
+            users_by_uid = {user['uid']: user for user in target_users}
+            units = []
+            for group_id, members in await self._build_run_groups(
+                request.run_id, target_users, user_locations, friends_by_user
+            ):
+                unit = self._build_generation_unit(members, users_by_uid, user_locations, user_clusters, friends_by_user)
+                unit['group_id'] = group_id
+                units.append(unit)
+            friend_groups_count = sum(1 for unit in units if len(unit['members']) > 1)
+            print(f"👥 Grouped {len(target_users)} users into {len(units)} generation units "
+                  f"({friend_groups_count} friend groups)")
+            
+            # 前回から状況が変わっておらず有効な提案が残っているユーザー（グループ）はスキップ
+            fingerprints = {
+                user['uid']: self._build_user_fingerprint(
+                    user, user_clusters[user['uid']], friends_by_user.get(user['uid'], [])
                 )
-                generated_proposals.extend(user_proposals)
+                for user in target_users
+            }
+            for unit in units:
+                unit['fingerprint'] = self._build_unit_fingerprint(unit['members'], fingerprints)
+            member_fingerprints = {uid: unit['fingerprint'] for unit in units for uid in unit['members']}
             
-            processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
+            unchanged_uids = set()
+            if not request.force_generation:
+                unchanged_uids = await self._find_unchanged_users(member_fingerprints)
+            units_to_generate = []
+            skipped_uids = set()
+            for unit in units:
+                if all(uid in unchanged_uids for uid in unit['members']):
+                    skipped_uids.update(unit['members'])
+                else:
+                    units_to_generate.append(unit)
+            users_to_generate_count = sum(len(unit['members']) for unit in units_to_generate)
+            print(f"♻️ Skipping {len(skipped_uids)} unchanged users, generating for {users_to_generate_count} users "
+                  f"({len(units_to_generate)} units)")
+            progress.update({
+                "phase": "generating",
+                "users_to_generate": users_to_generate_count,
+                "skipped_users": len(skipped_uids)
+            })
+            await self._report_progress(progress_callback, progress, start_time)
+            
+            # グループ（またはユーザー）ごとに提案を生成（同時実行数を制限したワーカープール）
+            user_semaphore = asyncio.Semaphore(max(self.settings.PROPOSAL_USER_CONCURRENCY, 1))
+            failed_users = []
+            timed_out_users = []
+            unit_errors = []
+            
+            async def save_unit_states(unit: Dict[str, Any], unit_proposals: List[str]):
+                # 次回の差分判定用の状態をグループごとに保存（途中で停止しても完了済みのグループは次回スキップできる）
+                generated_at = datetime.now()
+                await self.firestore_service.save_generation_states({
+                    uid: {
+                        'fingerprint': unit['fingerprint'],
+                        'proposal_ids': unit_proposals,
+                        'generated_at': generated_at
+                    }
+                    for uid in unit['members']
+                })
+            
+            async def run_unit(unit: Dict[str, Any]) -> List[str]:
+                unit_proposals = []
+                async with user_semaphore:
+                    try:
+                        await asyncio.wait_for(
+                            self._generate_proposals_for_user(
+                                unit['leader'], request.max_proposals_per_user, request.force_generation,
+                                unit['location'], unit['friends'],
+                                unit_proposals, unit['cluster'], candidate_pool, unit['invitees'],
+                                self._build_run_key(request.run_id, unit['group_id'])
+                            ),
+                            timeout=self.settings.PROPOSAL_USER_TIMEOUT_SECONDS
+                        )
+                        if unit_proposals:
+                            await save_unit_states(unit, unit_proposals)
+                        # 再試行時に再処理しないよう、完了したユーザーを記録
+                        if request.run_id:
+                            await self.firestore_service.mark_generation_run_users_completed(
+                                request.run_id, unit['members'], unit_proposals
+                            )
+                    except asyncio.TimeoutError:
+                        print(f"⏱️ Proposal generation timed out for users {unit['members']}")
+                        timed_out_users.extend(unit['members'])
+                        if unit_proposals:
+                            await save_unit_states(unit, unit_proposals)
+                    except Exception as e:
+                        print(f"❌ Proposal generation failed for users {unit['members']} "
+                              f"(leader: {unit['leader']['uid']}): {str(e)}")
+                        failed_users.extend(unit['members'])
+                        unit_errors.append({'users': unit['members'], 'error': str(e)})
+                
+                progress.update({
+                    "processed_users": progress["processed_users"] + len(unit['members']),
+                    "generated_proposals": progress["generated_proposals"] + len(unit_proposals),
+                    "failed_users": len(failed_users),
+                    "timed_out_users": len(timed_out_users)
+                })
+                await self._report_progress(progress_callback, progress, start_time)
+                
+                # タイムアウトした場合も、それまでに保存できた提案は結果に含める
+                return unit_proposals
+            
+            results = await asyncio.gather(*(run_unit(unit) for unit in units_to_generate))
+            for unit_proposals in results:
+                generated_proposals.extend(unit_proposals)
+            
+            elapsed_seconds = (datetime.now() - start_time).total_seconds()
+            processing_time = int(elapsed_seconds * 1000)
+            
+            print(f"📊 Generated {len(generated_proposals)} proposals for {len(target_users)} users in {processing_time}ms "
+                  f"(failed: {len(failed_users)}, timed out: {len(timed_out_users)}, "
+                  f"friend groups: {friend_groups_count}, shared searches: {len(candidate_pool)})")
+            
+            if request.run_id:
+                # 失敗・タイムアウトしたユーザーが残っている場合は、同じ実行IDで再試行すると続きから処理する
+                await self.firestore_service.update_generation_run(request.run_id, {
+                    'status': (
+                        ProposalJobStatus.FAILED if failed_users or timed_out_users else ProposalJobStatus.COMPLETED
+                    ).value,
+                    'finished_at': datetime.now(),
+                    'target_users': total_target_users,
+                    'pending_users': len(failed_users) + len(timed_out_users),
+                    # 失敗した生成単位ごとのエラー（多い場合は先頭のみ）
+                    'unit_errors': unit_errors[:MAX_RECORDED_UNIT_ERRORS]
+                })
             
             return ProposalGenerationResponse(
                 success=True,
-                generated_proposals=generated_proposals,
-                target_users_count=len(target_users),
-                processing_time_ms=processing_time
+                generated_proposals=resumed_proposals + generated_proposals,
+                target_users_count=total_target_users,
+                processing_time_ms=processing_time,
+                regenerated_users_count=users_to_generate_count,
+                skipped_users_count=len(skipped_uids),
+                succeeded_users_count=sum(
+                    len(unit['members']) for unit, unit_proposals in zip(units_to_generate, results) if unit_proposals
+                ),
+                friend_groups_count=friend_groups_count,
+                failed_users=failed_users,
+                timed_out_users=timed_out_users,
+                users_per_second=round(len(target_users) / elapsed_seconds, 2) if elapsed_seconds > 0 else None,
+                proposals_per_minute=round(len(generated_proposals) / elapsed_seconds * 60, 1) if elapsed_seconds > 0 else None,
+                shard_index=request.shard_index,
+                shard_count=request.shard_count,
+                run_id=request.run_id,
+                resumed_users_count=len(resumed_uids)
             )
         
         except Exception as e:
             print(f"❌ Error in AI proposal generation: {str(e)}")
             processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
             
+            if request.run_id:
+                await self.firestore_service.update_generation_run(request.run_id, {
+                    'status': ProposalJobStatus.FAILED.value,
+                    'finished_at': datetime.now(),
+                    'error_message': str(e)
+                })
+            
             return ProposalGenerationResponse(
                 success=False,
-                generated_proposals=generated_proposals,
+                generated_proposals=resumed_proposals + generated_proposals,
                 target_users_count=0,
                 processing_time_ms=processing_time,
+                shard_index=request.shard_index,
+                shard_count=request.shard_count,
+                run_id=request.run_id,
                 error_message=str(e)
             )
     
+    def _build_run_key(self, run_id: Optional[str], group_id: str) -> Optional[str]:
+        """実行ID内で生成単位を識別するキー（提案IDの決定に使用、実行ID未指定の場合はNone）"""
+        if not run_id:
+            return None
+        return f"{run_id}:{group_id}"
+    
+    def _build_proposal_id(self, run_key: Optional[str], proposal_index: int) -> str:
+        """提案IDを生成（実行IDがある場合は再試行しても同じIDになるように決定的に生成）"""
+        if not run_key:
+            return f"proposal_{uuid.uuid4().hex[:12]}"
+        return f"proposal_{hashlib.sha256(f'{run_key}:{proposal_index}'.encode()).hexdigest()[:12]}"
+    
+    def _get_user_shard(self, uid: str, shard_count: int) -> int:
+        """uidのハッシュからシャード番号を算出（インスタンスや実行日に依存しない）"""
+        return int(hashlib.sha256(uid.encode()).hexdigest()[:8], 16) % shard_count
+    
+    async def _report_progress(
+        self,
+        progress_callback: Optional[Callable[[Dict[str, Any]], Awaitable[None]]],
+        progress: Dict[str, Any],
+        start_time: datetime
+    ):
+        """進捗をスループット付きで通知（通知の失敗は生成処理に影響させない）"""
+        if not progress_callback:
+            return
+        
+        elapsed_seconds = (datetime.now() - start_time).total_seconds()
+        snapshot = dict(progress)
+        snapshot["elapsed_ms"] = int(elapsed_seconds * 1000)
+        snapshot["users_per_second"] = (
+            round(progress["processed_users"] / elapsed_seconds, 2) if elapsed_seconds > 0 else None
+        )
+        try:
+            await progress_callback(snapshot)
+        except Exception as e:
+            print(f"⚠️ Failed to report proposal generation progress: {str(e)}")
+    
+    async def _hydrate_users(
+        self, target_users: List[Dict[str, Any]]
+    ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+        """対象ユーザー全員の位置情報（get_all）と友人リスト（並列取得）をまとめて読み込む"""
+        user_uids = [user['uid'] for user in target_users]
+        hydration_start = datetime.now()
+        
+        locations, friends_by_user = await asyncio.gather(
+            self.firestore_service.get_user_locations_bulk(user_uids),
+            self.firestore_service.get_user_friends_bulk(
+                user_uids, self.settings.PROPOSAL_HYDRATION_CONCURRENCY
+            )
+        )
+        
+        hydration_ms = int((datetime.now() - hydration_start).total_seconds() * 1000)
+        print(f"💧 Hydrated {len(locations)} locations and {len(friends_by_user)} friend lists in {hydration_ms}ms")
+        return locations, friends_by_user
+    
+    def _resolve_user_location(self, user_uid: str, user_location_data: Optional[Dict[str, Any]]) -> LocationData:
+        """一括取得した位置情報ドキュメントから位置を決定"""
+        if not user_location_data:
+            print(f"⚠️ No location data for user {user_uid}")
+            # デバッグ用：デフォルト位置（東京駅）を使用
+            print(f"🔧 Using default location (Tokyo Station) for testing")
+            return LocationData(latitude=35.6812, longitude=139.7671)
+        
+        return LocationData(
+            latitude=user_location_data['coordinates']['lat'],
+            longitude=user_location_data['coordinates']['lng']
+        )
+    
+    def _build_user_fingerprint(
+        self, user: Dict[str, Any], cluster: str, friends: List[Dict[str, Any]]
+    ) -> str:
+        """提案内容に影響するユーザーの状況（位置セル・気分・友人）のフィンガープリント"""
+        payload = {
+            "cell": cluster,
+            "moods": sorted(user.get('mood', ['drinking'])),
+            "friends": sorted(friend['friendUid'] for friend in friends if friend.get('friendUid'))
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:32]
+    
+    async def _find_unchanged_users(self, fingerprints: Dict[str, str]) -> set:
+        """フィンガープリントが前回と同じで、前回の提案がまだ有効なユーザーのUIDを取得"""
+        states = await self.firestore_service.get_generation_states(list(fingerprints))
+        unchanged = {
+            uid: state.get('proposal_ids', [])
+            for uid, state in states.items()
+            if state.get('fingerprint') == fingerprints.get(uid) and state.get('proposal_ids')
+        }
+        if not unchanged:
+            return set()
+        
+        active_ids = await self.firestore_service.get_active_proposal_ids(
+            [proposal_id for proposal_ids in unchanged.values() for proposal_id in proposal_ids]
+        )
+        return {
+            uid for uid, proposal_ids in unchanged.items()
+            if any(proposal_id in active_ids for proposal_id in proposal_ids)
+        }
+    
+    def _cluster_users(self, user_locations: Dict[str, LocationData]) -> Dict[str, str]:
+        """ユーザーを位置のジオセル（グリッド）でクラスタリングし、ユーザーUID→クラスターを返す"""
+        precision = self.settings.PROPOSAL_CLUSTER_GEOHASH_PRECISION
+        user_clusters = {
+            uid: geohash.encode(location.latitude, location.longitude, precision)
+            for uid, location in user_locations.items()
+        }
+        print(f"🗺️ Clustered {len(user_clusters)} users into {len(set(user_clusters.values()))} geocells")
+        return user_clusters
+    
+    def _build_friend_groups(
+        self,
+        target_users: List[Dict[str, Any]],
+        user_locations: Dict[str, LocationData],
+        friends_by_user: Dict[str, List[Dict[str, Any]]]
+    ) -> List[List[str]]:
+        """対象ユーザー同士の友人関係（近くにいる場合のみ）のグラフから、上限人数以下のグループを作る
+        
+        各グループの先頭はグループ内のつながりが最も多いユーザー（提案の代表ユーザー）。
+        """
+        uids = [user['uid'] for user in target_users]
+        if not self.settings.PROPOSAL_FRIEND_GROUPING_ENABLED:
+            return [[uid] for uid in uids]
+        
+        uid_set = set(uids)
+        adjacency: Dict[str, set] = {uid: set() for uid in uids}
+        for uid in uids:
+            for friend in friends_by_user.get(uid, []):
+                friend_uid = friend.get('friendUid')
+                if friend_uid not in uid_set or friend_uid == uid or friend_uid in adjacency[uid]:
+                    continue
+                location, friend_location = user_locations[uid], user_locations[friend_uid]
+                distance_km = geodesic(
+                    (location.latitude, location.longitude),
+                    (friend_location.latitude, friend_location.longitude)
+                ).kilometers
+                if distance_km <= self.settings.PROPOSAL_GROUP_MAX_DISTANCE_KM:
+                    adjacency[uid].add(friend_uid)
+                    adjacency[friend_uid].add(uid)
+        
+        # つながりの多いユーザーから順に、幅優先で上限人数までグループに入れる
+        max_size = max(self.settings.PROPOSAL_GROUP_MAX_SIZE, 1)
+        
+        def by_connectivity(uid: str) -> Tuple[int, str]:
+            return -len(adjacency[uid]), uid
+        
+        groups = []
+        assigned = set()
+        for uid in sorted(uids, key=by_connectivity):
+            if uid in assigned:
+                continue
+            group = [uid]
+            assigned.add(uid)
+            queue = deque([uid])
+            while queue and len(group) < max_size:
+                for neighbor in sorted(adjacency[queue.popleft()] - assigned, key=by_connectivity):
+                    if len(group) >= max_size:
+                        break
+                    group.append(neighbor)
+                    assigned.add(neighbor)
+                    queue.append(neighbor)
+            groups.append(group)
+        
+        return groups
+    
+    async def _build_run_groups(
+        self,
+        run_id: Optional[str],
+        target_users: List[Dict[str, Any]],
+        user_locations: Dict[str, LocationData],
+        friends_by_user: Dict[str, List[Dict[str, Any]]]
+    ) -> List[Tuple[str, List[str]]]:
+        """生成単位のグループを (グループID, メンバー) で返す（グループIDは最初に決めた代表ユーザーのUID）
+        
+        実行IDがある場合は前回の試行で記録したグループ構成を引き継ぎ、
+        再試行で対象ユーザーが減ってもグループと提案IDが変わらないようにする。
+        """
+        if not run_id:
+            return [(members[0], members) for members in self._build_friend_groups(
+                target_users, user_locations, friends_by_user
+            )]
+        
+        uids = [user['uid'] for user in target_users]
+        uid_set = set(uids)
+        recorded = await self.firestore_service.get_generation_run_groups(run_id, uids)
+        
+        groups = []
+        seen_groups = set()
+        for uid in uids:
+            recorded_members = (recorded.get(uid) or {}).get('members')
+            if not recorded_members or recorded_members[0] in seen_groups:
+                continue
+            seen_groups.add(recorded_members[0])
+            groups.append((recorded_members[0], [member for member in recorded_members if member in uid_set]))
+        
+        grouped_uids = {uid for _, members in groups for uid in members}
+        new_groups = self._build_friend_groups(
+            [user for user in target_users if user['uid'] not in grouped_uids], user_locations, friends_by_user
+        )
+        if new_groups:
+            await self.firestore_service.save_generation_run_groups(run_id, new_groups)
+        if groups:
+            print(f"⏯️ Run {run_id}: reusing {len(groups)} recorded groups")
+        
+        return groups + [(members[0], members) for members in new_groups]
+    
+    def _build_generation_unit(
+        self,
+        members: List[str],
+        users_by_uid: Dict[str, Dict[str, Any]],
+        user_locations: Dict[str, LocationData],
+        user_clusters: Dict[str, str],
+        friends_by_user: Dict[str, List[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """提案生成の単位（1ユーザー、または友人グループ）を構築"""
+        leader_uid = members[0]
+        if len(members) == 1:
+            return {
+                'members': members,
+                'leader': users_by_uid[leader_uid],
+                'location': user_locations[leader_uid],
+                'cluster': user_clusters[leader_uid],
+                'friends': friends_by_user.get(leader_uid, []),
+                'invitees': None
+            }
+        
+        # 集合場所はメンバーの重心、気分はメンバー内で多いものから順に使う
+        location = LocationData(
+            latitude=sum(user_locations[uid].latitude for uid in members) / len(members),
+            longitude=sum(user_locations[uid].longitude for uid in members) / len(members)
+        )
+        mood_counts = Counter(
+            mood for uid in members for mood in users_by_uid[uid].get('mood', ['drinking'])
+        )
+        invitees = [
+            {
+                'friendUid': uid,
+                'displayName': users_by_uid[uid].get('displayName', f'User_{uid[:8]}'),
+                'profileImage': users_by_uid[uid].get('profileImage'),
+                'currentStatus': users_by_uid[uid].get('currentStatus'),
+                'mood': users_by_uid[uid].get('mood', [])
+            }
+            for uid in members[1:]
+        ]
+        return {
+            'members': members,
+            'leader': {**users_by_uid[leader_uid], 'mood': [mood for mood, _ in mood_counts.most_common()]},
+            'location': location,
+            'cluster': geohash.encode(
+                location.latitude, location.longitude, self.settings.PROPOSAL_CLUSTER_GEOHASH_PRECISION
+            ),
+            'friends': friends_by_user.get(leader_uid, []),
+            'invitees': invitees
+        }
+    
+    def _build_unit_fingerprint(self, members: List[str], fingerprints: Dict[str, str]) -> str:
+        """生成単位のフィンガープリント（グループの場合は構成とメンバー全員の状況から算出）"""
+        if len(members) == 1:
+            return fingerprints[members[0]]
+        payload = {
+            "group": sorted(members),
+            "members": sorted(fingerprints[uid] for uid in members)
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:32]
+    
+    async def _get_cluster_candidates(
+        self,
+        candidate_pool: Dict[Tuple[str, str], asyncio.Task],
+        cluster: str,
+        activity_type: ActivityType
+    ) -> Tuple[List[Any], List[Any]]:
+        """クラスター×アクティビティの駅・店舗候補を取得（同じ組み合わせの検索は実行中も含めて共有）"""
+        key = (cluster, activity_type.value)
+        task = candidate_pool.get(key)
+        if task is None:
+            # 検索位置はクラスター（ジオセル）の中心に揃え、キャッシュキーも共有する
+            latitude, longitude = geohash.decode(cluster)
+            task = asyncio.create_task(self.restaurant_service.search_casual_candidates(
+                user_location=LocationData(latitude=latitude, longitude=longitude),
+                activity_type=[activity_type],
+                max_price_per_person=3000,  # カジュアル向け
+                station_search_radius_km=self.settings.PROPOSAL_STATION_SEARCH_RADIUS_KM,
+                max_stations=self.settings.PROPOSAL_MAX_STATIONS,
+                max_restaurants_per_station=self.settings.PROPOSAL_MAX_RESTAURANTS_PER_STATION
+            ))
+            candidate_pool[key] = task
+        
+        # 1ユーザーのタイムアウトで共有の検索がキャンセルされないようにする
+        return await asyncio.shield(task)
+    
     async def _generate_proposals_for_user(
-        self, user: Dict[str, Any], max_proposals: int, force_generation: bool
+        self, user: Dict[str, Any], max_proposals: int, force_generation: bool,
+        user_location: LocationData, friends: List[Dict[str, Any]],
+        proposals: Optional[List[str]] = None,
+        cluster: Optional[str] = None,
+        candidate_pool: Optional[Dict[Tuple[str, str], asyncio.Task]] = None,
+        invitees: Optional[List[Dict[str, Any]]] = None,
+        run_key: Optional[str] = None
     ) -> List[str]:
-        """指定ユーザーに対する提案を生成"""
-        proposals = []
+        """指定ユーザーに対する提案を生成（位置情報・友人は一括取得済みのものを使用）
+        
+        proposalsを渡すと作成できた提案IDを逐次追加する（タイムアウト時も途中結果を残すため）。
+        inviteesを渡すと友人の選定は行わず、そのメンバー（友人グループ）を全員招待する。
+        run_keyを渡すと提案IDを決定的に生成し、前回の試行で保存済みの提案は作り直さない。
+        """
+        proposals = proposals if proposals is not None else []
+        candidate_pool = candidate_pool if candidate_pool is not None else {}
+        cluster = cluster or geohash.encode(
+            user_location.latitude, user_location.longitude, self.settings.PROPOSAL_CLUSTER_GEOHASH_PRECISION
+        )
         user_uid = user['uid']
         
         try:
             print(f"👤 Generating proposals for user: {user.get('displayName', user_uid)}")
+            print(f"📍 User location: {user_location.latitude}, {user_location.longitude} (cluster: {cluster})")
             
-            # ユーザーの位置情報を取得
-            user_location_data = await self.firestore_service.get_user_location(user_uid)
-            if not user_location_data:
-                print(f"⚠️ No location data for user {user_uid}")
-                # デバッグ用：デフォルト位置（東京駅）を使用
-                print(f"🔧 Using default location (Tokyo Station) for testing")
-                user_location = LocationData(latitude=35.6812, longitude=139.7671)
-            else:
-                user_location = LocationData(
-                    latitude=user_location_data['coordinates']['lat'],
-                    longitude=user_location_data['coordinates']['lng']
-                )
-                print(f"📍 User location: {user_location.latitude}, {user_location.longitude}")
-            
-            # ユーザーの友人を取得
-            friends = await self.firestore_service.get_user_friends(user_uid)
             print(f"👥 Found {len(friends)} friends for user {user_uid}")
             
             # ユーザーの気分・興味から提案を生成
@@ -127,16 +639,32 @@ class ProposalGenerationService:
             proposal_count = min(max_proposals, max(len(user_moods), 1))
             print(f"🎲 Generating {proposal_count} proposals")
             
-            for i in range(proposal_count):
-                proposal_id = await self._create_single_proposal(
-                    user, user_location, friends, user_moods, i
-                )
+            proposal_ids = [self._build_proposal_id(run_key, i) for i in range(proposal_count)]
+            existing_ids = set()
+            if run_key:
+                existing_ids = await self.firestore_service.get_existing_proposal_ids(proposal_ids)
+                if existing_ids:
+                    print(f"⏯️ {len(existing_ids)} proposals already saved by a previous attempt")
+                    proposals.extend(proposal_id for proposal_id in proposal_ids if proposal_id in existing_ids)
+            
+            proposal_semaphore = asyncio.Semaphore(max(self.settings.PROPOSAL_PER_USER_CONCURRENCY, 1))
+            
+            async def create_proposal(i: int):
+                async with proposal_semaphore:
+                    proposal_id = await self._create_single_proposal(
+                        user, user_location, friends, user_moods, i, cluster, candidate_pool, invitees,
+                        proposal_ids[i]
+                    )
                 if proposal_id:
                     proposals.append(proposal_id)
                     print(f"✨ Proposal {i+1}/{proposal_count} created: {proposal_id}")
                 else:
                     print(f"⚠️ Failed to create proposal {i+1}/{proposal_count}")
             
+            await asyncio.gather(*(
+                create_proposal(i) for i in range(proposal_count) if proposal_ids[i] not in existing_ids
+            ))
+            
             print(f"✅ Generated {len(proposals)} proposals for user {user_uid}")
             return proposals
         
@@ -144,16 +672,20 @@ class ProposalGenerationService:
             print(f"❌ Error generating proposals for user {user_uid}: {str(e)}")
             import traceback
             traceback.print_exc()
-            return proposals
+            # 呼び出し元のワーカーで失敗ユーザーとして集計する（作成済みの提案はproposalsに残る）
+            raise
     
     async def _create_single_proposal(
         self, user: Dict[str, Any], user_location: LocationData,
-        friends: List[Dict[str, Any]], user_moods: List[str], proposal_index: int
+        friends: List[Dict[str, Any]], user_moods: List[str], proposal_index: int,
+        cluster: str, candidate_pool: Dict[Tuple[str, str], asyncio.Task],
+        invitees: Optional[List[Dict[str, Any]]] = None,
+        proposal_id: Optional[str] = None
     ) -> Optional[str]:
-        """単一の提案を作成"""
+        """単一の提案を作成（店舗候補はクラスターで共有し、選定はユーザーごとに行う）"""
         try:
             user_uid = user['uid']
-            proposal_id = f"proposal_{uuid.uuid4().hex[:12]}"
+            proposal_id = proposal_id or self._build_proposal_id(None, proposal_index)
             
             # 気分からアクティビティタイプを決定
             activity_type = self._determine_activity_type(user_moods, proposal_index)
@@ -161,27 +693,27 @@ class ProposalGenerationService:
             
             print(f"🎲 Creating proposal for activity: {activity_type}, mood: {mood_type}")
             
-            # レストラン推薦を取得
-            recommendation_request = RestaurantRecommendationRequest(
-                user_location=user_location,
+            # 友人を招待対象として選定（友人グループの場合はメンバー全員）
+            if invitees is not None:
+                invited_friends = invitees
+                group_size = len(invitees) + 1
+            else:
+                invited_friends = self._select_friends_for_invitation(friends, activity_type)
+                group_size = self._estimate_group_size(friends)
+            
+            # クラスター共有の候補からユーザーごとにレストランを選定
+            nearby_stations, candidate_restaurants = await self._get_cluster_candidates(
+                candidate_pool, cluster, activity_type
+            )
+            
+            recommendation_response = await self.restaurant_service.recommend_from_candidates(
+                nearby_stations=nearby_stations,
+                all_restaurants=candidate_restaurants,
                 activity_type=[activity_type],
                 mood=[mood_type],
-                group_size=self._estimate_group_size(friends),
+                group_size=group_size,
                 max_price_per_person=3000,  # カジュアル向け
-                station_search_radius_km=5.0,
-                max_stations=3,
-                max_restaurants_per_station=5
-            )
-            
-            recommendation_response = await self.restaurant_service.recommend_restaurants_async(
-                user_location=recommendation_request.user_location,
-                activity_type=recommendation_request.activity_type,
-                mood=recommendation_request.mood,
-                group_size=recommendation_request.group_size,
-                max_price_per_person=recommendation_request.max_price_per_person,
-                station_search_radius_km=recommendation_request.station_search_radius_km,
-                max_stations=recommendation_request.max_stations,
-                max_restaurants_per_station=recommendation_request.max_restaurants_per_station
+                station_search_radius_km=self.settings.PROPOSAL_STATION_SEARCH_RADIUS_KM
             )
             
             if not recommendation_response.success or not recommendation_response.recommendations:
@@ -191,9 +723,6 @@ class ProposalGenerationService:
             # 一番良い推薦を選択
             best_recommendation = recommendation_response.recommendations[0]
             
-            # 友人を招待対象として選定
-            invited_friends = self._select_friends_for_invitation(friends, activity_type)
-            
             # 提案時間を決定
             scheduled_time = self._determine_proposal_time(user, activity_type)
             
@@ -203,15 +732,14 @@ class ProposalGenerationService:
                 scheduled_time, activity_type, mood_type
             )
             
-            # Firestoreに保存
-            success = await self.firestore_service.create_proposal(proposal)
+            # 提案とユーザー個別提案をまとめてFirestoreに保存
+            user_proposals = self._build_user_proposals(proposal, invited_friends + [user])
+            success = await self.firestore_service.create_proposal_with_user_proposals(
+                proposal, user_proposals
+            )
             if not success:
                 return None
             
-            # ユーザー個別提案を作成
-            user_proposals = self._build_user_proposals(proposal, invited_friends + [user])
-            await self.firestore_service.create_user_proposals(user_proposals)
-            
             print(f"✅ Created proposal {proposal_id}: {proposal.title}")
             return proposal_id
         
@@ -411,20 +939,6 @@ class ProposalGenerationService:
             user_proposals.append((user_uid, user_proposal))
         
         return user_proposals
-    
-    async def _get_user_data(self, uid: str) -> Optional[Dict[str, Any]]:
-        """指定ユーザーのデータを取得"""
-        try:
-            # Firestoreから直接取得
-            user_doc = self.firestore_service.db.collection('users').document(uid).get()
-            if user_doc.exists:
-                user_data = user_doc.to_dict()
-                user_data['uid'] = uid
-                return user_data
-            return None
-        except Exception as e:
-            print(f"❌ Error getting user data for {uid}: {str(e)}")
-            return None
 
 
 # シングルトンインスタンス
@@ -0,0 +1,241 @@
+"""
+AI提案生成ジョブサービス
+提案生成をバックグラウンドで実行し、進捗をFirestoreのジョブドキュメントに記録する
+"""
+import json
+import time
+import asyncio
+import hashlib
+from typing import Dict, Any, Optional
+from datetime import datetime, timedelta, timezone
+
+from app.models import (
+    ProposalGenerationRequest, ProposalGenerationResponse,
+    ProposalJobResponse, ProposalJobStatus, ProposalShardGroupResponse
+)
+from app.services.firestore_service import get_firestore_service
+from app.services.proposal_generation_service import get_proposal_generation_service
+from app.config import get_settings
+
+
+# 冪等キーの日付はスケジューラーと同じ日本時間で区切る
+JST = timezone(timedelta(hours=9))
+
+# シャードグループの集計対象とする進捗の項目
+SHARD_TOTAL_FIELDS = (
+    'target_users', 'users_to_generate', 'skipped_users', 'resumed_users', 'processed_users',
+    'generated_proposals', 'failed_users', 'timed_out_users'
+)
+
+
+class ProposalJobService:
+    """AI提案生成ジョブの投入・実行・状態取得"""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.firestore_service = get_firestore_service()
+        self._running_tasks = set()
+
+    def _build_slot(self, schedule_time: Optional[str]) -> str:
+        """冪等性の単位となる実行枠（スケジューラーの予定時刻、未指定の場合は日本時間の日付）"""
+        return schedule_time or datetime.now(JST).date().isoformat()
+
+    def build_job_id(self, request: ProposalGenerationRequest, schedule_time: Optional[str] = None) -> str:
+        """冪等キー（未指定の場合は実行枠＋リクエスト内容）からジョブIDを生成
+
+        schedule_timeにはCloud Schedulerの予定時刻（X-CloudScheduler-ScheduleTime）を渡す。
+        同じ内容の9時と13時のジョブは別の実行になり、同じ枠のリトライは同じジョブになる。
+        """
+        idempotency_key = request.idempotency_key
+        if not idempotency_key:
+            payload = request.model_dump(mode="json", exclude={"idempotency_key"})
+            idempotency_key = f"{self._build_slot(schedule_time)}:{json.dumps(payload, sort_keys=True)}"
+        return f"job_{hashlib.sha256(idempotency_key.encode()).hexdigest()[:20]}"
+
+    def build_shard_group_id(
+        self, request: ProposalGenerationRequest, schedule_time: Optional[str] = None
+    ) -> Optional[str]:
+        """同じ実行枠・同一条件のシャードに共通のグループIDを生成（シャード未指定の場合はNone）"""
+        if not request.shard_count:
+            return None
+        payload = request.model_dump(mode="json", exclude={"idempotency_key", "run_id", "shard_index"})
+        group_key = f"{self._build_slot(schedule_time)}:{json.dumps(payload, sort_keys=True)}"
+        return f"shards_{hashlib.sha256(group_key.encode()).hexdigest()[:20]}"
+
+    async def submit(
+        self, request: ProposalGenerationRequest, schedule_time: Optional[str] = None
+    ) -> ProposalJobResponse:
+        """ジョブを投入してすぐに返す（同じジョブが実行中・完了済みの場合はその状態を返す）"""
+        job_id = self.build_job_id(request, schedule_time)
+        now = datetime.now()
+        job_data = {
+            'status': ProposalJobStatus.QUEUED.value,
+            'request': request.model_dump(mode="json"),
+            'progress': {},
+            'result': None,
+            'error_message': None,
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'updated_at': now,
+            'shard_group': self.build_shard_group_id(request, schedule_time),
+            'shard_index': request.shard_index,
+            'shard_count': request.shard_count
+        }
+
+        created = await self.firestore_service.claim_proposal_job(
+            job_id, job_data, self.settings.PROPOSAL_JOB_STALE_SECONDS
+        )
+        if created:
+            print(f"🗂️ Proposal job {job_id} queued")
+            task = asyncio.create_task(self._run(job_id, request))
+            self._running_tasks.add(task)
+            task.add_done_callback(self._running_tasks.discard)
+            return self._to_response(job_id, job_data, created=True)
+
+        print(f"🗂️ Proposal job {job_id} already exists. Returning current state")
+        return await self.get_job(job_id)
+
+    async def get_job(self, job_id: str) -> Optional[ProposalJobResponse]:
+        """ジョブの状態を取得"""
+        job_data = await self.firestore_service.get_proposal_job(job_id)
+        if job_data is None:
+            return None
+        return self._to_response(job_id, job_data)
+
+    async def get_shard_group(self, shard_group: str) -> Optional[ProposalShardGroupResponse]:
+        """シャードグループ全体の完了状況と進捗の合計を取得"""
+        jobs = await self.firestore_service.get_proposal_jobs_by_shard_group(shard_group)
+        if not jobs:
+            return None
+
+        # 同じシャードに複数のジョブがある場合（冪等キーを変えて再投入した場合等）は最新のものを使う
+        latest_by_shard: Dict[int, ProposalJobResponse] = {}
+        for job_id, job_data in jobs.items():
+            job = self._to_response(job_id, job_data)
+            current = latest_by_shard.get(job.shard_index)
+            if current is None or (job.updated_at and (not current.updated_at or job.updated_at > current.updated_at)):
+                latest_by_shard[job.shard_index] = job
+
+        shard_count = max(job.shard_count for job in latest_by_shard.values())
+        shards = [latest_by_shard[index] for index in sorted(latest_by_shard)]
+        completed_shards = [job.shard_index for job in shards if job.status == ProposalJobStatus.COMPLETED]
+        failed_shards = [job.shard_index for job in shards if job.status == ProposalJobStatus.FAILED]
+        running_shards = [
+            job.shard_index for job in shards
+            if job.status in (ProposalJobStatus.QUEUED, ProposalJobStatus.RUNNING)
+        ]
+        totals = {
+            field: sum(job.progress.get(field) or 0 for job in shards)
+            for field in SHARD_TOTAL_FIELDS
+        }
+
+        return ProposalShardGroupResponse(
+            shard_group=shard_group,
+            shard_count=shard_count,
+            completed=len(completed_shards) == shard_count,
+            completed_shards=completed_shards,
+            running_shards=running_shards,
+            failed_shards=failed_shards,
+            missing_shards=[index for index in range(shard_count) if index not in latest_by_shard],
+            totals=totals,
+            shards=shards
+        )
+
+    async def _run(self, job_id: str, request: ProposalGenerationRequest):
+        """バックグラウンドで提案生成を実行し、進捗と結果を記録"""
+        started_at = datetime.now()
+        await self.firestore_service.update_proposal_job(job_id, {
+            'status': ProposalJobStatus.RUNNING.value,
+            'started_at': started_at,
+            'updated_at': started_at
+        })
+
+        last_written = {"time": 0.0, "phase": None}
+
+        async def on_progress(progress: Dict[str, Any]):
+            # フェーズの切り替わり以外は一定間隔ごとに書き込む（更新日時はハートビートも兼ねる）
+            if (progress.get("phase") == last_written["phase"]
+                    and time.time() - last_written["time"] < self.settings.PROPOSAL_JOB_PROGRESS_INTERVAL_SECONDS):
+                return
+            last_written.update({"time": time.time(), "phase": progress.get("phase")})
+            await self.firestore_service.update_proposal_job(job_id, {
+                'progress': progress,
+                'updated_at': datetime.now()
+            })
+
+        # ジョブIDを実行IDとして使い、停止したジョブを引き継いだ場合は処理済みのユーザーから再開する
+        if not request.run_id:
+            request = request.model_copy(update={"run_id": job_id})
+
+        try:
+            response = await get_proposal_generation_service().generate_ai_proposals(
+                request, progress_callback=on_progress
+            )
+        except Exception as e:
+            print(f"❌ Proposal job {job_id} failed: {str(e)}")
+            response = ProposalGenerationResponse(
+                success=False,
+                generated_proposals=[],
+                target_users_count=0,
+                processing_time_ms=int((datetime.now() - started_at).total_seconds() * 1000),
+                error_message=str(e)
+            )
+
+        # 失敗・タイムアウトしたユーザーが残る場合は失敗として記録し、再投入で同じ実行IDの続きから処理できるようにする
+        pending_users = len(response.failed_users) + len(response.timed_out_users)
+        completed = response.success and not pending_users
+        error_message = response.error_message
+        if response.success and pending_users:
+            error_message = f"{pending_users} users were not processed (failed or timed out)"
+
+        finished_at = datetime.now()
+        await self.firestore_service.update_proposal_job(job_id, {
+            'status': (ProposalJobStatus.COMPLETED if completed else ProposalJobStatus.FAILED).value,
+            'progress': {
+                'phase': 'completed' if completed else 'failed',
+                'target_users': response.target_users_count,
+                'users_to_generate': response.regenerated_users_count,
+                'skipped_users': response.skipped_users_count,
+                'resumed_users': response.resumed_users_count,
+                'processed_users': response.regenerated_users_count,
+                'generated_proposals': len(response.generated_proposals),
+                'failed_users': len(response.failed_users),
+                'timed_out_users': len(response.timed_out_users),
+                'elapsed_ms': response.processing_time_ms,
+                'users_per_second': response.users_per_second
+            },
+            'result': response.model_dump(mode="json"),
+            'error_message': error_message,
+            'finished_at': finished_at,
+            'updated_at': finished_at
+        })
+        print(f"🗂️ Proposal job {job_id} finished: success={response.success}, pending users={pending_users}")
+
+    def _to_response(self, job_id: str, job_data: Dict[str, Any], created: bool = False) -> ProposalJobResponse:
+        return ProposalJobResponse(
+            job_id=job_id,
+            status=job_data.get('status', ProposalJobStatus.QUEUED.value),
+            created=created,
+            progress=job_data.get('progress') or {},
+            result=job_data.get('result'),
+            error_message=job_data.get('error_message'),
+            created_at=job_data.get('created_at'),
+            started_at=job_data.get('started_at'),
+            finished_at=job_data.get('finished_at'),
+            updated_at=job_data.get('updated_at'),
+            shard_group=job_data.get('shard_group'),
+            shard_index=job_data.get('shard_index'),
+            shard_count=job_data.get('shard_count')
+        )
+
+
+# シングルトンインスタンス
+_proposal_job_service = None
+
+def get_proposal_job_service() -> ProposalJobService:
+    """AI提案生成ジョブサービスのシングルトンインスタンスを取得"""
+    global _proposal_job_service
+    if _proposal_job_service is None:
+        _proposal_job_service = ProposalJobService()
+    return _proposal_job_service
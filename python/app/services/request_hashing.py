@@ -0,0 +1,63 @@
+"""
+推奨リクエストの正規化とハッシュ化
+同じ地域・条件・時間帯のリクエストが同じキャッシュキーになるように正規化する
+"""
+import json
+import hashlib
+from typing import Any, Optional
+from datetime import datetime
+from pydantic import BaseModel
+
+from app.config import get_settings
+from app.services import geohash
+
+
+def _normalize(value: Any) -> Any:
+    """辞書・リストを再帰的に正規化（スカラーのリストは順序を無視するためソート）"""
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items() if item is not None}
+    if isinstance(value, list):
+        items = [_normalize(item) for item in value]
+        if all(isinstance(item, (str, int, float, bool)) for item in items):
+            return sorted(set(items), key=lambda item: (str(type(item)), item))
+        return items
+    return value
+
+
+def get_geocell(latitude: float, longitude: float, precision: Optional[int] = None) -> str:
+    """位置を設定された精度のジオセル（Geohash）に量子化"""
+    settings = get_settings()
+    return geohash.encode(latitude, longitude, precision or settings.RECOMMENDATION_CACHE_GEOHASH_PRECISION)
+
+
+def get_time_bucket(now: Optional[datetime] = None) -> int:
+    """現在時刻を設定された幅の時間バケットに丸める"""
+    settings = get_settings()
+    now = now or datetime.now()
+    bucket_seconds = max(settings.RECOMMENDATION_CACHE_TIME_BUCKET_MINUTES, 1) * 60
+    return int(now.timestamp() // bucket_seconds)
+
+
+def build_recommendation_request_hash(
+    request: BaseModel,
+    location_field: str = "user_location",
+    now: Optional[datetime] = None
+) -> str:
+    """推奨リクエストから正規化されたキャッシュ用ハッシュを生成
+
+    - 位置はジオセルに量子化
+    - Enumのリストはソートして順序の違いを吸収
+    - 現在時刻は時間バケットに丸める
+    """
+    payload = request.model_dump(mode="json", exclude_none=True)
+
+    location = payload.pop(location_field, None)
+    if location:
+        payload["geocell"] = get_geocell(location["latitude"], location["longitude"])
+
+    canonical = _normalize(payload)
+    canonical["request_type"] = type(request).__name__
+    canonical["time_bucket"] = get_time_bucket(now)
+
+    canonical_str = json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical_str.encode()).hexdigest()[:32]
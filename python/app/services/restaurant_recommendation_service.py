@@ -20,10 +20,13 @@ from app.models import (
     SceneType,
     SpecialRequirement,
     TransportMode,
-    SearchInfo
+    SearchInfo,
+    StationSearchResult
 )
 from app.services.gemini_research import GeminiResearchAgent, GeminiAPIError
 from app.services.google_places import GooglePlacesService, GooglePlacesAPIError
+from app.services.cache import cache_service
+from app.services.request_hashing import get_geocell
 from app.config import get_settings
 
 
@@ -656,108 +659,32 @@ class RestaurantRecommendationService:
             logger.info(f"   Max price: ¥{max_price_per_person}/person")
             logger.info(f"   Prefer chains: {prefer_chain_stores}")
 
-            # 1. 近くの駅を検索（範囲を狭める）
-            logger.info("🚉 Searching nearby stations...")
-            nearby_stations = self.places_service.search_nearby_spots(
+            # 1-2. 近くの駅と駅周辺のカジュアル店舗を検索
+            nearby_stations, all_restaurants = await self.search_casual_candidates(
                 user_location=user_location,
-                radius_m=int(kwargs.get('station_search_radius_km', 3.0) * 1000),
-                included_types=["train_station"],
-                max_results=kwargs.get('max_stations', 3)  # 3駅に削減
+                activity_type=activity_type,
+                time_of_day=time_of_day,
+                scene_type=scene_type,
+                casual_level=casual_level,
+                max_price_per_person=max_price_per_person,
+                prefer_chain_stores=prefer_chain_stores,
+                exclude_high_end=exclude_high_end,
+                **kwargs
             )
 
-            if not nearby_stations:
-                logger.warning("No nearby stations found")
-                return RestaurantRecommendationResponse(
-                    success=False,
-                    recommendations=[],
-                    search_info=SearchInfo(
-                        search_radius_km=3.0,
-                        stations_searched=0,
-                        total_restaurants_found=0,
-                        processing_time_ms=int((time.time() - start_time) * 1000)
-                    ),
-                    error_message="近くに駅が見つかりませんでした"
-                )
-
-            logger.info(f"Found {len(nearby_stations)} nearby stations")
-
-            # 2. カジュアル向け駅周辺店舗検索
-            all_restaurants = []
-            total_restaurants_found = 0
-
-            for station in nearby_stations[:3]:  # 最大3駅
-                logger.info(f"🔍 Searching around {station.station_name}...")
-                
-                # カジュアル志向の新しい検索メソッドを使用
-                station_restaurants = self.places_service.search_casual_restaurants_near_location(
-                    location=LocationData(
-                        latitude=station.latitude,
-                        longitude=station.longitude
-                    ),
-                    radius_m=int(kwargs.get('restaurant_search_radius_km', 0.8) * 1000),
-                    max_results=kwargs.get('max_restaurants_per_station', 6),  # 6件に削減
-                    activity_types=[a.value for a in activity_type],
-                    time_of_day=time_of_day.value if time_of_day else None,
-                    scene_type=scene_type.value if scene_type else "friends",
-                    casual_level=casual_level,
-                    max_price_per_person=max_price_per_person,
-                    prefer_chain_stores=prefer_chain_stores,
-                    exclude_high_end=exclude_high_end,
-                    min_rating=kwargs.get('min_rating', 3.5)
-                )
-
-                # 駅情報を各レストランに追加
-                for restaurant in station_restaurants:
-                    restaurant.station_info = station
-
-                all_restaurants.extend(station_restaurants)
-                total_restaurants_found += len(station_restaurants)
-                
-                logger.info(f"Found {len(station_restaurants)} casual restaurants near {station.station_name}")
-
-            if not all_restaurants:
-                logger.warning("No restaurants found around any station")
-                return RestaurantRecommendationResponse(
-                    success=False,
-                    recommendations=[],
-                    search_info=SearchInfo(
-                        search_radius_km=3.0,
-                        stations_searched=len(nearby_stations),
-                        total_restaurants_found=0,
-                        processing_time_ms=int((time.time() - start_time) * 1000)
-                    ),
-                    error_message="条件に合う店舗が見つかりませんでした"
-                )
-
-            # 3. カジュアル向けAI選定（2店舗に削減）
-            logger.info(f"🤖 AI selecting best 2 casual restaurants from {len(all_restaurants)} candidates...")
-            
-            selected_restaurants = await self._select_casual_restaurants_with_ai(
-                restaurants=all_restaurants,
-                activity_types=[a.value for a in activity_type],
-                moods=[m.value for m in mood],
+            return await self.recommend_from_candidates(
+                nearby_stations=nearby_stations,
+                all_restaurants=all_restaurants,
+                activity_type=activity_type,
+                mood=mood,
                 group_size=group_size,
-                time_of_day=time_of_day.value if time_of_day else None,
-                scene_type=scene_type.value if scene_type else "friends",
+                time_of_day=time_of_day,
+                scene_type=scene_type,
                 casual_level=casual_level,
                 max_price_per_person=max_price_per_person,
-                prefer_chain_stores=prefer_chain_stores
-            )
-
-            processing_time = int((time.time() - start_time) * 1000)
-            logger.info(f"✅ Casual recommendation completed in {processing_time}ms")
-            logger.info(f"   Selected {len(selected_restaurants)} casual restaurants")
-
-            return RestaurantRecommendationResponse(
-                success=True,
-                recommendations=selected_restaurants,
-                search_info=SearchInfo(
-                    search_radius_km=kwargs.get('station_search_radius_km', 3.0),
-                    stations_searched=len(nearby_stations),
-                    total_restaurants_found=total_restaurants_found,
-                    processing_time_ms=processing_time
-                ),
-                error_message=None
+                prefer_chain_stores=prefer_chain_stores,
+                start_time=start_time,
+                **kwargs
             )
 
         except Exception as e:
@@ -775,6 +702,289 @@ class RestaurantRecommendationService:
                 error_message=f"推奨処理中にエラーが発生しました: {str(e)}"
             )
 
+    async def recommend_from_candidates(
+        self,
+        nearby_stations: List[StationSearchResult],
+        all_restaurants: List[RestaurantInfo],
+        activity_type: List[ActivityType],
+        mood: List[MoodType],
+        group_size: int = 2,
+        time_of_day: Optional[TimeOfDay] = None,
+        scene_type: Optional[SceneType] = None,
+        casual_level: Optional[str] = "casual",
+        max_price_per_person: Optional[int] = 3000,
+        prefer_chain_stores: bool = True,
+        start_time: Optional[float] = None,
+        **kwargs
+    ) -> RestaurantRecommendationResponse:
+        """
+        検索済みの候補（search_casual_candidatesの結果）からAI選定して推奨レスポンスを構築
+        提案生成では近くのユーザー同士で候補を共有し、選定のみユーザーごとに行う
+        """
+        start_time = start_time or time.time()
+        total_restaurants_found = len(all_restaurants)
+
+        if not nearby_stations:
+            logger.warning("No nearby stations found")
+            return RestaurantRecommendationResponse(
+                success=False,
+                recommendations=[],
+                search_info=SearchInfo(
+                    search_radius_km=3.0,
+                    stations_searched=0,
+                    total_restaurants_found=0,
+                    processing_time_ms=int((time.time() - start_time) * 1000)
+                ),
+                error_message="近くに駅が見つかりませんでした"
+            )
+
+        if not all_restaurants:
+            logger.warning("No restaurants found around any station")
+            return RestaurantRecommendationResponse(
+                success=False,
+                recommendations=[],
+                search_info=SearchInfo(
+                    search_radius_km=3.0,
+                    stations_searched=len(nearby_stations),
+                    total_restaurants_found=0,
+                    processing_time_ms=int((time.time() - start_time) * 1000)
+                ),
+                error_message="条件に合う店舗が見つかりませんでした"
+            )
+
+        # 3. カジュアル向けAI選定（2店舗に削減）
+        logger.info(f"🤖 AI selecting best 2 casual restaurants from {len(all_restaurants)} candidates...")
+        
+        selected_restaurants = await self._select_casual_restaurants_with_ai(
+            restaurants=all_restaurants,
+            activity_types=[a.value for a in activity_type],
+            moods=[m.value for m in mood],
+            group_size=group_size,
+            time_of_day=time_of_day.value if time_of_day else None,
+            scene_type=scene_type.value if scene_type else "friends",
+            casual_level=casual_level,
+            max_price_per_person=max_price_per_person,
+            prefer_chain_stores=prefer_chain_stores
+        )
+
+        processing_time = int((time.time() - start_time) * 1000)
+        logger.info(f"✅ Casual recommendation completed in {processing_time}ms")
+        logger.info(f"   Selected {len(selected_restaurants)} casual restaurants")
+
+        return RestaurantRecommendationResponse(
+            success=True,
+            recommendations=selected_restaurants,
+            search_info=SearchInfo(
+                search_radius_km=kwargs.get('station_search_radius_km', 3.0),
+                stations_searched=len(nearby_stations),
+                total_restaurants_found=total_restaurants_found,
+                processing_time_ms=processing_time
+            ),
+            error_message=None
+        )
+
+    async def search_casual_candidates(
+        self,
+        user_location: LocationData,
+        activity_type: List[ActivityType],
+        time_of_day: Optional[TimeOfDay] = None,
+        scene_type: Optional[SceneType] = None,
+        casual_level: Optional[str] = "casual",
+        max_price_per_person: Optional[int] = 3000,
+        prefer_chain_stores: bool = True,
+        exclude_high_end: bool = True,
+        **kwargs
+    ) -> Tuple[List[StationSearchResult], List[RestaurantInfo]]:
+        """
+        カジュアル推奨の検索ステージ（駅検索＋駅周辺店舗検索）のみを実行
+        AI選定を含まないため、キャッシュのウォームアップや候補の共有に使用できる
+        """
+        # 1. 近くの駅を検索（範囲を狭める）
+        logger.info("🚉 Searching nearby stations...")
+        nearby_stations = await self._search_stations_cached(
+            user_location=user_location,
+            radius_m=int(kwargs.get('station_search_radius_km', 3.0) * 1000),
+            max_results=kwargs.get('max_stations', 3)  # 3駅に削減
+        )
+
+        if not nearby_stations:
+            return [], []
+
+        logger.info(f"Found {len(nearby_stations)} nearby stations")
+
+        # 2. カジュアル向け駅周辺店舗検索（駅ごとのキャッシュは1往復で一括取得）
+        all_restaurants = []
+
+        station_results = await self._search_casual_restaurants_for_stations(
+            stations=nearby_stations[:3],  # 最大3駅
+            search_params={
+                "radius_m": int(kwargs.get('restaurant_search_radius_km', 0.8) * 1000),
+                "max_results": kwargs.get('max_restaurants_per_station', 6),  # 6件に削減
+                "activity_types": [a.value for a in activity_type],
+                "time_of_day": time_of_day.value if time_of_day else None,
+                "scene_type": scene_type.value if scene_type else "friends",
+                "casual_level": casual_level,
+                "max_price_per_person": max_price_per_person,
+                "prefer_chain_stores": prefer_chain_stores,
+                "exclude_high_end": exclude_high_end,
+                "min_rating": kwargs.get('min_rating', 3.5)
+            }
+        )
+
+        for station, station_restaurants in station_results:
+            # 駅情報を各レストランに追加
+            for restaurant in station_restaurants:
+                restaurant.station_info = station
+
+            all_restaurants.extend(station_restaurants)
+            
+            logger.info(f"Found {len(station_restaurants)} casual restaurants near {station.station_name}")
+
+        return nearby_stations, all_restaurants
+
+    async def _search_stations_cached(
+        self,
+        user_location: LocationData,
+        radius_m: int,
+        max_results: int
+    ) -> List[StationSearchResult]:
+        """近くの駅を検索（キャッシュ経由、空の結果は同じキー単位で短時間ネガティブキャッシュ）"""
+        # 近隣ユーザーやウォームアップと共有できるようジオセル単位でキー化
+        # ネガティブキャッシュも同じ条件でキー化し、より広い範囲の検索を抑止しないようにする
+        key_params = {
+            "geocell": get_geocell(user_location.latitude, user_location.longitude),
+            "radius_m": radius_m,
+            "max_results": max_results
+        }
+        cache_key = cache_service.build_key("stations", key_params)
+        negative_key = cache_service.build_negative_key("stations", key_params)
+
+        cached = await cache_service.get_many([cache_key, negative_key])
+        if cache_key in cached:
+            return [StationSearchResult.model_validate(station) for station in cached[cache_key]]
+        if negative_key in cached:
+            logger.info("⚡ Negative cache hit: no stations around this geocell")
+            return []
+
+        async def _fetch_stations():
+            stations = self.places_service.search_nearby_spots(
+                user_location=user_location,
+                radius_m=radius_m,
+                included_types=["train_station"],
+                max_results=max_results,
+                raise_on_error=True
+            )
+            return [station.model_dump(mode="json") for station in stations]
+
+        try:
+            stations_data = await cache_service.get_or_compute(
+                cache_key,
+                _fetch_stations,
+                ttl_seconds=self.settings.STATION_CACHE_TTL_SECONDS,
+                should_cache=lambda stations: bool(stations)
+            )
+        except GooglePlacesAPIError as e:
+            # API障害による空の結果はネガティブキャッシュしない
+            logger.error(f"Station search failed: {str(e)}")
+            return []
+
+        if not stations_data:
+            await cache_service.set_negative_results([negative_key])
+
+        return [StationSearchResult.model_validate(station) for station in stations_data]
+
+    async def _search_casual_restaurants_for_stations(
+        self,
+        stations: List[StationSearchResult],
+        search_params: Dict[str, Any]
+    ) -> List[Tuple[StationSearchResult, List[RestaurantInfo]]]:
+        """各駅周辺のカジュアル店舗を検索（駅ごとのキャッシュとネガティブキャッシュをMGETで一括取得）"""
+        normalized_params = {
+            **search_params,
+            "activity_types": sorted(search_params.get("activity_types") or [])
+        }
+        # ネガティブキャッシュは通常のキャッシュと同じく駅単位（1駅の空の結果で他の駅の検索を抑止しない）
+        key_params = [
+            {
+                "station": station.place_id or f"{station.latitude},{station.longitude}",
+                **normalized_params
+            }
+            for station in stations
+        ]
+        cache_keys = [cache_service.build_key("restaurants", params) for params in key_params]
+        negative_keys = [cache_service.build_negative_key("restaurants", params) for params in key_params]
+        def _make_refresher(station: StationSearchResult):
+            async def _fetch_restaurants():
+                restaurants = self.places_service.search_casual_restaurants_near_location(
+                    location=LocationData(latitude=station.latitude, longitude=station.longitude),
+                    raise_on_error=True,
+                    **search_params
+                )
+                return [r.model_dump(mode="json", exclude={"station_info"}) for r in restaurants]
+            return _fetch_restaurants
+
+        # staleになった駅の店舗候補はキャッシュ値を返しつつバックグラウンドで再検索する
+        cached_results = await cache_service.get_many(
+            cache_keys + negative_keys,
+            refreshers={cache_key: _make_refresher(station) for station, cache_key in zip(stations, cache_keys)},
+            ttl_seconds=self.settings.RESTAURANT_CACHE_TTL_SECONDS,
+            stale_ttl_seconds=self.settings.CACHE_STALE_TTL_SECONDS,
+            should_cache=lambda restaurants: bool(restaurants)
+        )
+
+        results = []
+        to_store = {}
+        empty_keys = []
+        # 保存する値の計算時間（駅ごとの検索時間の最大値）を確率的早期再計算の重みとして記録する
+        max_search_seconds = 0.0
+        for station, cache_key, negative_key in zip(stations, cache_keys, negative_keys):
+            if cache_key in cached_results:
+                logger.info(f"⚡ Cache hit for restaurants around {station.station_name}")
+                restaurants = [RestaurantInfo.model_validate(r) for r in cached_results[cache_key]]
+            elif negative_key in cached_results:
+                logger.info(f"⚡ Negative cache hit: no restaurants around {station.station_name}")
+                restaurants = []
+            else:
+                logger.info(f"🔍 Searching around {station.station_name}...")
+                
+                search_started = time.monotonic()
+                try:
+                    # カジュアル志向の新しい検索メソッドを使用
+                    restaurants = self.places_service.search_casual_restaurants_near_location(
+                        location=LocationData(
+                            latitude=station.latitude,
+                            longitude=station.longitude
+                        ),
+                        raise_on_error=True,
+                        **search_params
+                    )
+                except GooglePlacesAPIError as e:
+                    # API障害による空の結果はキャッシュしない
+                    logger.error(f"Restaurant search failed around {station.station_name}: {str(e)}")
+                    restaurants = []
+                else:
+                    if restaurants:
+                        to_store[cache_key] = [
+                            r.model_dump(mode="json", exclude={"station_info"}) for r in restaurants
+                        ]
+                        max_search_seconds = max(max_search_seconds, time.monotonic() - search_started)
+                    else:
+                        empty_keys.append(negative_key)
+
+            results.append((station, restaurants))
+
+        if to_store:
+            await cache_service.set_many(
+                to_store,
+                ttl_seconds=self.settings.RESTAURANT_CACHE_TTL_SECONDS,
+                stale_ttl_seconds=self.settings.CACHE_STALE_TTL_SECONDS,
+                compute_seconds=max_search_seconds
+            )
+        if empty_keys:
+            await cache_service.set_negative_results(empty_keys)
+
+        return results
+
     async def _select_casual_restaurants_with_ai(
         self,
         restaurants: List[RestaurantInfo],
@@ -5,6 +5,8 @@ PROJECT_ID="collect-friends-app-463813"
 REGION="asia-northeast1"
 SERVICE_NAME="activity-recommendation-api"
 SERVICE_ACCOUNT_EMAIL="activity-api-sa@$PROJECT_ID.iam.gserviceaccount.com"
+# 17時のAI提案生成を分担するシャード数（1の場合は1ジョブで全ユーザーを処理）
+PROPOSAL_SHARD_COUNT=${PROPOSAL_SHARD_COUNT:-1}
 
 # 色付きの出力
 RED='\033[0;31m'
@@ -53,26 +55,61 @@ gcloud app describe --project=$PROJECT_ID > /dev/null 2>&1 || {
 
 # 6. 既存のジョブを削除（再作成のため）
 echo -e "${YELLOW}🗑️ 既存のスケジューラージョブを削除中...${NC}"
+gcloud scheduler jobs delete cache-warmup-evening --location=$REGION --quiet || true
 gcloud scheduler jobs delete ai-proposal-generation-evening --location=$REGION --quiet || true
+for job in $(gcloud scheduler jobs list --location=$REGION --format='value(name.basename())' --filter='name~ai-proposal-generation-evening-shard-'); do
+    gcloud scheduler jobs delete $job --location=$REGION --quiet || true
+done
 gcloud scheduler jobs delete cache-cleanup-daily --location=$REGION --quiet || true
 
 # 7. Cloud Scheduler ジョブの作成
 echo -e "${YELLOW}⏰ スケジューラージョブを作成中...${NC}"
 
-# AI提案生成ジョブ（夕方17時）
-gcloud scheduler jobs create http ai-proposal-generation-evening \
+# キャッシュウォームアップジョブ（17時の提案生成の前に実行）
+gcloud scheduler jobs create http cache-warmup-evening \
     --location=$REGION \
-    --schedule="0 17 * * *" \
+    --schedule="30 16 * * *" \
     --time-zone="Asia/Tokyo" \
-    --uri="$CLOUD_RUN_URL/api/v1/generate-ai-proposals" \
+    --uri="$CLOUD_RUN_URL/admin/cache/warm" \
     --http-method=POST \
-    --headers="Content-Type=application/json" \
-    --message-body='{"max_proposals_per_user": 3, "force_generation": false}' \
     --oidc-service-account-email=$SERVICE_ACCOUNT_EMAIL \
     --oidc-token-audience=$CLOUD_RUN_URL \
-    --max-retry-attempts=2 \
-    --max-retry-duration=1200s \
-    --description="夕方のAI提案生成ジョブ（17時）"
+    --max-retry-attempts=1 \
+    --description="人気エリアのキャッシュウォームアップ（16時30分）"
+
+# AI提案生成ジョブ（夕方17時）
+if [ "$PROPOSAL_SHARD_COUNT" -le 1 ]; then
+    gcloud scheduler jobs create http ai-proposal-generation-evening \
+        --location=$REGION \
+        --schedule="0 17 * * *" \
+        --time-zone="Asia/Tokyo" \
+        --uri="$CLOUD_RUN_URL/api/v1/generate-ai-proposals/jobs" \
+        --http-method=POST \
+        --headers="Content-Type=application/json" \
+        --message-body='{"max_proposals_per_user": 3, "force_generation": false}' \
+        --oidc-service-account-email=$SERVICE_ACCOUNT_EMAIL \
+        --oidc-token-audience=$CLOUD_RUN_URL \
+        --max-retry-attempts=2 \
+        --max-retry-duration=1200s \
+        --description="夕方のAI提案生成ジョブ（17時）"
+else
+    # シャードごとに同時刻のジョブを作成し、複数インスタンスでユーザーを分担する
+    for ((shard = 0; shard < PROPOSAL_SHARD_COUNT; shard++)); do
+        gcloud scheduler jobs create http ai-proposal-generation-evening-shard-$shard \
+            --location=$REGION \
+            --schedule="0 17 * * *" \
+            --time-zone="Asia/Tokyo" \
+            --uri="$CLOUD_RUN_URL/api/v1/generate-ai-proposals/jobs" \
+            --http-method=POST \
+            --headers="Content-Type=application/json" \
+            --message-body="{\"max_proposals_per_user\": 3, \"force_generation\": false, \"shard_index\": $shard, \"shard_count\": $PROPOSAL_SHARD_COUNT}" \
+            --oidc-service-account-email=$SERVICE_ACCOUNT_EMAIL \
+            --oidc-token-audience=$CLOUD_RUN_URL \
+            --max-retry-attempts=2 \
+            --max-retry-duration=1200s \
+            --description="夕方のAI提案生成ジョブ（17時、シャード $shard/$PROPOSAL_SHARD_COUNT）"
+    done
+fi
 
 # 毎日のキャッシュクリアジョブ（深夜2時）
 gcloud scheduler jobs create http cache-cleanup-daily \
@@ -108,6 +145,6 @@ echo -e "${GREEN}🎯 スケジューラーの設定が完了しました！${NC
 echo -e "${YELLOW}⚠️  重要な確認事項:${NC}"
 echo -e "  • サービスアカウント: $SERVICE_ACCOUNT_EMAIL"
 echo -e "  • Cloud Run URL: $CLOUD_RUN_URL"
-echo -e "  • 作成されたジョブ数: 2個"
+echo -e "  • 作成されたジョブ数: $((2 + (PROPOSAL_SHARD_COUNT > 1 ? PROPOSAL_SHARD_COUNT : 1)))個"
 echo -e "  • 次回実行時間: 今日 17:00 PM (JST) または明日 2:00 AM (JST)"
 echo -e "${GREEN}📊 ジョブの監視: https://console.cloud.google.com/cloudscheduler?project=$PROJECT_ID${NC}" 
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""
+FirestoreService.update_proposal_response のテスト
+トランザクション内の読み書きを記録する簡易Firestoreクライアントで、応答の反映と集計を確認する
+"""
+import pytest
+from google.cloud.firestore_v1 import Increment
+
+from app.models import UserResponseStatus
+from app.services import firestore_service
+from app.services.firestore_service import FirestoreService
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self.db, f"{self.path}/{name}")
+
+    async def get(self, field_paths=None, transaction=None):
+        assert transaction is not None
+        return FakeSnapshot(self, self.db.documents.get(self.path))
+
+
+class FakeCollection:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def document(self, document_id):
+        return FakeDocument(self.db, f"{self.path}/{document_id}")
+
+
+class FakeTransaction:
+    """AsyncTransactionと同じく get_all は参照のみを受け取るコルーチン"""
+
+    def __init__(self):
+        self.updates = []
+
+    async def get_all(self, references, retry=None, timeout=None):
+        raise AssertionError("reads inside the transaction must go through client.get_all")
+
+    def update(self, reference, data):
+        self.updates.append((reference.path, data))
+
+
+class FakeClient:
+    def __init__(self, documents):
+        self.documents = documents
+        self.transactions = []
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def transaction(self):
+        transaction = FakeTransaction()
+        self.transactions.append(transaction)
+        return transaction
+
+    @staticmethod
+    def field_path(*parts):
+        return '.'.join(parts)
+
+    async def get_all(self, references, field_paths=None, transaction=None):
+        assert transaction is not None
+        for reference in references:
+            yield FakeSnapshot(reference, self.documents.get(reference.path))
+
+
+@pytest.fixture
+def service(monkeypatch):
+    # async_transactionalのリトライ処理（RPC）を除いた本体だけをFakeTransactionで実行する
+    monkeypatch.setattr(
+        firestore_service, '_apply_proposal_response', firestore_service._apply_proposal_response.to_wrap
+    )
+    service = FirestoreService.__new__(FirestoreService)
+    service.db = FakeClient({
+        'proposals/p1': {
+            'target_users': ['alice', 'bob'],
+            'responses': {'bob': {'status': 'pending'}},
+            'response_count': {'accepted': 0, 'declined': 0, 'pending': 2, 'maybe': 0}
+        },
+        'users/alice/userProposal/p1': {'proposal_id': 'p1'},
+        'users/bob/userProposal/p1': {'proposal_id': 'p1'}
+    })
+    return service
+
+
+def _updates_by_path(service):
+    (transaction,) = service.db.transactions
+    return dict(transaction.updates)
+
+
+@pytest.mark.asyncio
+async def test_update_proposal_response_moves_count_between_statuses(service):
+    result = await service.update_proposal_response('bob', 'p1', UserResponseStatus.ACCEPTED)
+
+    assert result is True
+    updates = _updates_by_path(service)
+    proposal_update = updates['proposals/p1']
+    assert proposal_update['responses.bob']['status'] == 'accepted'
+    assert proposal_update['response_count.accepted'] == Increment(1)
+    assert proposal_update['response_count.pending'] == Increment(-1)
+
+    expected_count = {'accepted': 1, 'declined': 0, 'pending': 1, 'maybe': 0}
+    assert updates['users/alice/userProposal/p1']['response_count'] == expected_count
+    assert 'status' not in updates['users/alice/userProposal/p1']
+    assert updates['users/bob/userProposal/p1']['response_count'] == expected_count
+    assert updates['users/bob/userProposal/p1']['status'] == 'accepted'
+    assert updates['users/bob/userProposal/p1']['is_read'] is True
+
+
+@pytest.mark.asyncio
+async def test_update_proposal_response_same_status_does_not_increment(service):
+    result = await service.update_proposal_response('bob', 'p1', UserResponseStatus.PENDING)
+
+    assert result is True
+    proposal_update = _updates_by_path(service)['proposals/p1']
+    assert not any(key.startswith('response_count.') for key in proposal_update)
+
+
+@pytest.mark.asyncio
+async def test_update_proposal_response_skips_missing_user_proposals(service):
+    del service.db.documents['users/alice/userProposal/p1']
+
+    assert await service.update_proposal_response('bob', 'p1', UserResponseStatus.DECLINED) is True
+    assert set(_updates_by_path(service)) == {'proposals/p1', 'users/bob/userProposal/p1'}
+
+
+@pytest.mark.asyncio
+async def test_update_proposal_response_returns_false_for_missing_proposal(service):
+    assert await service.update_proposal_response('bob', 'missing', UserResponseStatus.ACCEPTED) is False
+    assert _updates_by_path(service) == {}